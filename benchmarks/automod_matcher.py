@@ -0,0 +1,45 @@
+"""
+Licensed under the Open Software License version 3.0
+"""
+import pathlib
+import random
+import re
+import string
+import sys
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1] / "src" / "main" / "python"))
+
+from utils import automod
+
+WORDS = 10000
+MESSAGES = 2000
+random.seed(0)
+
+
+def word():
+    return "".join(random.choices(string.ascii_lowercase, k=random.randint(4, 10)))
+
+
+def timed(name, func, *args):
+    start = time.perf_counter()
+    ret = func(*args)
+    print(f"{name:<28}{(time.perf_counter() - start) * 1000:>10.2f}ms")
+    return ret
+
+
+words = list({word() for _ in range(WORDS)})
+messages = [" ".join(word() for _ in range(random.randint(3, 40))) for _ in range(MESSAGES)]
+for i in range(0, MESSAGES, 10):
+    messages[i] += " " + random.choice(words) # make sure some messages actually get caught
+
+print(f"{len(words)} banned words, {MESSAGES} messages")
+
+regex = timed("compile regex", re.compile, r"(?i)\b(?:{})\b".format("|".join(map(re.escape, words))))
+matcher = timed("build matcher", automod.Matcher, [automod.Term(w) for w in words])
+
+regex_hits = timed("regex search", lambda: [bool(regex.search(m)) for m in messages])
+matcher_hits = timed("matcher search", lambda: [matcher.search(m) is not None for m in messages])
+
+assert regex_hits == matcher_hits, "the matcher and the regex disagree"
+print(f"{sum(matcher_hits)} messages flagged")
@@ -1,7 +1,8 @@
 """
 Licensed under the Open Software License version 3.0
 """
-import re
+import asyncio
+import itertools
 from typing import Optional
 
 import discord
@@ -9,10 +10,10 @@ import yarl
 from discord.ext import commands
 from utils.commands import command, group
 
-from addons.common import copypasta
+from utils import automod
+from utils.cache import LRUCache
 from utils.checks import dpy_check_editor
-
-regex = re.compile("(?:https?://)?discord(?:(?:app)?\.com/invite|\.gg)/?[a-zA-Z0-9]+/?")
+from utils.converters import NoDiscordChecker, NoTwitchChecker
 
 def setup(bot):
     bot.add_cog(AutoModeration(bot))
@@ -25,6 +26,64 @@ class URLConverter(commands.Converter):
 
         return resp
 
+class DeletionQueue:
+    """
+    Collects flagged messages per channel, and deletes them in bulk.
+    Messages are gathered for ``delay`` seconds before the first delete,
+    then removed in batches of up to 100, at most one batch per ``interval`` seconds per channel.
+    A message is only deleted once, no matter how many times it gets flagged.
+    """
+    BATCH_SIZE = 100
+
+    def __init__(self, loop, delay: float = 1, interval: float = 1):
+        self.loop = loop
+        self.delay = delay
+        self.interval = interval
+        self._pending = {} # channel id -> {message id: None}, kept in the order they were flagged
+        self._channels = {}
+        self._tasks = {}
+        self._deleted = LRUCache(capacity=5000, ttl=600) # only needed until any flags still in flight have come in
+        self.calls = 0
+
+    def add(self, channel: discord.TextChannel, *message_ids: int) -> None:
+        message_ids = [message_id for message_id in message_ids if message_id is not None and message_id not in self._deleted]
+        if not message_ids:
+            return
+
+        pending = self._pending.setdefault(channel.id, {})
+        for message_id in message_ids:
+            pending[message_id] = None
+
+        self._channels[channel.id] = channel
+        task = self._tasks.get(channel.id)
+        if task is None or task.done():
+            self._tasks[channel.id] = self.loop.create_task(self._drain(channel.id))
+
+    def stop(self) -> None:
+        for task in self._tasks.values():
+            task.cancel()
+
+    async def _drain(self, channel_id: int) -> None:
+        await asyncio.sleep(self.delay)
+        pending = self._pending[channel_id]
+        while pending:
+            batch = list(itertools.islice(pending, self.BATCH_SIZE))
+            for message_id in batch:
+                del pending[message_id]
+                self._deleted[message_id] = True
+
+            self.calls += 1
+            try:
+                await self._channels[channel_id].delete_messages([discord.Object(id=message_id) for message_id in batch])
+            except discord.HTTPException:
+                pass
+
+            await asyncio.sleep(self.interval)
+
+        del self._pending[channel_id]
+        del self._channels[channel_id]
+
+
 class AutoModeration(commands.Cog):
     HELP_REQUIRES = ["editor"]
 
@@ -32,8 +91,47 @@ class AutoModeration(commands.Cog):
         self.bot = bot
         self.system = bot.system
         self.locale_name = bot.system.locale("AutoModeration")
-        self.short_map = commands.CooldownMapping.from_cooldown(7, 3, commands.BucketType.channel)
-        self.long_map = commands.CooldownMapping.from_cooldown(27, 20, commands.BucketType.channel)
+        self.spam_tracker = automod.SpamTracker([(7, 3), (27, 20)])
+        self.deletions = DeletionQueue(bot.loop)
+        self.mention_cap = 5
+        self.pasta_threshold = 0.6
+        self.flood_detector = None
+        self.check_stats = {}
+        self.pipeline = None
+        self.compile()
+
+    def cog_unload(self):
+        self.deletions.stop()
+
+    def compile(self):
+        """
+        Rebuilds the check pipeline from the current settings.
+        Must be called whenever an automod setting changes.
+        """
+        config = self.system.config
+        self.mention_cap = config.getint("moderation", "automod_mention_cap", fallback=5)
+        self.pasta_threshold = config.getfloat("moderation", "automod_copypasta_similarity", fallback=0.6)
+
+        count = config.getint("moderation", "automod_flood_count", fallback=5)
+        seconds = config.getfloat("moderation", "automod_flood_seconds", fallback=10)
+        if self.flood_detector is None or (self.flood_detector.count, self.flood_detector.seconds) != (count, seconds):
+            self.flood_detector = automod.FloodDetector(count, seconds)
+
+        # cheapest first, so expensive checks only run on messages that got past everything else
+        checks = [
+            ("mentions", "automod_enable_mentions", self.check_mentions, None),
+            ("spam", "automod_enable_spam", self.check_spam, self.record_spam),
+            ("flood", "automod_enable_flood", self.check_flood, self.record_flood),
+            ("ads", "automod_enable_ads", self.check_ads, None),
+            ("words", "automod_enable_words", self.check_words, None),
+            ("copypasta", "automod_enable_copypasta", self.check_copypasta, None),
+        ]
+        self.pipeline = automod.Pipeline([(name, check, record) for name, key, check, record in checks
+                                          if config.getboolean("moderation", key, fallback=False)], self.check_stats)
+
+        twitch = self.system.twitch_bot.get_cog("Automod")
+        if twitch is not None:
+            twitch.compile() # twitch shares these settings
 
     @group()
     @dpy_check_editor()
@@ -56,6 +154,7 @@ class AutoModeration(commands.Cog):
         """
         if state is not None:
             self.system.config.set("moderation", "automod_enable_ads", str(state))
+            self.compile()
             await ctx.send(self.system.locale("Ad protection is now {0}").format(self.system.locale("on") if state else self.system.locale("off")))
 
         else:
@@ -80,7 +179,7 @@ class AutoModeration(commands.Cog):
         except:
             return await ctx.send(self.system.locale("This domain has already been blacklisted"))
 
-        await self.system.build_automod_regex()
+        self.system.automod_domains.add(url.host)
         await ctx.send(self.system.locale("Added {0} to the domain blacklist").format(url.host))
 
     @ads.command()
@@ -95,7 +194,7 @@ class AutoModeration(commands.Cog):
             return await ctx.send(self.system.locale("This domain is not blacklisted"))
 
         await self.system.db.execute("DELETE FROM automod_domains WHERE domain = ?", url.host)
-        await self.system.build_automod_regex()
+        self.system.automod_domains.remove(url.host)
         await ctx.send(self.system.locale("{0} is no longer blacklisted").format(url.host))
 
     @automod.command()
@@ -108,6 +207,7 @@ class AutoModeration(commands.Cog):
         """
         if state is not None:
             self.system.config.set("moderation", "automod_enable_spam", str(state))
+            self.compile()
             await ctx.send(self.system.locale("Spam protection is now {0}").format(self.system.locale("on") if state else self.system.locale("off")))
 
         else:
@@ -119,7 +219,7 @@ class AutoModeration(commands.Cog):
 
             await ctx.send(fmt)
 
-    @automod.command()
+    @automod.group(invoke_without_command=True)
     @dpy_check_editor()
     @commands.bot_has_guild_permissions(manage_messages=True)
     async def copypasta(self, ctx, state: bool = None):
@@ -130,6 +230,7 @@ class AutoModeration(commands.Cog):
         """
         if state is not None:
             self.system.config.set("moderation", "automod_enable_copypasta", str(state))
+            self.compile()
             await ctx.send(self.system.locale("Copypasta protection is now {0}").format(self.system.locale("on") if state else self.system.locale("off")))
 
         else:
@@ -141,6 +242,134 @@ class AutoModeration(commands.Cog):
 
             await ctx.send(fmt)
 
+    @copypasta.command("add")
+    @dpy_check_editor()
+    @commands.bot_has_guild_permissions(manage_messages=True)
+    async def copypasta_add(self, ctx, *, pasta: str):
+        """
+        Adds a copypasta to automod.
+        Messages containing the copypasta, or something close to it, will be caught.
+        """
+        pasta = self.system.automod_pastas.normalize(pasta)
+        if len(pasta) < self.system.automod_pastas.MIN_LENGTH:
+            return await ctx.send(self.system.locale("This copypasta is too short, it must be at least {0} characters long").format(
+                self.system.automod_pastas.MIN_LENGTH))
+
+        try:
+            await self.system.db.execute("INSERT INTO automod_pastas VALUES (?);", pasta)
+        except:
+            return await ctx.send(self.system.locale("This copypasta has already been added"))
+
+        self.system.automod_pastas.add(pasta)
+        self.system.automod_matcher.add(automod.Term(pasta, automod.PASTA))
+        await ctx.send(self.system.locale("Added the copypasta to automod"))
+
+    @copypasta.command("remove")
+    @dpy_check_editor()
+    @commands.bot_has_guild_permissions(manage_messages=True)
+    async def copypasta_remove(self, ctx, *, pasta: str):
+        """
+        Removes a copypasta that was added with the add command.
+        """
+        pasta = self.system.automod_pastas.normalize(pasta)
+        if not await self.system.db.fetchval("SELECT content FROM automod_pastas WHERE content = ?", pasta):
+            return await ctx.send(self.system.locale("This copypasta has not been added"))
+
+        await self.system.db.execute("DELETE FROM automod_pastas WHERE content = ?", pasta)
+        self.system.automod_pastas.remove(pasta)
+        self.system.automod_matcher.remove(pasta)
+        await ctx.send(self.system.locale("Removed the copypasta from automod"))
+
+    @automod.group(invoke_without_command=True)
+    @dpy_check_editor()
+    @commands.bot_has_guild_permissions(manage_messages=True)
+    async def words(self, ctx, state: bool = None):
+        """
+        Enable/disable the banned word filter.
+        Messages containing a word from the banned word list will be deleted.
+        Automod will give strikes, so be sure your moderation system is set up.
+        """
+        if state is not None:
+            self.system.config.set("moderation", "automod_enable_words", str(state))
+            self.compile()
+            await ctx.send(self.system.locale("Banned word protection is now {0}").format(self.system.locale("on") if state else self.system.locale("off")))
+
+        else:
+            if self.system.config.getboolean("moderation", "automod_enable_words", fallback=False):
+                fmt = self.system.locale("Banned word protection is enabled")
+
+            else:
+                fmt = self.system.locale("Banned word protection is not enabled")
+
+            await ctx.send(fmt)
+
+    @words.command("add")
+    @dpy_check_editor()
+    @commands.bot_has_guild_permissions(manage_messages=True)
+    async def words_add(self, ctx, noTwitch: Optional[NoTwitchChecker], noDiscord: Optional[NoDiscordChecker], *, word: str):
+        """
+        Adds a word to the banned word list.
+        Pass `notwitch` or `nodiscord` before the word to only ban it on one platform.
+        """
+        if noTwitch and noDiscord:
+            raise commands.CommandError(self.system.locale("You must use at least one platform to ban the word on"))
+
+        word = word.lower()
+        try:
+            await self.system.db.execute("INSERT INTO automod_words VALUES (?,?,?);", word, not noTwitch, not noDiscord)
+        except:
+            return await ctx.send(self.system.locale("This word is already banned"))
+
+        self.system.automod_matcher.add(automod.Term(word, automod.WORD, not noTwitch, not noDiscord))
+        await ctx.send(self.system.locale("Added {0} to the banned word list").format(word))
+
+    @words.command("remove")
+    @dpy_check_editor()
+    @commands.bot_has_guild_permissions(manage_messages=True)
+    async def words_remove(self, ctx, *, word: str):
+        """
+        Removes a word from the banned word list.
+        """
+        word = word.lower()
+        if not await self.system.db.fetchval("SELECT word FROM automod_words WHERE word = ?", word):
+            return await ctx.send(self.system.locale("This word is not banned"))
+
+        await self.system.db.execute("DELETE FROM automod_words WHERE word = ?", word)
+        self.system.automod_matcher.remove(word)
+        await ctx.send(self.system.locale("{0} is no longer banned").format(word))
+
+    @automod.command()
+    @dpy_check_editor()
+    @commands.bot_has_guild_permissions(manage_messages=True)
+    async def flood(self, ctx, state: Optional[bool] = None, count: int = None, seconds: int = None):
+        """
+        Enable/disable flood protection.
+        Flood protection catches the same message being sent by many people at once, such as during a raid.
+        The `count` and `seconds` arguments set how many people have to send the message, and how quickly, for automod to kick in.
+        Automod will give strikes, so be sure your moderation system is set up.
+        """
+        if state is not None:
+            self.system.config.set("moderation", "automod_enable_flood", str(state))
+            self.compile()
+            await ctx.send(self.system.locale("Flood protection is now {0}").format(self.system.locale("on") if state else self.system.locale("off")))
+
+        if count is not None and seconds is not None:
+            self.system.config.set("moderation", "automod_flood_count", str(count))
+            self.system.config.set("moderation", "automod_flood_seconds", str(seconds))
+            self.compile()
+            await ctx.send(self.system.locale("{0} people sending the same message within {1} seconds will now trigger automod").format(count, seconds))
+
+        if state is None and count is None:
+            if self.system.config.getboolean("moderation", "automod_enable_flood", fallback=False):
+                fmt = self.system.locale("Flood protection is enabled, and triggers when {0} people send the same message within {1} seconds").format(
+                    self.flood_detector.count, int(self.flood_detector.seconds)
+                )
+
+            else:
+                fmt = self.system.locale("Flood protection is not enabled")
+
+            await ctx.send(fmt)
+
     @automod.command()
     @dpy_check_editor()
     @commands.bot_has_guild_permissions(manage_messages=True)
@@ -152,16 +381,18 @@ class AutoModeration(commands.Cog):
         """
         if state is not None:
             self.system.config.set("moderation", "automod_enable_mentions", str(state))
+            self.compile()
             await ctx.send(self.system.locale("Mention spam protection is now {0}").format(self.system.locale("on") if state else self.system.locale("off")))
 
         if limit is not None:
             self.system.config.set("moderation", "automod_mention_cap", str(limit))
+            self.compile()
             await ctx.send(self.system.locale("Mentioning {0} people will now trigger automod").format(limit))
 
         if state is None and limit is None:
             if self.system.config.getboolean("moderation", "automod_enable_mentions", fallback=False):
                 fmt = self.system.locale("Mention spam protection is enabled, and requres {0} mentions to trigger").format(
-                    self.system.config.getint("moderation", "automod_mentions_cap", fallback=5)
+                    self.system.config.getint("moderation", "automod_mention_cap", fallback=5)
                 )
 
             else:
@@ -169,36 +400,47 @@ class AutoModeration(commands.Cog):
 
             await ctx.send(fmt)
 
+    @automod.command()
+    @dpy_check_editor()
+    async def stats(self, ctx):
+        """
+        Shows how often each automod check has caught something, and how long it takes on average.
+        """
+        if not self.check_stats:
+            return await ctx.send(self.system.locale("Automod has not checked any messages yet"))
+
+        rows = []
+        for name, stats in self.check_stats.items():
+            rows.append(self.system.locale("{0}: {1} checked, {2} caught, {3:.3f}ms average").format(
+                name, stats.calls, stats.hits, stats.average))
+
+        scanner = self.system.automod_scanner
+        rows.append(self.system.locale("Content scans: {0} scanned, {1} from cache, {2} timed out, {3} timed out waiting, {4} failed").format(
+            scanner.scans, scanner.cache_hits, scanner.timeouts, scanner.queue_timeouts, scanner.errors))
+        if scanner.scans:
+            rows.append(self.system.locale("Content scans: {0:.3f}ms waiting, {1:.3f}ms matching on average").format(
+                scanner.queued / scanner.scans * 1000, scanner.matching / scanner.scans * 1000))
+        await ctx.send("\n".join(rows))
+
     @commands.Cog.listener()
     async def on_message(self, message):
+        if not self.pipeline or message.guild is None or message.author.bot:
+            return
+
         usr = await self.system.get_user_discord_id(message.author.id)
         if usr.editor:
             return
 
-        if self.system.config.getboolean("moderation", "automod_enable_mentions", fallback=False):
-            await self.check_mentions(message)
-
-        if self.system.config.getboolean("moderation", "automod_enable_copypasta", fallback=False):
-            await self.check_copypasta(message)
-
-        if self.system.config.getboolean("moderation", "automod_enable_spam", fallback=False):
-            await self.check_spam(message)
+        await self.pipeline.run(message, self.system.automod_scanner.prepare(message.content))
 
-        if self.system.config.getboolean("moderation", "automod_enable_ads", fallback=False):
-            await self.check_ads(message)
-
-    async def check_mentions(self, message: discord.Message):
+    async def check_mentions(self, message: discord.Message, scan):
         mentions = len(message.mentions)
-        if mentions < self.system.config.getint("moderation", "automod_mention_cap", fallback=5):
-            return
-
-        user = await self.bot.system.get_user_discord_id(message.author.id)
-        if user.editor:
-            return
+        if mentions < self.mention_cap:
+            return False
 
         mod = self.bot.get_cog("Moderation")
         if mod is None:
-            return
+            return False
 
         await mod.add_strike(message.guild.me, message.author, mentions, self.system.locale("Spamming {0} pings").format(mentions))
         try:
@@ -206,60 +448,81 @@ class AutoModeration(commands.Cog):
         except:
             pass
 
-    async def check_spam(self, message: discord.Message):
-        user = await self.bot.system.get_user_discord_id(message.author.id)
-        if user.editor:
-            return
+        return True
 
-        if self.short_map.update_rate_limit(message):
-            mod = self.bot.get_cog("Moderation")
-            if mod is None:
-                return
+    def record_spam(self, message: discord.Message, scan):
+        return self.spam_tracker.update((message.channel.id, message.author.id), message.id)
 
-            await mod.add_strike(message.guild.me, message.author, 1,
-                                 self.system.locale("Spamming {0} messages in {1} seconds").format(7, 3))
+    async def check_spam(self, message: discord.Message, scan, window):
+        if window is None:
+            return False
 
-            if message.channel.permissions_for(message.guild.me).manage_messages:
-                await message.channel.purge(limit=10, check=lambda m: m.author.id==message.author.id)
-            try:
-                await message.channel.send(self.system.locale("Added 1 strike to {0} for spamming {1} messages").format(message.author, 7))
-            except: pass
+        count, seconds, message_ids = window
+        mod = self.bot.get_cog("Moderation")
+        if mod is None:
+            return False
+
+        await mod.add_strike(message.guild.me, message.author, 1,
+                             self.system.locale("Spamming {0} messages in {1} seconds").format(count, seconds))
 
-        if self.long_map.update_rate_limit(message):
-            mod = self.bot.get_cog("Moderation")
-            if mod is None:
-                return
+        if message.channel.permissions_for(message.guild.me).manage_messages:
+            self.deletions.add(message.channel, *message_ids)
+        try:
+            await message.channel.send(self.system.locale("Added 1 strike to {0} for spamming {1} messages").format(message.author, count))
+        except: pass
 
-            await mod.add_strike(message.guild.me, message.author, 1,
-                                 self.system.locale("Spamming {0} messages in {1} seconds").format(27, 20))
+        return True
 
-            try:
-                await message.channel.send(
-                    self.system.locale("Added 1 strike to {0} for spamming {1} messages").format(message.author, 27))
-            except: pass
-
-    async def check_copypasta(self, message):
-        for pasta in copypasta.pasta:
-            if pasta in message.content.lower():
-                mod = self.bot.get_cog("Moderation")
-                if mod is None:
-                    return
-
-                await mod.add_strike(message.guild.me, message.author, 1,
-                                     self.system.locale("Copy pasta"))
-                if message.channel.permissions_for(message.guild.me).manage_messages:
-                    await message.delete()
-                return
-
-    async def check_ads(self, message):
-        r = regex.match(message.content)
-        if r:
-            mod = self.bot.get_cog("Moderation")
-            if mod is None:
-                return
-
-            await mod.add_strike(message.guild.me, message.author, 1,
-                                 self.system.locale("Advertising"))
-
-            if message.channel.permissions_for(message.guild.me).manage_messages:
-                await message.delete()
+    def record_flood(self, message: discord.Message, scan):
+        return self.flood_detector.update(message.channel.id, message.author.id, message.content)
+
+    async def check_flood(self, message: discord.Message, scan, flooders):
+        if not flooders:
+            return False
+
+        mod = self.bot.get_cog("Moderation")
+        if mod is None:
+            return False
+
+        for user_id in flooders:
+            member = message.guild.get_member(user_id)
+            if member is not None:
+                await mod.add_strike(message.guild.me, member, 1, self.system.locale("Flooding chat"))
+
+        if message.channel.permissions_for(message.guild.me).manage_messages:
+            self.deletions.add(message.channel, message.id)
+
+        return True
+
+    async def check_copypasta(self, message, scan):
+        result = await scan.result()
+        if result is None or (result.pasta is None and result.similarity < self.pasta_threshold):
+            return False
+
+        self.system.automod_pastas.remember(message.content)
+        return await self.punish(message, self.system.locale("Copy pasta"))
+
+    async def check_words(self, message, scan):
+        result = await scan.result()
+        if result is None or result.discord_word is None:
+            return False
+
+        return await self.punish(message, self.system.locale("Using a banned word"))
+
+    async def check_ads(self, message, scan):
+        result = await scan.result()
+        if result is None or result.ad is None:
+            return False
+
+        return await self.punish(message, self.system.locale("Advertising"))
+
+    async def punish(self, message, reason: str):
+        mod = self.bot.get_cog("Moderation")
+        if mod is None:
+            return False
+
+        await mod.add_strike(message.guild.me, message.author, 1, reason)
+        if message.channel.permissions_for(message.guild.me).manage_messages:
+            self.deletions.add(message.channel, message.id)
+
+        return True
@@ -2,6 +2,7 @@
 Licensed under the Open Software License version 3.0
 """
 from typing import Any
+import collections
 import time
 import discord
 from discord.ext import commands
@@ -14,22 +15,29 @@ def setup(bot):
     bot.add_cog(Currency(bot))
 
 class Bucket:
+    """
+    Triggers once more than ``rate`` messages have been sent within ``per`` seconds, then locks until the window has passed.
+    Only the last ``rate + 1`` message times are kept, so updating is constant time.
+    """
+    __slots__ = ("_min_keys", "_decay", "_bonus", "keys", "_lock")
+
     def __init__(self, rate: int, per: int, bonus: bool=False):
         self._min_keys = rate
         self._decay = per
         self._bonus = bonus
-        self.keys = []
+        self.keys = collections.deque(maxlen=rate + 1)
         self._lock = None
 
     def update_setters(self, rate: int, per: int) -> None:
         self._min_keys = rate
         self._decay = per
+        self.keys = collections.deque(self.keys, maxlen=rate + 1)
         self._remove_decayed_keys(time.time())
 
     def _remove_decayed_keys(self, now: float) -> None:
-        to_delete = [x for x in self.keys if x + self._decay < now]
-        for key in to_delete:
-            self.keys.remove(key)
+        keys = self.keys
+        while keys and keys[0] + self._decay < now:
+            keys.popleft()
 
     def update(self, now: float = None) -> bool:
         if now is None:
@@ -41,16 +49,24 @@ class Bucket:
 
         self._remove_decayed_keys(now)
         self.keys.append(now)
-        if self.is_triggered:
-            self._lock = time.time() + (self._decay if not self._bonus else 3600)
+        if len(self.keys) > self._min_keys and self._lock is None:
+            self._lock = now + (self._decay if not self._bonus else 3600)
             return True
 
         return False
 
     def reset(self):
-        self.keys = list()
+        self.keys.clear()
         self._lock = None
 
+    @property
+    def expires(self) -> float:
+        """
+        The time after which this bucket is empty and unlocked, and can be thrown away
+        """
+        last = self.keys[-1] + self._decay if self.keys else 0
+        return max(last, self._lock or 0)
+
     @property
     def is_locked(self) -> bool:
         return self._lock is not None
@@ -62,14 +78,26 @@ class Bucket:
 
     @property
     def is_empty(self) -> bool:
-        return len(self.keys) is 0
+        return len(self.keys) == 0
 
 class ActivityMapping:
+    """
+    Tracks message activity per user.
+    Idle users are reclaimed through a timing wheel: each user is filed under the tick their buckets expire in,
+    and every update sweeps at most ``RECLAIM_SLICE`` entries off the wheel, so no update ever walks every user.
+    """
+    TICK = 60
+    RECLAIM_SLICE = 32
+
     def __init__(self, rate: int, per: int):
         self._rate = rate
         self._per = per
         self._lower_cache = {}
         self._bonus_cache = {}
+        self._ticks = {} # key -> the tick it is filed under
+        self._wheel = {} # tick -> keys that may expire in it
+        self._due = [] # keys from past ticks, waiting to be checked
+        self._next_tick = None
 
     def set_rates(self, rate: int, per: int) -> None:
         self._rate = rate
@@ -78,7 +106,7 @@ class ActivityMapping:
             bucket.update_setters(rate, per)
 
         for bucket in self._bonus_cache.values():
-            bucket.update_setters(rate, per)
+            bucket.update_setters(rate * 3, per)
 
     def get_bucket(self, key: Any) -> (Bucket, Bucket):
         lower = self._lower_cache.get(key, None)
@@ -94,34 +122,57 @@ class ActivityMapping:
 
         return lower, higher
 
-    def _clear_dead_keys(self, now: float) -> None:
-        to_remove = []
-        for key, bucket in self._lower_cache.items():
-            bucket._remove_decayed_keys(now)
-            if bucket.is_empty and not bucket.is_locked:
-                to_remove.append(key)
-
-        for key in to_remove:
-            del self._lower_cache[key]
-
-        to_remove = []
-        for key, bucket in self._bonus_cache.items():
-            bucket._remove_decayed_keys(now)
-            if bucket.is_empty and not bucket.is_locked:
-                to_remove.append(key)
-
-        for key in to_remove:
-            del self._bonus_cache[key]
+    def _schedule(self, key: Any, expires: float) -> None:
+        tick = int(expires // self.TICK) + 1
+        if self._ticks.get(key) != tick:
+            # the key may still be filed under an older tick, that entry gets skipped when it is swept
+            self._ticks[key] = tick
+            self._wheel.setdefault(tick, []).append(key)
+
+    def _reclaim(self, now: float) -> None:
+        current = int(now // self.TICK)
+        if self._next_tick is None:
+            self._next_tick = current
+
+        budget = self.RECLAIM_SLICE
+        while budget > 0:
+            if not self._due:
+                if self._next_tick > current:
+                    return
+
+                self._due = self._wheel.pop(self._next_tick, [])
+                self._next_tick += 1
+                budget -= 1
+                continue
+
+            key = self._due.pop()
+            budget -= 1
+            tick = self._ticks.get(key)
+            if tick is None or tick > current:
+                continue # already reclaimed, or rescheduled to a later tick
+
+            lower = self._lower_cache.get(key)
+            higher = self._bonus_cache.get(key)
+            expires = max(lower.expires if lower else 0, higher.expires if higher else 0)
+            if expires > now:
+                del self._ticks[key]
+                self._schedule(key, expires)
+                continue
+
+            self._lower_cache.pop(key, None)
+            self._bonus_cache.pop(key, None)
+            del self._ticks[key]
 
     def update_limit(self, msg: discord.Message, now: float = None) -> (bool, bool):
         if now is None:
             now = time.time()
 
-        self._clear_dead_keys(now)
+        self._reclaim(now)
         lower, higher = self.get_bucket(msg.author.id)
-        lower.update(now)
-        higher.update(now)
-        return lower.is_triggered, higher.is_triggered
+        low = lower.update(now)
+        high = higher.update(now)
+        self._schedule(msg.author.id, max(lower.expires, higher.expires))
+        return low, high
 
 
 class Currency(commands.Cog):
@@ -136,11 +187,8 @@ class Currency(commands.Cog):
         self.quick_ignore = []
 
     async def add_user_points(self, uid: int, amount: int):
-        existing = await self.bot.system.db.fetchval("SELECT points FROM accounts WHERE discord_id = ?", uid)
-        if existing is not None:
-            await self.bot.db.execute("UPDATE accounts SET points = ? WHERE discord_id = ?", amount + existing, uid)
-        else:
-            await self.bot.db.execute("INSERT INTO accounts VALUES (null, null, ?, ?, 0.0);", uid, amount)
+        user = await self.bot.system.get_user_discord_id(uid)
+        await user.add_points(amount)
 
     async def award_buckets(self, user: discord.User, low: bool, high: bool):
         payout = self.bot.system.config.getint("currency", "discord_activity_payout")
@@ -188,3 +236,50 @@ class Currency(commands.Cog):
     async def removepoints(self, ctx, target: discord.Member, amount: int):
         await self.add_user_points(target.id, amount*-1)
         await ctx.message.add_reaction("\U0001f44c")
+
+    async def _display_name(self, user) -> str:
+        if user.discord_id is not None:
+            duser = self.bot.get_user(user.discord_id)
+            if duser is not None:
+                return str(duser)
+
+        if user.twitch_name is not None:
+            return user.twitch_name
+
+        return self.bot.system.locale("Unknown user")
+
+    @command()
+    @commands.guild_only()
+    async def top(self, ctx, count: int = 10):
+        """
+        shows the users with the most points
+        """
+        board = self.bot.system.leaderboard
+        if not board.ready:
+            return await ctx.send(self.bot.system.locale("The leaderboard is still loading, try again in a moment"))
+
+        resp = ""
+        for position, (id, points) in enumerate(board.top(max(1, min(count, 25))), start=1):
+            user = await self.bot.system.get_user(id)
+            name = await self._display_name(user) if user is not None else self.bot.system.locale("Unknown user")
+            resp += f"{position}. {discord.utils.escape_markdown(name)} - {points}\n"
+
+        await ctx.send(resp or self.bot.system.locale("Nobody has any points yet"))
+
+    @command()
+    @commands.guild_only()
+    async def rank(self, ctx, target: discord.Member = None):
+        """
+        shows where you, or someone else, are on the leaderboard
+        """
+        target = target or ctx.author
+        board = self.bot.system.leaderboard
+        if not board.ready:
+            return await ctx.send(self.bot.system.locale("The leaderboard is still loading, try again in a moment"))
+
+        user = await self.bot.system.get_user_discord_id(target.id)
+        rank = board.rank(user.id)
+        if rank is None:
+            return await ctx.send(self.bot.system.locale("{0} isn't on the leaderboard").format(target))
+
+        await ctx.send(self.bot.system.locale("{0} is #{1} of {2}, with {3} points").format(target, rank, len(board), user.points))
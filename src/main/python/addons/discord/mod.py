@@ -2,6 +2,8 @@
 Licensed under the Open Software License version 3.0
 """
 from typing import Optional, Union
+import asyncio
+import bisect
 import gzip
 import json
 import time
@@ -73,23 +75,39 @@ class StrikesValues:
             except FileNotFoundError: # travisCI is stupid
                 pass
 
+        self.compile()
+
+    def compile(self):
+        """
+        Rebuilds the escalation table from the configured levels. Must be called after the levels change
+        """
+        levels = sorted((int(k), v) for k, v in self._value['levels'].items())
+        self._levels = [level for level, _ in levels]
+        self._level_codes = [action for _, action in levels]
+        self._level_actions = [self.actions.get(action) for _, action in levels]
 
     def save(self):
+        self.compile()
         pth = pathlib.Path(self.system.interface.get_data_location(), "services", "modstriking.bin")
         with pth.open(mode="wb") as f:
             f.write(gzip.compress(json.dumps(self._value).encode()))
 
     def punishment(self, n: int):
-        try:
-            value = self._value['levels'][str(n)]
-        except KeyError:
-            max_level = max([int(x) for x in self._value['levels'].keys()])
-            if max_level < n:
-                return self.punish_ban
+        i = bisect.bisect_left(self._levels, n)
+        if i < len(self._levels) and self._levels[i] == n:
+            return self._level_actions[i]
+
+        if self._levels and i == len(self._levels): # past the highest level
+            return self.punish_ban
 
-            return None
+        return None
 
-        return self.actions[value]
+    def standing(self, n: int) -> int:
+        """
+        The action of the highest level a strike count has reached, or 0 if it hasn't reached any
+        """
+        i = bisect.bisect_right(self._levels, n)
+        return self._level_codes[i - 1] if i else 0
 
     async def pardon(self, bot, mod, target, prev, after, case, reason):
         return bot.system.locale(
@@ -144,6 +162,47 @@ class StrikesValues:
             "`[{0}]` \U0001f528 **{1}** banned *{2}* ({3})\n[{4} → {5} Strikes] ` Reason ` {6}").format(
             case, str(mod), str(target), target.id, prev or 0, after, reason or bot.system.locale("None given"))
 
+class StrikeLedger:
+    """
+    Keeps every user's strike count in memory, in step with the strikes table.
+    Counts are loaded once, then changed alongside each write, so giving a strike doesn't need to read anything.
+    """
+    def __init__(self, db):
+        self.db = db
+        self._counts = None
+        self._load_lock = asyncio.Lock()
+
+    async def load(self):
+        async with self._load_lock:
+            if self._counts is None:
+                rows = await self.db.fetch("SELECT user_id, amount FROM strikes")
+                if rows is None:
+                    raise RuntimeError("Failed to load strikes")
+
+                self._counts = {user_id: amount or 0 for user_id, amount in rows}
+
+    async def add(self, user_id: int, mod_id: int, strikes: int, reason: Optional[str]):
+        """
+        Adds strikes to the user and opens a mod case for it, in one transaction.
+        Returns the previous strike count, the new count, and the case id
+        """
+        if self._counts is None:
+            await self.load()
+
+        # applied up front, so concurrent strikes for the same user each see the count the previous one left
+        prev = self._counts.get(user_id, 0)
+        self._counts[user_id] = prev + strikes
+        try:
+            async with self.db.transaction() as conn:
+                await conn.execute("INSERT INTO strikes VALUES (?,?) ON CONFLICT (user_id) DO UPDATE SET amount = amount + ?",
+                                   (user_id, strikes, strikes))
+                case = (await conn.execute("INSERT INTO mod_cases VALUES (?,?,?)", (user_id, mod_id, reason))).lastrowid
+        except BaseException:
+            self._counts[user_id] -= strikes
+            raise
+
+        return prev, prev + strikes, case
+
 class Moderation(commands.Cog):
     HELP_REQUIRES = ["mod"]
 
@@ -153,6 +212,7 @@ class Moderation(commands.Cog):
         self.system = bot.system
         self.db = self.system.db
         self.value = StrikesValues(self.system)
+        self.ledger = StrikeLedger(self.db)
         self.levels = {
             1: self.system.locale("temp mute"),
             2: self.system.locale("kick"),
@@ -165,17 +225,14 @@ class Moderation(commands.Cog):
         user = await self.system.get_user_discord_id(target.id)
         modu = await self.system.get_user_discord_id(mod.id)
 
-        prev = await self.db.fetchval("SELECT amount FROM strikes WHERE user_id = ?", user.id) or 0
-        await self.db.execute("INSERT INTO strikes VALUES (?,?) ON CONFLICT (user_id) DO UPDATE SET amount = amount + ? WHERE user_id = ?", user.id, strikes, strikes, user.id)
-        await self.db.execute("INSERT INTO mod_cases VALUES (?,?,?)", user.id, modu.id, reason)
-
-        rid = await self.db.fetchval("SELECT last_insert_rowid()")
-        new_strikes = prev + strikes if prev is not None else strikes
+        prev, new_strikes, rid = await self.ledger.add(user.id, modu.id, strikes, reason)
         pun=None
         if strikes > 0:
             pun = self.value.punishment(new_strikes)
         else:
             pun = self.value.pardon
+            if self.value.standing(new_strikes) < 1: # the strikes left no longer warrant a tempmute
+                await self.lift_tempmute(target)
         if pun is None:
             pun = self.value.punish_none
 
@@ -187,6 +244,46 @@ class Moderation(commands.Cog):
         except:
             pass
 
+    async def lift_tempmute(self, target: discord.Member):
+        """
+        Cancels any pending unmute for the target, and unmutes them now
+        """
+        timers = self.system.timers.find("member_strike_unmute", userid=target.id)
+        if not timers:
+            return
+
+        for timer in timers:
+            await self.system.cancel_timer(timer['id'])
+
+        await self.on_member_strike_unmute({"userid": target.id})
+
+    @commands.Cog.listener()
+    async def on_member_strike_unmute(self, data):
+        guild = self.bot.get_guild(self.system.config.getint("general", "server_id", fallback=0))
+        if guild is None:
+            return
+
+        member = guild.get_member(data['userid'])
+        role = guild.get_role(self.system.config.getint("moderation", "mute_role", fallback=0))
+        if member is None or role is None:
+            return
+
+        try:
+            await member.remove_roles(role, reason="tempmute expired")
+        except discord.HTTPException:
+            pass
+
+    @commands.Cog.listener()
+    async def on_member_strike_unban(self, data):
+        guild = self.bot.get_guild(self.system.config.getint("general", "server_id", fallback=0))
+        if guild is None:
+            return
+
+        try:
+            await guild.unban(discord.Object(id=data['userid']), reason="tempban expired")
+        except discord.HTTPException:
+            pass
+
     @command()
     @commands.bot_has_permissions(ban_members=True, kick_members=True, manage_roles=True)
     async def strike(self, ctx, amount: Optional[int]=1, targets: commands.Greedy[discord.Member]=None, *, reason=None):
@@ -253,12 +350,10 @@ class Moderation(commands.Cog):
             await ctx.guild.ban(trg, reason=reason)
             user = await self.system.get_user_discord_id(target.id)
             modu = await self.system.get_user_discord_id(ctx.author.id)
-            await self.db.execute("INSERT INTO mod_cases VALUES (?,?,?)", user.id, modu.id, reason)
+            rid = (await self.db.execute("INSERT INTO mod_cases VALUES (?,?,?)", user.id, modu.id, reason)).lastrowid
             if channel is None:
                 continue
 
-            rid = await self.db.fetchval("SELECT last_insert_rowid()")
-
             if isinstance(target, int):
                 e = self.system.locale(
                     "`[{0}]` \U0001f528 **{1}** banned user with id `{2}`\n` Reason ` {3}").format(
@@ -288,12 +383,10 @@ class Moderation(commands.Cog):
 
             user = await self.system.get_user_discord_id(target.id)
             modu = await self.system.get_user_discord_id(ctx.author.id)
-            await self.db.execute("INSERT INTO mod_cases VALUES (?,?,?)", user.id, modu.id, reason)
+            rid = (await self.db.execute("INSERT INTO mod_cases VALUES (?,?,?)", user.id, modu.id, reason)).lastrowid
             if channel is None:
                 continue
 
-            rid = await self.db.fetchval("SELECT last_insert_rowid()")
-
             e = self.system.locale(
                 "`[{0}]` \U0001fa93 **{1}** soft banned *{2}* ({3})\n` Reason ` {4}").format(
                 rid, str(ctx.author), str(target), target.id, reason)
@@ -317,12 +410,10 @@ class Moderation(commands.Cog):
 
             user = await self.system.get_user_discord_id(target.id)
             modu = await self.system.get_user_discord_id(ctx.author.id)
-            await self.db.execute("INSERT INTO mod_cases VALUES (?,?,?)", user.id, modu.id, reason)
+            rid = (await self.db.execute("INSERT INTO mod_cases VALUES (?,?,?)", user.id, modu.id, reason)).lastrowid
             if channel is None:
                 continue
 
-            rid = await self.db.fetchval("SELECT last_insert_rowid()")
-
             e = self.system.locale(
                 "`[{0}]` \U0001fa93 **{1}** soft banned *{2}* ({3})\n` Reason ` {4}").format(
                 rid, str(ctx.author), str(target), target.id, reason)
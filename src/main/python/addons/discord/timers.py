@@ -33,11 +33,11 @@ class Timers(commands.Cog):
 
         self.flag = True
 
-        for chain in self.chains:
+        for chain in self.chains.values():
             chain.start_task()
 
-        for timer in self.solos:
-            timer.start_task()
+        for timer in self.solos.values():
+            timer.start_loop()
 
     async def create_timers(self):
         chains = await self.system.db.fetch("SELECT * FROM chat_timer_loops")
@@ -46,7 +46,7 @@ class Timers(commands.Cog):
                 obj = common.TimerLoop(self.system, *chain)
                 self.chains[obj.name] = obj
 
-        timers = self.system.db.fetch("SELECT * FROM chat_timers")
+        timers = await self.system.db.fetch("SELECT * FROM chat_timers")
         if timers:
             for timer in timers:
                 if timer[7] is not None: # its on a loop circuit
@@ -55,6 +55,7 @@ class Timers(commands.Cog):
                         continue
 
                     obj = common.ChainTimer(timer, loop)
+                    loop.add_timer(obj)
                     self.looped[obj.name] = obj
 
                 else:
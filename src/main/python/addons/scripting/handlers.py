@@ -33,6 +33,12 @@ logger = logging.getLogger("xlydn.scripting")
 class ScriptDB(db.Database):
     def __init__(self):
         self.connection = None
+        self.readers = None
+        self.executor = None
+        self.pool_size = 0 # attached script databases live on the one in-memory connection
+        self.group_commit = False
+        self._pending = 0
+        self._flush_handle = None
         self.lock = asyncio.Lock()
 
     async def setup(self):
@@ -598,8 +604,8 @@ class Communicator:
         """
         channel = self.__system.twitch_streamer.get_channel(self.__system.twitch_streamer.nick)
         if channel:
-            chatters = [await self.__system.get_user_twitch_name(x.name) for x in channel.chatters]
-            return chatters
+            users = await self.__system.get_users_bulk(twitch_names=[x.name for x in channel.chatters])
+            return [users[x.name.lower()] for x in channel.chatters]
 
         return None
 
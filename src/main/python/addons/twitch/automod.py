@@ -1,19 +1,225 @@
 """
 Licensed under the Open Software License version 3.0
 """
-import discord
+import asyncio
+import time
+
+import twitchio
 from discord.ext import commands
 
+from utils import automod
+from utils.cache import LRUCache
+
 
 def setup(bot):
     bot.add_cog(Automod(bot))
 
+
+class CommandQueue:
+    """
+    Sends moderation commands to twitch chat without going over the chat rate limit, which gets the bot disconnected.
+    Commands go through a token bucket that holds up to ``rate`` commands and refills over ``per`` seconds,
+    so a burst goes out straight away and anything past it is spread out.
+    The same command is only queued once while it is waiting to be sent.
+
+    Timers and command replies count against the same limit, 100 messages per 30 seconds for a moderator,
+    but don't go through this queue. ``rate`` is set by ``automod_command_rate`` and must leave them enough headroom.
+    """
+    def __init__(self, loop, rate: int = 40, per: float = 30):
+        self.loop = loop
+        self.rate = rate
+        self.per = per
+        self._tokens = float(rate)
+        self._last = time.monotonic()
+        self._queue = asyncio.Queue()
+        self._pending = set()
+        self._task = None
+
+    def __len__(self):
+        return self._queue.qsize()
+
+    def put(self, channel: twitchio.Channel, command: str) -> None:
+        key = (channel.name, command)
+        if key in self._pending:
+            return
+
+        self._pending.add(key)
+        self._queue.put_nowait((channel, command))
+        if self._task is None or self._task.done():
+            self._task = self.loop.create_task(self._run())
+
+    def delete(self, channel: twitchio.Channel, message_id: str) -> None:
+        self.put(channel, f"/delete {message_id}")
+
+    def timeout(self, channel: twitchio.Channel, user: str, seconds: int, reason: str = "") -> None:
+        self.put(channel, f"/timeout {user} {seconds} {reason}".rstrip())
+
+    def ban(self, channel: twitchio.Channel, user: str, reason: str = "") -> None:
+        self.put(channel, f"/ban {user} {reason}".rstrip())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _acquire(self) -> None:
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.rate, self._tokens + (now - self._last) * self.rate / self.per)
+            self._last = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+
+            await asyncio.sleep((1 - self._tokens) * self.per / self.rate)
+
+    async def _run(self) -> None:
+        while not self._queue.empty():
+            channel, command = await self._queue.get()
+            await self._acquire()
+            self._pending.discard((channel.name, command))
+            try:
+                await channel.send(command)
+            except:
+                pass
+
+
 class Automod(commands.Cog):
+    """
+    Runs twitch chat through the same automod engine as discord.
+    Checks are enabled by the same settings as the discord automod.
+
+    Twitch users don't have strikes, so offenses are counted here instead. Once a user has been caught
+    ``automod_twitch_ban_after`` times, with no more than ``OFFENSE_WINDOW`` seconds between offenses, they are banned.
+    Setting it to 0 turns banning off.
+    """
+    SPAM_TIMEOUT = 60
+    FLOOD_TIMEOUT = 600
+    OFFENSE_WINDOW = 3600
+
     def __init__(self, bot):
         self.bot = bot
         self.system = bot.system
+        self.queue = CommandQueue(bot.loop, rate=self.system.config.getint("moderation", "automod_command_rate", fallback=40))
+        self.offenses = LRUCache(capacity=10000, ttl=self.OFFENSE_WINDOW) # user name -> offenses
+        self.ban_after = 0
+        self.spam_tracker = automod.SpamTracker([(7, 3), (27, 20)])
+        self.flood_detector = None
+        self.pasta_threshold = 0.6
+        self.check_stats = {}
+        self.pipeline = None
+        self.compile()
+
+    def cog_unload(self):
+        self.queue.stop()
+
+    def compile(self):
+        """
+        Rebuilds the check pipeline from the current settings.
+        The discord automod calls this whenever an automod setting changes.
+        """
+        config = self.system.config
+        self.pasta_threshold = config.getfloat("moderation", "automod_copypasta_similarity", fallback=0.6)
+        self.ban_after = config.getint("moderation", "automod_twitch_ban_after", fallback=5)
+
+        count = config.getint("moderation", "automod_flood_count", fallback=5)
+        seconds = config.getfloat("moderation", "automod_flood_seconds", fallback=10)
+        if self.flood_detector is None or (self.flood_detector.count, self.flood_detector.seconds) != (count, seconds):
+            self.flood_detector = automod.FloodDetector(count, seconds)
+
+        checks = [
+            ("spam", "automod_enable_spam", self.check_spam, self.record_spam),
+            ("flood", "automod_enable_flood", self.check_flood, self.record_flood),
+            ("ads", "automod_enable_ads", self.check_ads, None),
+            ("words", "automod_enable_words", self.check_words, None),
+            ("copypasta", "automod_enable_copypasta", self.check_copypasta, None),
+        ]
+        self.pipeline = automod.Pipeline([(name, check, record) for name, key, check, record in checks
+                                          if config.getboolean("moderation", key, fallback=False)], self.check_stats)
 
     @commands.Cog.listener()
-    async def on_message(self, message):
-        pass
+    async def event_message(self, message: twitchio.Message):
+        if not self.pipeline or not message.channel or message.author is None:
+            return
+
+        if message.author.is_mod or message.author.name in (message.channel.name, self.bot._ws.nick):
+            return
+
+        usr = await self.system.get_user_twitch_name(message.author.name, id=message.author.id)
+        if usr.editor:
+            return
+
+        await self.pipeline.run(message, self.system.automod_scanner.prepare(message.content))
+
+    def offend(self, channel: twitchio.Channel, user: str, reason: str) -> bool:
+        """
+        Counts an offense against the user, and bans them if it is one too many.
+        Returns True if they were banned, in which case nothing else needs doing to them
+        """
+        count = self.offenses.get(user, 0) + 1
+        if not self.ban_after or count < self.ban_after:
+            self.offenses[user] = count
+            return False
+
+        self.offenses.pop(user)
+        self.queue.ban(channel, user, reason)
+        return True
+
+    def delete(self, message: twitchio.Message, reason: str) -> bool:
+        message_id = message.tags.get("id") if message.tags else None
+        if message_id is None:
+            return False
+
+        if not self.offend(message.channel, message.author.name, reason):
+            self.queue.delete(message.channel, message_id)
+
+        return True
+
+    def record_spam(self, message: twitchio.Message, scan):
+        return self.spam_tracker.update((message.channel.name, message.author.id))
+
+    async def check_spam(self, message: twitchio.Message, scan, window):
+        if window is None:
+            return False
+
+        count, seconds, _ = window
+        reason = self.system.locale("Spamming {0} messages in {1} seconds").format(count, seconds)
+        if not self.offend(message.channel, message.author.name, reason):
+            self.queue.timeout(message.channel, message.author.name, self.SPAM_TIMEOUT, reason)
+
+        return True
+
+    def record_flood(self, message: twitchio.Message, scan):
+        return self.flood_detector.update(message.channel.name, message.author.name, message.content)
+
+    async def check_flood(self, message: twitchio.Message, scan, flooders):
+        if not flooders:
+            return False
+
+        reason = self.system.locale("Flooding chat")
+        for name in flooders:
+            if not self.offend(message.channel, name, reason):
+                self.queue.timeout(message.channel, name, self.FLOOD_TIMEOUT, reason)
+
+        return True
+
+    async def check_ads(self, message: twitchio.Message, scan):
+        result = await scan.result()
+        if result is None or result.ad is None:
+            return False
+
+        return self.delete(message, self.system.locale("Advertising"))
+
+    async def check_words(self, message: twitchio.Message, scan):
+        result = await scan.result()
+        if result is None or result.twitch_word is None:
+            return False
+
+        return self.delete(message, self.system.locale("Using a banned word"))
+
+    async def check_copypasta(self, message: twitchio.Message, scan):
+        result = await scan.result()
+        if result is None or (result.pasta is None and result.similarity < self.pasta_threshold):
+            return False
 
+        self.system.automod_pastas.remember(message.content)
+        return self.delete(message, self.system.locale("Copy pasta"))
@@ -0,0 +1,920 @@
+"""
+Licensed under the Open Software License version 3.0
+"""
+import asyncio
+import collections
+import re
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Hashable, Iterator, List, Optional, Tuple
+
+from .cache import LRUCache
+
+_missing = object()
+
+WORD = 0 # must sit on word boundaries, like \bword\b
+PASTA = 1 # matches anywhere in the message
+
+
+def _is_word(char: str) -> bool:
+    return char.isalnum() or char == "_"
+
+
+class Term:
+    """
+    A pattern in a :class:`Matcher`, along with where it applies
+    """
+    __slots__ = ("text", "kind", "twitch", "discord")
+
+    def __init__(self, text: str, kind: int = WORD, twitch: bool = True, discord: bool = True):
+        self.text = text
+        self.kind = kind
+        self.twitch = twitch
+        self.discord = discord
+
+    def __repr__(self):
+        return f"<Term text={self.text!r} kind={self.kind} twitch={self.twitch} discord={self.discord}>"
+
+
+class Matcher:
+    """
+    An Aho-Corasick automaton over a set of :class:`Term`.
+    Finds every term in a message in one pass over it, no matter how many terms there are.
+    Matching is case insensitive.
+
+    Terms are added with :meth:`add`, and become searchable once :meth:`build` has been called.
+    """
+    def __init__(self, terms=()):
+        self._goto = [{}] # node -> {char: node}
+        self._fail = [0]
+        self._own = [None] # node -> the term ending at exactly this node
+        self._out = [()] # node -> (length, term) for every term ending here, including ones reached through fail links
+        self._terms = {}
+        self.built = False
+        for term in terms:
+            self.add(term)
+
+        self.build()
+
+    def __len__(self):
+        return len(self._terms)
+
+    def __contains__(self, text: str):
+        return text.lower() in self._terms
+
+    @property
+    def terms(self) -> List[Term]:
+        return list(self._terms.values())
+
+    def add(self, term: Term) -> None:
+        text = term.text.lower()
+        if not text:
+            return
+
+        self._terms[text] = term
+        node = 0
+        for char in text:
+            nxt = self._goto[node].get(char)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][char] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._own.append(None)
+                self._out.append(())
+
+            node = nxt
+
+        self._own[node] = term
+        self.built = False
+
+    def build(self) -> None:
+        """
+        Computes the fail links. Must be called after adding terms, before searching
+        """
+        goto, fail, out, own = self._goto, self._fail, self._out, self._own
+        for node, term in enumerate(own):
+            out[node] = () if term is None else ((len(term.text.lower()), term),)
+
+        queue = list(goto[0].values())
+        for node in queue:
+            fail[node] = 0
+
+        # breadth first, so a node's fail target is always finished before the node itself
+        i = 0
+        while i < len(queue):
+            node = queue[i]
+            i += 1
+            for char, child in goto[node].items():
+                queue.append(child)
+                state = fail[node]
+                while state and char not in goto[state]:
+                    state = fail[state]
+
+                target = goto[state].get(char, 0)
+                fail[child] = target if target != child else 0
+                if out[fail[child]]:
+                    out[child] = out[child] + out[fail[child]]
+
+        self.built = True
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int, Term]]:
+        """
+        Yields ``(start, end, term)`` for every term found in the text.
+        Word terms are only yielded when they sit on word boundaries.
+        """
+        if not self.built:
+            self.build()
+
+        text = text.lower()
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for end, char in enumerate(text, start=1):
+            while node and char not in goto[node]:
+                node = fail[node]
+
+            node = goto[node].get(char, 0)
+            for length, term in out[node]:
+                start = end - length
+                if term.kind == WORD and not self._on_boundary(text, start, end):
+                    continue
+
+                yield start, end, term
+
+    def search(self, text: str, check: Callable[[Term], bool] = None) -> Optional[Term]:
+        """
+        Returns the first term found in the text that passes the check, if any
+        """
+        for _, _, term in self.iter_matches(text):
+            if check is None or check(term):
+                return term
+
+        return None
+
+    @staticmethod
+    def _on_boundary(text: str, start: int, end: int) -> bool:
+        # \b: a switch between word and non word characters, where the ends of the text count as non word.
+        # so a term with a non word edge, like "c++", only matches where a word character is on the other side of it
+        before = start > 0 and _is_word(text[start - 1])
+        after = end < len(text) and _is_word(text[end])
+        return before != _is_word(text[start]) and after != _is_word(text[end - 1])
+
+
+class LiveMatcher:
+    """
+    A :class:`Matcher` that can be changed while it is being searched.
+
+    Adding or removing a term only touches two small overlays: a matcher holding terms added since the last build,
+    and a set of terms removed since then. The full automaton is rebuilt in the executor a few seconds after the last change,
+    and the old one keeps serving searches until the new one is swapped in.
+    """
+    REBUILD_DELAY = 5
+
+    def __init__(self, terms=()):
+        self.base = Matcher(terms)
+        self._added = {} # text -> term, added since the base was built
+        self._overlay = Matcher()
+        self._removed = set() # texts removed since the base was built
+        self._changed = set() # texts changed since the running rebuild took its snapshot
+        self._rebuild_handle = None
+        self._rebuild_task = None
+        self.version = 0 # bumped on every change, so cached results can tell when they are stale
+        self._publish()
+
+    def __len__(self):
+        return len(self.terms)
+
+    def __contains__(self, text: str):
+        text = text.lower()
+        return text in self._added or (text in self.base and text not in self._removed)
+
+    @property
+    def terms(self) -> List[Term]:
+        terms = {text: term for text, term in self.base._terms.items() if text not in self._removed}
+        terms.update(self._added)
+        return list(terms.values())
+
+    def _publish(self) -> None:
+        # searches run on scanner threads while the loop changes the matcher, so they only ever read this
+        # snapshot, which is replaced as a whole and never changed in place
+        self._view = (self.base, frozenset(self._removed), self._overlay if self._added else None)
+
+    def replace(self, matcher: Matcher) -> None:
+        """
+        Swaps in a freshly built matcher, dropping every pending change
+        """
+        self.base = matcher
+        self._added.clear()
+        self._overlay = Matcher()
+        self._removed.clear()
+        self._changed.clear()
+        self.version += 1
+        self._publish()
+
+    def add(self, term: Term) -> None:
+        text = term.text.lower()
+        self._removed.add(text) # hides any older version of the term in the base
+        self._added[text] = term
+        self._changed.add(text)
+        self._overlay = Matcher(self._added.values())
+        self.version += 1
+        self._publish()
+        self._schedule_rebuild()
+
+    def remove(self, text: str) -> None:
+        text = text.lower()
+        self._removed.add(text)
+        self._changed.add(text)
+        if self._added.pop(text, None) is not None:
+            self._overlay = Matcher(self._added.values())
+
+        self.version += 1
+        self._publish()
+        self._schedule_rebuild()
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int, Term]]:
+        base, removed, overlay = self._view
+        for match in base.iter_matches(text):
+            if not removed or match[2].text.lower() not in removed:
+                yield match
+
+        if overlay is not None:
+            yield from overlay.iter_matches(text)
+
+    def search(self, text: str, check: Callable[[Term], bool] = None) -> Optional[Term]:
+        for _, _, term in self.iter_matches(text):
+            if check is None or check(term):
+                return term
+
+        return None
+
+    def _schedule_rebuild(self) -> None:
+        loop = asyncio.get_event_loop()
+        if self._rebuild_handle is not None:
+            self._rebuild_handle.cancel()
+
+        self._rebuild_handle = loop.call_later(self.REBUILD_DELAY, self._start_rebuild)
+
+    def _start_rebuild(self) -> None:
+        self._rebuild_handle = None
+        if self._rebuild_task is not None and not self._rebuild_task.done():
+            self._schedule_rebuild() # one rebuild at a time, try again once this one is done
+            return
+
+        self._rebuild_task = asyncio.get_event_loop().create_task(self.rebuild())
+
+    async def rebuild(self) -> None:
+        """
+        Builds a new automaton from the current terms in the executor, then swaps it in.
+        Changes made while the build runs are kept in the overlays
+        """
+        self._changed = set()
+        matcher = await asyncio.get_event_loop().run_in_executor(None, Matcher, self.terms)
+
+        # anything untouched since the snapshot is now in the new base
+        self.base = matcher
+        self._removed &= self._changed
+        self._added = {text: term for text, term in self._added.items() if text in self._changed}
+        self._overlay = Matcher(self._added.values())
+        self._publish()
+
+
+_whitespace = re.compile(r"\s+")
+invites = re.compile(r"(?:https?://)?discord(?:(?:app)?\.com/invite|\.gg)/?[a-zA-Z0-9]+/?")
+_non_word = re.compile(r"[\W_]+")
+_host = re.compile(r"(?:[a-z][a-z0-9+.-]*://)?((?:[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?\.)+[a-z][a-z0-9-]{0,61}[a-z0-9])(?![a-z0-9-])", re.I)
+
+
+class PastaIndex:
+    """
+    A MinHash index for finding messages that are close to a known copypasta, even after a few words have been edited.
+
+    Texts are broken into overlapping character shingles, and each text is summarised by a fixed size signature,
+    using one permutation hashing: every shingle is hashed once and lands in one of ``PERMUTATIONS`` bins,
+    and each bin keeps the smallest hash it sees. The fraction of bins two signatures agree on estimates
+    the jaccard similarity of their shingles.
+    Signatures are split into bands, and only texts sharing at least one whole band with the message get compared to it.
+
+    Alongside the pastas, the index remembers the last ``recent`` flagged messages,
+    so variations of a pasta that isnt known yet are caught once one of them has been flagged.
+    """
+    SHINGLE = 5
+    PERMUTATIONS = 64
+    BANDS = 16
+    MIN_LENGTH = 40 # shorter messages dont have enough shingles to compare reliably
+
+    def __init__(self, recent: int = 200):
+        self._rows = self.PERMUTATIONS // self.BANDS
+        self._signatures: Dict[int, Tuple[int, ...]] = {}
+        self._bands = [{} for _ in range(self.BANDS)] # band -> {band values: {ids}}
+        self._keys = {} # normalized text -> id
+        self._recent = collections.deque()
+        self._recent_size = recent
+        self._next_id = 0
+        self.version = 0 # bumped on every change, so cached results can tell when they are stale
+
+    def __len__(self):
+        return len(self._signatures)
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return _whitespace.sub(" ", text.lower()).strip()
+
+    def signature(self, text: str) -> Optional[Tuple[int, ...]]:
+        """
+        Computes the signature of already normalized text.
+        Returns None if the text is too short to be indexed
+        """
+        if len(text) < self.MIN_LENGTH:
+            return None
+
+        size = self.PERMUTATIONS
+        bins = [None] * size
+        data = text.encode("utf8")
+        for i in range(len(data) - self.SHINGLE + 1):
+            h = zlib.crc32(data[i:i + self.SHINGLE])
+            b = h % size
+            h //= size
+            if bins[b] is None or h < bins[b]:
+                bins[b] = h
+
+        # fill empty bins from the next filled one, so sparse signatures still line up with each other
+        for i in range(size):
+            if bins[i] is None:
+                for offset in range(1, size):
+                    value = bins[(i + offset) % size]
+                    if value is not None:
+                        bins[i] = value + offset # keep borrowed values distinct from real ones
+                        break
+
+        return tuple(bins)
+
+    def add(self, text: str, recent: bool = False) -> Optional[int]:
+        """
+        Adds a text to the index. Returns its id, or None if it is too short to be indexed
+        """
+        text = self.normalize(text)
+        if text in self._keys:
+            return self._keys[text]
+
+        sig = self.signature(text)
+        if sig is None:
+            return None
+
+        id = self._next_id
+        self._next_id += 1
+        self._signatures[id] = sig
+        self._keys[text] = id
+        for band, key in zip(self._bands, self._band_keys(sig)):
+            # buckets are replaced rather than changed, so a similarity check on a scanner thread never sees one change under it
+            band[key] = band.get(key, frozenset()) | {id}
+
+        self.version += 1
+
+        if recent:
+            self._recent.append((id, text))
+            if len(self._recent) > self._recent_size:
+                old, old_text = self._recent.popleft()
+                self._remove(old, old_text)
+
+        return id
+
+    def remember(self, text: str) -> None:
+        """
+        Adds a flagged message to the bounded set of recent messages
+        """
+        self.add(text, recent=True)
+
+    def remove(self, text: str) -> bool:
+        text = self.normalize(text)
+        id = self._keys.get(text)
+        if id is None:
+            return False
+
+        self._remove(id, text)
+        return True
+
+    def _remove(self, id: int, text: str) -> None:
+        sig = self._signatures.pop(id, None)
+        if sig is None:
+            return
+
+        if self._keys.get(text) == id:
+            del self._keys[text]
+
+        for band, key in zip(self._bands, self._band_keys(sig)):
+            ids = band.get(key)
+            if ids is not None:
+                ids = ids - {id}
+                if ids:
+                    band[key] = ids
+                else:
+                    del band[key]
+
+        self.version += 1
+
+    def _band_keys(self, sig: Tuple[int, ...]):
+        rows = self._rows
+        return [sig[i:i + rows] for i in range(0, self.PERMUTATIONS, rows)]
+
+    def similarity(self, text: str) -> float:
+        """
+        Returns the estimated similarity of the text to the closest indexed text, or 0 if there are no close ones
+        """
+        sig = self.signature(self.normalize(text))
+        if sig is None:
+            return 0.0
+
+        candidates = set()
+        for band, key in zip(self._bands, self._band_keys(sig)):
+            ids = band.get(key)
+            if ids:
+                candidates.update(ids)
+
+        best = 0
+        for id in candidates:
+            other = self._signatures.get(id)
+            if other is None:
+                continue # removed since the candidates were collected
+
+            same = sum(1 for a, b in zip(sig, other) if a == b)
+            if same > best:
+                best = same
+
+        return best / self.PERMUTATIONS
+
+    def is_similar(self, text: str, threshold: float) -> bool:
+        return self.similarity(text) >= threshold
+
+
+def extract_hosts(text: str) -> Iterator[str]:
+    """
+    Yields the lowercased host of every url or bare domain in the text, in one pass over it
+    """
+    for match in _host.finditer(text):
+        yield match.group(1).lower()
+
+
+class DomainIndex:
+    """
+    A set of blacklisted domains, which also matches their subdomains.
+    A host is checked by looking up each of its suffixes, so ``evil.example.com`` is caught by ``example.com``.
+    """
+    def __init__(self, domains=()):
+        # replaced rather than changed, so a search on a scanner thread never sees it change under it
+        self._domains = frozenset(domain.lower().strip(".") for domain in domains)
+        self.version = 0
+
+    def __len__(self):
+        return len(self._domains)
+
+    def __iter__(self):
+        return iter(self._domains)
+
+    def __contains__(self, domain: str):
+        return domain.lower().strip(".") in self._domains
+
+    def add(self, domain: str) -> None:
+        self._domains = self._domains | {domain.lower().strip(".")}
+        self.version += 1
+
+    def remove(self, domain: str) -> None:
+        self._domains = self._domains - {domain.lower().strip(".")}
+        self.version += 1
+
+    def match(self, host: str) -> Optional[str]:
+        """
+        Returns the blacklisted domain the host falls under, if any
+        """
+        domains = self._domains
+        if not domains:
+            return None
+
+        host = host.lower().strip(".")
+        while True:
+            if host in domains:
+                return host
+
+            dot = host.find(".")
+            if dot == -1:
+                return None
+
+            host = host[dot + 1:]
+
+    def search(self, text: str) -> Optional[str]:
+        """
+        Returns the first blacklisted domain found in the text, if any
+        """
+        if not self._domains:
+            return None
+
+        for host in extract_hosts(text):
+            domain = self.match(host)
+            if domain is not None:
+                return domain
+
+        return None
+
+
+class CheckStats:
+    __slots__ = ("calls", "hits", "elapsed")
+
+    def __init__(self):
+        self.calls = 0
+        self.hits = 0
+        self.elapsed = 0.0
+
+    @property
+    def average(self) -> float:
+        """
+        The average time this check takes, in milliseconds
+        """
+        return self.elapsed / self.calls * 1000 if self.calls else 0.0
+
+
+class Pipeline:
+    """
+    Runs a fixed list of automod checks against a message, in order, until one of them flags it.
+    Each check is a coroutine function that returns True when it has acted on the message.
+    Everything passed to :meth:`run` is passed on to every check, such as the message and its :class:`MessageScan`.
+    Checks should be ordered from cheapest to most expensive.
+
+    A check can come with a recorder, given as ``(name, check, record)``. Recorders feed rate trackers,
+    so they run for every message, even one an earlier check already flagged, and the check is passed what its recorder returned.
+    Otherwise a raid caught by an earlier check would never be counted by the trackers.
+
+    Stats are kept per check name, so they survive the pipeline being recompiled when settings change.
+    """
+    def __init__(self, checks: List[tuple], stats: Dict[str, CheckStats] = None):
+        self.checks = [(entry[0], entry[1], entry[2] if len(entry) > 2 else None) for entry in checks]
+        self.stats = stats if stats is not None else {}
+        for name, _, _ in self.checks:
+            self.stats.setdefault(name, CheckStats())
+
+    def __bool__(self):
+        return bool(self.checks)
+
+    async def run(self, *args) -> Optional[str]:
+        """
+        Returns the name of the check that flagged the message, if any
+        """
+        recorded = {}
+        for name, _, record in self.checks:
+            if record is not None:
+                start = time.perf_counter()
+                recorded[name] = record(*args)
+                self.stats[name].elapsed += time.perf_counter() - start
+
+        for name, check, record in self.checks:
+            stats = self.stats[name]
+            start = time.perf_counter()
+            try:
+                if record is None:
+                    hit = await check(*args)
+                else:
+                    hit = await check(*args, recorded[name])
+            finally:
+                stats.elapsed += time.perf_counter() - start
+                stats.calls += 1
+
+            if hit:
+                stats.hits += 1
+                return name
+
+        return None
+
+
+class _Ring:
+    __slots__ = ("times", "items", "index", "filled")
+
+    def __init__(self, size: int):
+        self.times = [0.0] * size
+        self.items = [None] * size
+        self.index = -1
+        self.filled = 0
+
+
+class SpamTracker:
+    """
+    Counts messages per key (a user in a channel) over sliding windows.
+    Each key keeps a ring of its last ``n`` message times, where ``n`` is the largest window count,
+    so recording a message and checking every window is constant time.
+    An item, such as the message id, can be kept alongside each time.
+
+    At most ``capacity`` keys are tracked, and keys that have been quiet for longer than the longest window are dropped.
+    """
+    def __init__(self, windows: List[Tuple[int, float]], capacity: int = 10000):
+        self.windows = sorted(windows, key=lambda w: w[1])
+        self.size = max(count for count, _ in windows)
+        self._rings = LRUCache(capacity=capacity, ttl=max(seconds for _, seconds in windows))
+
+    def __len__(self):
+        return len(self._rings)
+
+    def update(self, key: Hashable, item=None, now: float = None) -> Optional[Tuple[int, float, list]]:
+        """
+        Records a message for the key.
+        Returns the ``(count, seconds, items)`` window it broke, if any, and starts counting the key again from zero.
+        ``items`` holds the items recorded with every message in the window, oldest first
+        """
+        if now is None:
+            now = time.monotonic()
+
+        ring = self._rings.get(key)
+        if ring is None:
+            ring = self._rings[key] = _Ring(self.size)
+
+        ring.index = (ring.index + 1) % self.size
+        ring.times[ring.index] = now
+        ring.items[ring.index] = item
+        if ring.filled < self.size:
+            ring.filled += 1
+
+        for count, seconds in self.windows:
+            if ring.filled >= count and now - ring.times[(ring.index - count + 1) % self.size] <= seconds:
+                self._rings.pop(key)
+                items = [ring.items[(ring.index - i) % self.size] for i in range(count - 1, -1, -1)]
+                return count, seconds, items
+
+        return None
+
+    def reset(self, key: Hashable) -> None:
+        self._rings.pop(key)
+
+
+class _FloodWindow:
+    __slots__ = ("entries", "users", "flagged")
+
+    def __init__(self, size: int):
+        self.entries = collections.deque(maxlen=size) # (time, fingerprint, user)
+        self.users = {} # fingerprint -> {user: copies in the window}
+        self.flagged = set()
+
+
+class FloodDetector:
+    """
+    Catches the same line being posted by many accounts at once, such as during a raid.
+    Each channel keeps a window of recent message fingerprints, and how many distinct users sent each of them,
+    so recording a message and checking it is constant time (amortized over the messages leaving the window).
+
+    Fingerprints are hashes of the message with case, punctuation and spacing stripped, so small variations still collide.
+    """
+    MIN_LENGTH = 10 # short lines like "gg" or "lol" are repeated by everyone, and aren't worth fingerprinting
+
+    def __init__(self, count: int, seconds: float, size: int = 500, channels: int = 1000):
+        self.count = count
+        self.seconds = seconds
+        self.size = size
+        self._windows = LRUCache(capacity=channels, ttl=seconds)
+
+    @classmethod
+    def fingerprint(cls, text: str) -> Optional[int]:
+        text = _non_word.sub("", text.lower())
+        if len(text) < cls.MIN_LENGTH:
+            return None
+
+        return zlib.crc32(text.encode("utf8"))
+
+    def update(self, channel: Hashable, user: Hashable, text: str, now: float = None) -> List[Hashable]:
+        """
+        Records a message. Once ``count`` distinct users have sent the same line within ``seconds``,
+        returns every one of them. After that, each user who repeats the line is returned on their own,
+        until it leaves the window. Returns an empty list otherwise
+        """
+        fp = self.fingerprint(text)
+        if fp is None:
+            return []
+
+        if now is None:
+            now = time.monotonic()
+
+        window = self._windows.get(channel)
+        if window is None:
+            window = self._windows[channel] = _FloodWindow(self.size)
+
+        entries, users = window.entries, window.users
+        while entries and (len(entries) == entries.maxlen or now - entries[0][0] > self.seconds):
+            _, old_fp, old_user = entries.popleft()
+            senders = users[old_fp]
+            senders[old_user] -= 1
+            if not senders[old_user]:
+                del senders[old_user]
+                if not senders:
+                    del users[old_fp]
+                    window.flagged.discard(old_fp)
+
+        entries.append((now, fp, user))
+        senders = users.setdefault(fp, {})
+        senders[user] = senders.get(user, 0) + 1
+
+        if fp in window.flagged:
+            return [user]
+
+        if len(senders) >= self.count:
+            window.flagged.add(fp)
+            return list(senders)
+
+        return []
+
+
+class ScanResult:
+    """
+    Everything automod found in a message's content
+    """
+    __slots__ = ("discord_word", "twitch_word", "pasta", "similarity", "ad", "pastas")
+
+    def __init__(self, discord_word=None, twitch_word=None, pasta=None, similarity=0.0, ad=None, pastas=None):
+        self.discord_word = discord_word
+        self.twitch_word = twitch_word
+        self.pasta = pasta
+        self.similarity = similarity
+        self.ad = ad
+        self.pastas = pastas # the state of the pasta index the similarity was found against
+
+
+class _ScanJob:
+    __slots__ = ("text", "cached", "pastas", "submitted", "started", "finished")
+
+    def __init__(self, text: str, cached: Optional[ScanResult], pastas: tuple):
+        self.text = text
+        self.cached = cached # a result whose words and ads are still good, so only the similarity is found again
+        self.pastas = pastas
+        self.submitted = time.perf_counter()
+        self.started = None
+        self.finished = None
+
+
+class Scanner:
+    """
+    Runs every content based check against a message in one go, under a time budget.
+
+    Every scan runs on a small dedicated pool, so a slow scan can never block the event loop,
+    and is abandoned once it takes longer than ``budget`` seconds.
+    An abandoned scan fails open: the message is let through, and the timeout is counted.
+    A scan that ran out of time while matching is remembered as failed for ``failed_ttl`` seconds,
+    so the text that caused it can't tie up another worker. One that ran out of time waiting for a worker isn't,
+    as that wasn't the text's fault. Time spent waiting for a worker and time spent matching are counted apart.
+
+    The matcher, pasta index and domain index only ever swap in new data, never change it in place,
+    so scans can read them while the loop changes them.
+    Results are cached by content, and scans of the same text at the same time share one scan,
+    so the same message being spammed is only scanned once.
+    Flagged messages are added to the pasta index all the time, so a change there only finds the similarity again,
+    while the words and ads found are kept.
+    """
+    def __init__(self, system, budget: float = 0.05, workers: int = 2, cache_size: int = 1024, failed_ttl: float = 60):
+        self.system = system
+        self.budget = budget
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="xlydn-automod")
+        self._cache = LRUCache(capacity=cache_size)
+        self._failed = LRUCache(capacity=cache_size, ttl=failed_ttl)
+        self._inflight = {} # text -> the scan running for it
+        self._state = None
+        self.scans = 0
+        self.cache_hits = 0
+        self.timeouts = 0
+        self.queue_timeouts = 0
+        self.errors = 0
+        self.queued = 0.0 # seconds spent waiting for a worker
+        self.matching = 0.0 # seconds spent scanning
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "scans": self.scans,
+            "cache hits": self.cache_hits,
+            "timeouts": self.timeouts,
+            "queue timeouts": self.queue_timeouts,
+            "errors": self.errors,
+            "queued": self.queued,
+            "matching": self.matching
+        }
+
+    def clear(self) -> None:
+        """
+        Forgets every cached result
+        """
+        self._cache = LRUCache(capacity=self._cache.capacity)
+        self._failed = LRUCache(capacity=self._failed.capacity, ttl=self._failed.ttl)
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False)
+
+    def prepare(self, text: str) -> "MessageScan":
+        """
+        Returns the scan of one message, to be handed to every check that needs it
+        """
+        return MessageScan(self, text)
+
+    def _scan(self, job: _ScanJob) -> ScanResult:
+        job.started = time.perf_counter()
+        text = job.text
+        result = job.cached
+        if result is None:
+            result = ScanResult()
+            for _, _, term in self.system.automod_matcher.iter_matches(text):
+                if term.kind == PASTA:
+                    result.pasta = result.pasta or term
+
+                else:
+                    if term.discord:
+                        result.discord_word = result.discord_word or term
+
+                    if term.twitch:
+                        result.twitch_word = result.twitch_word or term
+
+            invite = invites.search(text)
+            result.ad = invite.group(0) if invite else self.system.automod_domains.search(text)
+        else:
+            result = ScanResult(result.discord_word, result.twitch_word, result.pasta, 0.0, result.ad)
+
+        if result.pasta is None:
+            result.similarity = self.system.automod_pastas.similarity(text)
+
+        result.pastas = job.pastas
+        job.finished = time.perf_counter()
+        return result
+
+    async def scan(self, text: str) -> Optional[ScanResult]:
+        """
+        Scans the text, returning None if the scan failed or ran out of time
+        """
+        domains, pastas = self.system.automod_domains, self.system.automod_pastas
+        state = (self.system.automod_matcher.version, id(domains), domains.version)
+        if state != self._state:
+            # the word or domain lists have changed since these results were cached
+            self.clear()
+            self._state = state
+
+        pastas = (id(pastas), pastas.version)
+        result = self._cache.get(text)
+        if result is not None and (result.pastas == pastas or result.pasta is not None):
+            self.cache_hits += 1
+            return result
+
+        if text in self._failed:
+            self.cache_hits += 1
+            return None
+
+        key = (state, text)
+        flight = self._inflight.get(key)
+        if flight is None:
+            flight = self._inflight[key] = asyncio.ensure_future(self._run(_ScanJob(text, result, pastas), state))
+            flight.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.cache_hits += 1
+
+        return await asyncio.shield(flight)
+
+    async def _run(self, job: _ScanJob, state: tuple) -> Optional[ScanResult]:
+        self.scans += 1
+        try:
+            loop = asyncio.get_event_loop()
+            result = await asyncio.wait_for(loop.run_in_executor(self.executor, self._scan, job), self.budget)
+
+        except asyncio.TimeoutError:
+            now = time.perf_counter()
+            if job.started is None:
+                # never got a worker, so it was cancelled before it started
+                self.queue_timeouts += 1
+                self.queued += now - job.submitted
+            else:
+                # still running, and can't be stopped, so don't let this text start another one
+                self.timeouts += 1
+                self.queued += job.started - job.submitted
+                self.matching += now - job.started
+                if state == self._state:
+                    self._failed[job.text] = True
+
+            return None
+
+        except Exception:
+            self.errors += 1
+            return None
+
+        self.queued += job.started - job.submitted
+        self.matching += job.finished - job.started
+        if state == self._state:
+            self._cache[job.text] = result
+
+        return result
+
+
+class MessageScan:
+    """
+    The scan of one message, shared by every check of a pipeline run.
+    The scan only happens once a check asks for it, so messages flagged by cheaper checks are never scanned
+    """
+    __slots__ = ("scanner", "text", "_result")
+
+    def __init__(self, scanner: Scanner, text: str):
+        self.scanner = scanner
+        self.text = text
+        self._result = _missing
+
+    async def result(self) -> Optional[ScanResult]:
+        if self._result is _missing:
+            self._result = await self.scanner.scan(self.text)
+
+        return self._result
@@ -14,9 +14,8 @@ import random
 import sys
 import traceback
 import gzip
-import re
 from concurrent.futures import CancelledError
-from typing import Optional
+from typing import Dict, Optional, Union
 
 import aiohttp
 import discord
@@ -31,12 +30,13 @@ from discord.ext.commands.view import StringView
 from twitchio.ext import commands as tio_commands
 
 from interface.main2 import Window as Interface
-from . import api, errors, common, locale, websocket
+from . import api, automod, cache, errors, common, currency, leaderboard, locale, scheduler, websocket
 from .contexts import CompatContext, TwitchContext
 from .db import Database
 from .commands import CommandWithLocale, GroupWithLocale
 from .cooldowns import CooldownMapping
 from addons.scripting import handlers
+from addons.common import copypasta
 
 logger = logging.getLogger("xlydn")
 logger.setLevel(logging.DEBUG)
@@ -46,6 +46,15 @@ logger.addHandler(hdl)
 
 logging.getLogger("aiosqlite3").addHandler(logging.NullHandler(100)) # aiosqlite warnings are annoying and useless
 
+BULK_CHUNK_SIZE = 500 # keeps IN (...) queries under sqlite's bound parameter limit
+
+# create_user keyword -> (accounts column, User attribute, UserCache lookup)
+IDENTITIES = {
+    "discord_id": ("discord_id", "discord_id", "get_discord"),
+    "twitch_id": ("twitch_userid", "twitch_id", "get_twitch_id"),
+    "twitch_username": ("twitch_username", "twitch_name", "get_twitch_name")
+}
+
 discord_log = logging.getLogger("xlydn.discord")
 twitch_bot_log = logging.getLogger("xlydn.twitchBot")
 twitch_streamer_log = logging.getLogger("xlydn.twitchStreamer")
@@ -68,16 +77,32 @@ class System:
         self.streamer_run_event = asyncio.Event()
         self.discord_run_event = asyncio.Event()
 
-        self.user_cache = {}
+        self.user_cache = cache.UserCache(
+            capacity=self.config.getint("cache", "user_capacity", fallback=20000),
+            ttl=self.config.getint("cache", "user_ttl", fallback=3600)
+        )
+        self.flights = cache.SingleFlight()
+        self.create_lock = asyncio.Lock() # held while accounts are created, so one person can't get two
+        self.points = currency.PointsAccumulator(self, self.config.getfloat("currency", "points_flush_interval", fallback=10))
+        self.watch_time = currency.WatchTimeTracker(self, self.config.getint("currency", "watch_time_interval", fallback=300))
+        self.leaderboard = leaderboard.Leaderboard(self)
+        if not ci:
+            self.points.start()
+            self.watch_time.start()
+            self.leaderboard.start()
 
         self.solo_timer_cache = {}
         self.chain_timer_cache = {}
         self.timer_loop_cache = {}
+        self.chat_timers = common.ChatTimerEngine(self)
 
         if not ci:
             self.timer_task = self.loop.create_task(self.timer_loop())
         self.command_cache = {}
-        self.timer_cache = [] # note that this isnt for "timers". this is for delayed events
+        self.commands_loaded = False
+        if not ci:
+            self.loop.create_task(self.load_commands())
+        self.timers = scheduler.TimerScheduler() # note that this isnt for chat "timers". this is for delayed events
         self.oauth_waiting = {}
 
         self.locale = locale.LocaleTranslator(config)
@@ -96,12 +121,14 @@ class System:
         self.pump_task = None
         self.connecting_count = 0
 
-        self.twitch_automod_regex = None
-        self.discord_automod_regex = None
-        self.automod_domains = []
+        self.automod_matcher = automod.LiveMatcher() # banned words and copypastas, shared by both platforms
+        self.automod_pastas = automod.PastaIndex() # near duplicates of copypastas
+        self.automod_domains = automod.DomainIndex()
+        self.automod_scanner = automod.Scanner(self, budget=config.getint("moderation", "automod_time_budget", fallback=50) / 1000)
 
         if not ci:
-            self.loop.create_task(self.build_automod_regex())
+            self.loop.create_task(self.build_automod())
+            self.loop.create_task(self.build_automod_pastas())
 
         pth = pathlib.Path(window.get_data_location(), "services", ".dfuuid.lock")
         if pth.exists():
@@ -210,7 +237,7 @@ class System:
         discord_id = int(resp['id'])
         for connection in resp['connections']:
             if connection['type'] == "twitch":
-                twitchname = connection['name']
+                twitchname = connection['name'].lower()
                 twitchid = int(connection['id'])
 
         if twitchname is None:
@@ -225,40 +252,71 @@ class System:
 
         if twitchuser is None:
             # quite simple, just put the twitch details in the same row
-            await self.db.execute("UPDATE accounts SET twitch_userid = ? AND twitch_username = ? WHERE id = ?",
+            await self.db.execute("UPDATE accounts SET twitch_userid = ?, twitch_username = ? WHERE id = ?",
                                     twitchid, twitchname, discorduser.id)
-            del self.user_cache[discorduser.id]
+            discorduser.twitch_id = twitchid
+            discorduser.twitch_name = twitchname
+            self.user_cache.reindex(discorduser)
             return True
 
         elif discorduser is None:
             # quite simple, just put the discord details in the same row
-            await self.db.execute("UPDATE accounts SET discord_id = ? WHERE twitch_userid = ?",
-                                  discord_id, twitchid)
-            del self.user_cache[twitchuser.id]
+            await self.db.execute("UPDATE accounts SET discord_id = ? WHERE id = ?",
+                                  discord_id, twitchuser.id)
+            twitchuser.discord_id = discord_id
+            self.user_cache.reindex(twitchuser)
             return True
 
         else:
-            points = twitchuser.points + discorduser.points
             editor = twitchuser.editor or discorduser.editor
-            await self.db.execute("UPDATE accounts SET points = ? AND hours = ? AND editor = ? AND twitch_userid = ? AND twitch_username = ? WHERE id = ?",
-                                  points, twitchuser.editor, int(editor), twitchid, twitchname, discorduser.id)
-            await self.db.execute("DELETE FROM accounts WHERE id = ?", twitchuser.id)
-            del self.user_cache[twitchuser.id]
-            del self.user_cache[discorduser.id]
+            # the rows are merged relative to what is stored, so points that haven't been written yet stay with the
+            # accumulator. Holding it keeps a batch from landing on the twitch row between the merge and the delete
+            async with self.points.hold():
+                async with self.db.transaction() as conn:
+                    await conn.execute("UPDATE accounts SET points = points + (SELECT points FROM accounts WHERE id = ?), "
+                                       "hours = hours + (SELECT hours FROM accounts WHERE id = ?), "
+                                       "editor = ?, twitch_userid = ?, twitch_username = ? WHERE id = ?",
+                                       (twitchuser.id, twitchuser.id, int(editor), twitchid, twitchname, discorduser.id))
+                    await conn.execute("DELETE FROM accounts WHERE id = ?", (twitchuser.id,))
+
+                # no awaits between moving the unwritten points and summing the totals, which already include them
+                self.points.move(twitchuser.id, discorduser.id)
+                discorduser.points += twitchuser.points
+                discorduser.hours += twitchuser.hours
+
+            self.user_cache.remove(twitchuser.id)
+            self.leaderboard.remove(twitchuser.id)
+            self.leaderboard.update(discorduser.id, discorduser.points)
+            discorduser.editor = editor
+            discorduser.twitch_id = twitchid
+            discorduser.twitch_name = twitchname
+            self.user_cache.reindex(discorduser)
             return True
 
-    async def get_command(self, name) -> common.CustomCommand:
-        if name in self.command_cache:
-            return self.command_cache[name]
+    async def _load_commands(self):
+        rows = await self.db.fetch("SELECT * FROM commands")
+        if rows is None:
+            return # the query failed, try again on the next lookup
 
-        row = await self.db.fetchrow("SELECT * FROM commands WHERE name = ?", name)
-        if row is None:
-            return None
+        self.command_cache = {row[0]: common.CustomCommand(row) for row in rows}
+        self.commands_loaded = True
 
-        self.command_cache[name] = resp = common.CustomCommand(row)
-        return resp
+    async def load_commands(self):
+        """
+        Loads every custom command into memory. After this, the command cache is authoritative,
+        so a name that isn't in it is known not to be a command without asking the database.
+        """
+        if not self.commands_loaded:
+            await self.flights.do("commands", self._load_commands)
+
+    async def get_command(self, name) -> common.CustomCommand:
+        if not self.commands_loaded:
+            await self.load_commands()
+
+        return self.command_cache.get(name)
 
     async def add_command(self, name: str, places: int, content: str, cooldown: int, limits: str, isscript: bool):
+        await self.load_commands()
         if name in self.command_cache:
             raise ValueError(self.locale("Command `{0}` already exists").format(name))
 
@@ -270,135 +328,299 @@ class System:
         except:
             raise ValueError(self.locale("Command `{0}` already exists").format(name))
 
+        self.command_cache[name] = common.CustomCommand((name, places, content, cooldown, limits, int(isscript)))
+
     async def remove_command(self, name: str):
+        await self.load_commands()
         if name not in self.command_cache:
-            if (await self.db.fetchrow("SELECT * FROM commands WHERE name = ?", name)) is None:
-                raise ValueError(self.locale("Command `{0}` does not exist").format(name))
+            raise ValueError(self.locale("Command `{0}` does not exist").format(name))
 
         await self.db.execute("DELETE FROM commands WHERE name = ?", name)
-        if name in self.command_cache:
-            del self.command_cache[name]
+        del self.command_cache[name]
 
     async def create_user(self, discord_id=None, twitch_id=None, twitch_username=None):
         userid = random.randint(10590208453, 90823972987079800) # yup, i did this.
         await self.db.execute("INSERT INTO accounts VALUES (?,?,?,?,0,0,0,'')", twitch_id, twitch_username, discord_id, userid)
-        resp = common.User((twitch_id, twitch_username, discord_id, userid, 0, 0, 0), self)
-        self.user_cache[resp.id] = resp
+        resp = common.User((twitch_id, twitch_username, discord_id, userid, 0, 0, 0, ''), self)
+        self.user_cache.add(resp)
+        self.leaderboard.update(userid, 0)
         return resp
 
-    async def get_user(self, id):
-        if id in self.user_cache:
-            return self.user_cache[id]
-
-        row = await self.db.fetchrow("SELECT * FROM accounts WHERE id = ?", id)
+    async def _fetch_user(self, column: str, value) -> Optional[common.User]:
+        row = await self.db.fetchrow(f"SELECT * FROM accounts WHERE {column} = ?", value)
         if row is None:
-            return None # rip
+            return None
 
-        self.user_cache[id] = resp = common.User(row, self)
+        resp = common.User(row, self)
+        self.points.apply(resp)
+        self.user_cache.add(resp)
         return resp
 
-    async def get_user_discord_id(self, id, create=True):
-        exists = discord.utils.get(self.user_cache.values(), discord_id=id)
+    async def _create_missing_user(self, fields: dict) -> common.User:
+        """
+        Creates the account for a user that wasn't found, unless a lookup by another of their identities
+        created it in the meantime. A lookup by twitch name and one by twitch id for the same new chatter
+        use different flights, so the check is made again under :attr:`create_lock`, against every identity we know.
+        """
+        known = {key: value for key, value in fields.items() if value is not None}
+        async with self.create_lock:
+            resp = None
+            for key, value in known.items():
+                resp = getattr(self.user_cache, IDENTITIES[key][2])(value)
+                if resp is not None:
+                    break
+
+            else:
+                clause = " OR ".join(f"{IDENTITIES[key][0]} = ?" for key in known)
+                row = await self.db.fetchrow(f"SELECT * FROM accounts WHERE {clause}", *known.values())
+                if row is not None:
+                    resp = common.User(row, self)
+                    self.points.apply(resp)
+
+            if resp is None:
+                return await self.create_user(**fields)
+
+            # fill in the identities the account doesn't have yet, and follow twitch renames
+            changes = {key: value for key, value in known.items() if getattr(resp, IDENTITIES[key][1]) is None}
+            if "twitch_username" in known and resp.twitch_id is not None and resp.twitch_id == known.get("twitch_id"):
+                if resp.twitch_name != known["twitch_username"]:
+                    changes["twitch_username"] = known["twitch_username"]
+
+            if changes:
+                await self.db.execute(f"UPDATE accounts SET {', '.join(f'{IDENTITIES[key][0]} = ?' for key in changes)} WHERE id = ?",
+                                      *changes.values(), resp.id)
+                for key, value in changes.items():
+                    setattr(resp, IDENTITIES[key][1], value)
+
+            self.user_cache.add(resp)
+            return resp
+
+    async def _get_user_by(self, column: str, value, cached, create: bool, **fields) -> Optional[common.User]:
+        """
+        Looks a user up by one of their identities. Concurrent lookups for the same identity share
+        one database query, and at most one account is created per person, see :meth:`_create_missing_user`.
+        """
+        exists = cached(value)
         if exists:
             return exists
 
-        row = await self.db.fetchrow("SELECT * FROM accounts WHERE discord_id = ?", id)
-        if row is None:
-            if not create:
-                return None
-
-            return await self.create_user(discord_id=id)
+        resp = await self.flights.do((column, value), self._fetch_user, column, value)
+        if resp is None and create:
+            resp = await self.flights.do(("create", column, value), self._create_missing_user, fields)
 
-        resp = common.User(row, self)
-        self.user_cache[resp.id] = resp
         return resp
 
-    async def get_user_twitch_id(self, id, create=True):
-        exists = discord.utils.get(self.user_cache.values(), twitch_id=id)
-        if exists:
-            return exists
+    async def get_user(self, id):
+        return await self._get_user_by("id", id, self.user_cache.get, create=False)
 
-        row = await self.db.fetchrow("SELECT * FROM accounts WHERE twitch_id = ?", id)
-        if row is None:
-            if not create:
-                return None
-            return self.create_user(twitch_id=id)
+    async def get_user_discord_id(self, id, create=True):
+        return await self._get_user_by("discord_id", id, self.user_cache.get_discord, create, discord_id=id)
 
-        resp = common.User(row, self)
-        self.user_cache[resp.id] = resp
-        return resp
+    async def get_user_twitch_id(self, id, create=True):
+        return await self._get_user_by("twitch_userid", id, self.user_cache.get_twitch_id, create, twitch_id=id)
 
     async def get_user_twitch_name(self, name, id=None, create=True) -> Optional[common.User]:
         name = name.lower()
-        exists = discord.utils.get(self.user_cache.values(), twitch_name=name)
-        if exists:
-            return exists
+        return await self._get_user_by("twitch_username", name, self.user_cache.get_twitch_name, create,
+                                       twitch_username=name, twitch_id=id)
 
-        row = await self.db.fetchrow("SELECT * FROM accounts WHERE twitch_name = ?", name)
-        if row is None:
-            if not create:
-                return None
+    async def get_users_bulk(self, twitch_names=(), discord_ids=(), create=True, write=None) -> Dict[Union[str, int], common.User]:
+        """
+        Resolves many users at once. Cached users are resolved locally, the rest are loaded with chunked
+        ``IN (...)`` queries, and any accounts that don't exist yet are created with a single executemany.
 
-            return await self.create_user(twitch_username=name, twitch_id=id)
+        ``write`` is an optional coroutine function, called as ``write(conn, users)`` inside the same transaction
+        as the account creation, so the new accounts and whatever is written to them are committed together.
 
-        resp = common.User(row, self)
-        self.user_cache[resp.id] = resp
-        return resp
+        Returns a dict mapping each lowercased twitch name and each discord id to its user.
+        """
+        result = {}
+        lookups = (
+            ("twitch_username", {name.lower() for name in twitch_names}, self.user_cache.get_twitch_name),
+            ("discord_id", set(discord_ids), self.user_cache.get_discord)
+        )
+
+        to_create = []
+        waiting = []
+        try:
+            for column, values, cached in lookups:
+                missing = []
+                for value in values:
+                    user = cached(value)
+                    if user is not None:
+                        result[value] = user
+                    else:
+                        missing.append(value)
+
+                for i in range(0, len(missing), BULK_CHUNK_SIZE):
+                    chunk = missing[i:i + BULK_CHUNK_SIZE]
+                    rows = await self.db.fetch(f"SELECT * FROM accounts WHERE {column} IN ({','.join('?' * len(chunk))})", *chunk)
+                    for row in rows or ():
+                        user = common.User(row, self)
+                        self.points.apply(user)
+                        self.user_cache.add(user)
+                        result[row[1] if column == "twitch_username" else row[2]] = user
+
+                if not create:
+                    continue
+
+                for value in missing:
+                    if value in result:
+                        continue
 
-    async def build_automod_regex(self):
-        words = await self.db.fetch("SELECT * FROM automod_words;")
-        urls = await self.db.fetch("SELECT * FROM automod_domains;")
-        self.automod_domains = [domain[0] for domain in urls]
-
-        twitch_banned_words = [word[0] for word in words if word[1]]
-        discord_banned_words = [word[0] for word in words if word[2]]
-
-        self.twitch_automod_regex = re.compile((
-                              r'(?i)'  # case insensitive
-                              r'\b'  # word bound
-                              r'(?:{})'  # non capturing group, to make sure that the word bound occurs before/after all words
-                              r'\b'
-                          ).format('|'.join(map(re.escape, twitch_banned_words))))
-
-        self.discord_automod_regex = re.compile((
-                              r'(?i)'  # case insensitive
-                              r'\b'  # word bound
-                              r'(?:{})'  # non capturing group, to make sure that the word bound occurs before/after all words
-                              r'\b'
-                          ).format('|'.join(map(re.escape, discord_banned_words))))
-
-    async def schedule_timer(self, fire_at: datetime.datetime, event: str, **kwargs):
-        d = {"fire": fire_at, "event": event, "data": kwargs}
-        await self.db.execute("INSERT INTO timers VALUES (?,?,?)", event, fire_at.timestamp(), gzip.compress(json.dumps(kwargs)))
-        id = await self.db.fetchval("SELECT id FROM timers WHERE fire_at=? AND event=?", fire_at.timestamp(), event)
-        d['id'] = id
-        self.timer_cache.append(d)
+                    user = cached(value) # may have been created by a single lookup while we were querying
+                    if user is not None:
+                        result[value] = user
+                        continue
+
+                    key = ("create", column, value)
+                    future = self.flights.lead(key)
+                    if future is None:
+                        waiting.append((value, self.flights.get(key))) # a single lookup is already creating this one
+                        continue
+
+                    userid = random.randint(10590208453, 90823972987079800)
+                    if column == "twitch_username":
+                        row = (None, value, None, userid, 0, 0, 0, '')
+                    else:
+                        row = (None, None, value, userid, 0, 0, 0, '')
+
+                    to_create.append((column, value, row, future))
+
+            # before taking the create lock, the single lookups we're waiting on need it too
+            for value, flight in waiting:
+                result[value] = await asyncio.shield(flight)
+
+            if to_create:
+                async with self.create_lock:
+                    # a single lookup by another identity may have created some of them since we looked
+                    to_create = await self._take_existing(to_create, result)
+                    try:
+                        async with self.db.transaction() as conn:
+                            if to_create:
+                                await conn.executemany("INSERT INTO accounts VALUES (?,?,?,?,?,?,?,?)", [row for _, _, row, _ in to_create])
+                                for _, value, row, _ in to_create:
+                                    result[value] = common.User(row, self)
+
+                            if write is not None:
+                                await write(conn, result)
+                    except Exception as e:
+                        for _, _, _, future in to_create:
+                            future.set_exception(e)
+                        raise
+
+                    for _, value, _, future in to_create:
+                        user = result[value]
+                        self.user_cache.add(user)
+                        self.leaderboard.update(user.id, 0)
+                        future.set_result(user)
+
+            elif write is not None:
+                async with self.db.transaction() as conn:
+                    await write(conn, result)
+        except BaseException:
+            # don't leave single lookups waiting on accounts that will never be created
+            for _, _, _, future in to_create:
+                if not future.done():
+                    future.cancel()
+            raise
+
+        return result
+
+    async def _take_existing(self, to_create: list, result: dict) -> list:
+        """
+        Resolves the accounts :meth:`get_users_bulk` was about to create that exist by now,
+        and returns the ones that still have to be created. Must be called under :attr:`create_lock`.
+        """
+        remaining = []
+        by_column = {}
+        for entry in to_create:
+            column, value, _, future = entry
+            user = getattr(self.user_cache, IDENTITIES[column][2])(value)
+            if user is not None:
+                result[value] = user
+                future.set_result(user)
+            else:
+                by_column.setdefault(column, []).append(entry)
+
+        for column, entries in by_column.items():
+            found = {}
+            values = [value for _, value, _, _ in entries]
+            for i in range(0, len(values), BULK_CHUNK_SIZE):
+                chunk = values[i:i + BULK_CHUNK_SIZE]
+                rows = await self.db.fetch(f"SELECT * FROM accounts WHERE {column} IN ({','.join('?' * len(chunk))})", *chunk)
+                for row in rows or ():
+                    user = common.User(row, self)
+                    self.points.apply(user)
+                    self.user_cache.add(user)
+                    found[row[1] if column == "twitch_username" else row[2]] = user
+
+            for entry in entries:
+                _, value, _, future = entry
+                user = found.get(value)
+                if user is None:
+                    remaining.append(entry)
+                else:
+                    result[value] = user
+                    future.set_result(user)
+
+        return remaining
+
+    async def build_automod(self):
+        words = await self.db.fetch("SELECT * FROM automod_words;") or []
+        urls = await self.db.fetch("SELECT * FROM automod_domains;") or []
+        pastas = await self.db.fetch("SELECT content FROM automod_pastas;") or []
+        self.automod_domains = automod.DomainIndex(domain[0] for domain in urls)
+
+        terms = [automod.Term(word[0], automod.WORD, bool(word[1]), bool(word[2])) for word in words]
+        terms += [automod.Term(pasta, automod.PASTA) for pasta in copypasta.pasta]
+        terms += [automod.Term(pasta[0], automod.PASTA) for pasta in pastas]
+        matcher = await self.loop.run_in_executor(None, automod.Matcher, terms)
+        self.automod_matcher.replace(matcher)
+
+    async def build_automod_pastas(self):
+        pastas = await self.db.fetch("SELECT content FROM automod_pastas;") or []
+        for pasta in copypasta.pasta:
+            self.automod_pastas.add(pasta)
+
+        for pasta in pastas:
+            self.automod_pastas.add(pasta[0])
+
+    async def schedule_timer(self, fire_at: datetime.datetime, event: str, **kwargs) -> int:
+        """
+        Schedules an event to be dispatched to the clients at the given time.
+        Returns the id of the timer, which can be passed to :meth:`cancel_timer`.
+        """
+        cursor = await self.db.execute("INSERT INTO timers (timer_type, fire_at, payload) VALUES (?,?,?)",
+                                       event, fire_at.timestamp(), gzip.compress(json.dumps(kwargs).encode()))
+        self.timers.add(cursor.lastrowid, fire_at.timestamp(), event, kwargs)
+        return cursor.lastrowid
+
+    async def cancel_timer(self, id: int) -> bool:
+        if self.timers.cancel(id) is None:
+            return False
+
+        await self.db.execute("DELETE FROM timers WHERE id = ?", id)
+        return True
 
     async def timer_loop(self):
         timers = await self.db.fetch("SELECT * FROM timers")
-        for timer in timers:
-            self.timer_cache.append({"id": timer['id'], "fire": datetime.datetime.fromtimestamp(timer[1]), "event": timer[2], "data": json.loads(gzip.decompress(timer[3]))})
+        for timer in timers or ():
+            self.timers.add(timer[0], timer[2], timer[1], json.loads(gzip.decompress(timer[3])))
 
         while self.alive:
-            await asyncio.sleep(0)
-            removal = []
-            now = datetime.datetime.now()
-            for timer in self.timer_cache:
-                if timer['fire'] <= now:
-                    if self.discord_bot.is_ready():
-                        self.discord_bot.dispatch(timer['event'], timer['data'])
-
-                    if self.streamer_run_event.is_set():
-                        self.twitch_streamer.dispatch(timer['event'], timer['data'])
+            due = await self.timers.wait()
+            for timer in due:
+                if self.discord_bot.is_ready():
+                    self.discord_bot.dispatch(timer['event'], timer['data'])
 
-                    if self.bot_run_event.is_set():
-                        self.twitch_bot.dispatch(timer['event'], timer['data'])
+                if self.streamer_run_event.is_set():
+                    self.twitch_streamer.dispatch(timer['event'], timer['data'])
 
-                    removal.append((timer['id'],))
+                if self.bot_run_event.is_set():
+                    self.twitch_bot.dispatch(timer['event'], timer['data'])
 
-            if removal:
-                await self.db.executemany("DELETE FROM timers WHERE id = ?", removal)
-                removal.clear()
+            await self.db.executemany("DELETE FROM timers WHERE id = ?", [(timer['id'],) for timer in due])
 
     def get_tio_prefix(self, *args):
         return self.config.get("general", "command_prefix", fallback="!")
@@ -539,6 +761,11 @@ class System:
 
         await self.twitch_bot.stop()
         await self.twitch_streamer.stop()
+        self.watch_time.stop()
+        self.leaderboard.stop()
+        await self.points.close()
+        await self.db.close()
+        self.automod_scanner.close()
 
         with pathlib.Path(Interface.get_data_location(), "config.ini").open("w", encoding="utf8") as f:
             self.config.write(f)
@@ -572,6 +799,9 @@ class discord_bot(commands.Bot):
         await super().start(*args, **kwargs)
 
     def dispatch(self, event_name, *args, **kwargs):
+        if event_name == "message" and not args[0].author.bot:
+            self.system.chat_timers.on_message(common.DISCORD)
+
         self.system.dispatch(event_name, *args, **kwargs, platform="discord")
         super(discord_bot, self).dispatch(event_name, *args, **kwargs)
 
@@ -798,9 +1028,20 @@ class twitch_bot(tio_commands.Bot, GroupMixin):
     def add_command(self, command):
         GroupMixin.add_command(self, command)
 
+    @property
+    def counts_lines(self) -> bool:
+        """
+        Whether this client counts chat lines for the timers. Both clients see every chat message,
+        so the bot counts them, unless it isn't connected, in which case the streamer does
+        """
+        return not self.streamer or not self.system.twitch_bot._ws.is_connected
+
     def dispatch(self, event, *args, **kwargs):
         self.loop.create_task(self._dispatch(event, *args, **kwargs))
         ev = 'event_' + event
+        if event == "message" and self.counts_lines:
+            self.system.chat_timers.on_message(common.TWITCH)
+
         self.system.dispatch(event, *args, **kwargs, platform="twitch")
         for evt in self.extra_listeners.get(ev, []):
             self.loop.create_task(evt(*args, **kwargs))
@@ -1,8 +1,12 @@
 """
 Licensed under the Open Software License version 3.0
 """
+import asyncio
+import collections
 import time
 
+_missing = object()
+
 class TimedCache(dict):
     def __init__(self, seconds: int)-> None:
         self._timeout = seconds
@@ -26,3 +30,224 @@ class TimedCache(dict):
     def __setitem__(self, key, value):
         super().__setitem__(key, (value, time.monotonic()))
 
+
+class LRUCache:
+    """
+    A dict-like cache that evicts the least recently used entries once it grows past ``capacity``,
+    and entries that haven't been used for ``ttl`` seconds.
+    Eviction only ever looks at the oldest entries, so it costs nothing when there is nothing to evict.
+    """
+    def __init__(self, capacity: int = None, ttl: float = None) -> None:
+        self.capacity = capacity
+        self.ttl = ttl
+        self._items = collections.OrderedDict() # key -> (value, last used)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "size": len(self._items),
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+    def _on_evict(self, key, value) -> None:
+        pass
+
+    def _evict(self, key) -> None:
+        value, _ = self._items.pop(key)
+        self.evictions += 1
+        self._on_evict(key, value)
+
+    def _expire(self, now: float) -> None:
+        while self._items:
+            key, (_, last_used) = next(iter(self._items.items()))
+            if self.capacity is not None and len(self._items) > self.capacity:
+                self._evict(key)
+            elif self.ttl is not None and now - last_used > self.ttl:
+                self._evict(key)
+            else:
+                break
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        item = self._items.get(key)
+        if item is not None and self.ttl is not None and now - item[1] > self.ttl:
+            self._evict(key)
+            item = None
+
+        if item is None:
+            self.misses += 1
+            return default
+
+        self.hits += 1
+        self._items[key] = (item[0], now)
+        self._items.move_to_end(key)
+        self._expire(now)
+        return item[0]
+
+    def pop(self, key, default=None):
+        item = self._items.pop(key, None)
+        return default if item is None else item[0]
+
+    def values(self):
+        return [value for value, _ in self._items.values()]
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __getitem__(self, key):
+        value = self.get(key, _missing)
+        if value is _missing:
+            raise KeyError(key)
+
+        return value
+
+    def __setitem__(self, key, value):
+        now = time.monotonic()
+        self._items[key] = (value, now)
+        self._items.move_to_end(key)
+        self._expire(now)
+
+    def __delitem__(self, key):
+        del self._items[key]
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(list(self._items))
+
+
+class UserCache(LRUCache):
+    """
+    Holds the loaded :class:`utils.common.User` objects, indexed by every identity a user can be looked up by.
+    Lookups by system id, discord id, twitch id and twitch name are all a single dict lookup.
+    None of the methods yield to the event loop, so all indexes change together, including on eviction.
+    Evicted users are simply loaded from the database again the next time they are looked up.
+    """
+    def __init__(self, capacity: int = None, ttl: float = None):
+        super().__init__(capacity, ttl)
+        self._keys = {} # system id -> the (discord_id, twitch_id, twitch_name) the user is currently indexed under
+        self._discord = {}
+        self._twitch_id = {}
+        self._twitch_name = {}
+
+    def _unindex(self, user):
+        discord_id, twitch_id, twitch_name = self._keys.pop(user.id)
+        if discord_id is not None and self._discord.get(discord_id) is user:
+            del self._discord[discord_id]
+
+        if twitch_id is not None and self._twitch_id.get(twitch_id) is user:
+            del self._twitch_id[twitch_id]
+
+        if twitch_name is not None and self._twitch_name.get(twitch_name) is user:
+            del self._twitch_name[twitch_name]
+
+    def _on_evict(self, key, user):
+        self._unindex(user)
+
+    def add(self, user):
+        """
+        Adds a user to the cache, or re-indexes it if its identities have changed
+        """
+        if user.id in self._items:
+            self._unindex(self._items[user.id][0])
+
+        twitch_name = user.twitch_name.lower() if user.twitch_name else None
+        self._keys[user.id] = (user.discord_id, user.twitch_id, twitch_name)
+        if user.discord_id is not None:
+            self._discord[user.discord_id] = user
+
+        if user.twitch_id is not None:
+            self._twitch_id[user.twitch_id] = user
+
+        if twitch_name is not None:
+            self._twitch_name[twitch_name] = user
+
+        super().__setitem__(user.id, user)
+
+    reindex = add
+
+    def remove(self, id):
+        if id not in self._items:
+            return None
+
+        user = self.pop(id)
+        self._unindex(user)
+        return user
+
+    def _get_indexed(self, index, key):
+        user = index.get(key)
+        if user is None:
+            self.misses += 1
+            return None
+
+        return self.get(user.id)
+
+    def get_discord(self, discord_id):
+        return self._get_indexed(self._discord, discord_id)
+
+    def get_twitch_id(self, twitch_id):
+        return self._get_indexed(self._twitch_id, twitch_id)
+
+    def get_twitch_name(self, name):
+        return self._get_indexed(self._twitch_name, name.lower())
+
+    def __setitem__(self, id, user):
+        assert id == user.id
+        self.add(user)
+
+    def __delitem__(self, id):
+        if self.remove(id) is None:
+            raise KeyError(id)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key, so the work behind them only happens once.
+    Every caller that arrives while a call for the key is running awaits that call's result.
+    Cancelling one caller does not cancel the call for the others.
+    """
+    def __init__(self):
+        self._flights = {}
+
+    def __contains__(self, key):
+        return key in self._flights
+
+    def get(self, key):
+        """
+        Returns the future of the call running for a key, if there is one.
+        """
+        return self._flights.get(key)
+
+    def _add(self, key, future):
+        self._flights[key] = future
+        future.add_done_callback(lambda f: self._flights.pop(key, None))
+
+    def lead(self, key):
+        """
+        Claims a key for work that is done outside of :meth:`do`, such as one batch covering many keys.
+        Returns a future that must be resolved with the key's result,
+        or None if a call for the key is already running.
+        """
+        if key in self._flights:
+            return None
+
+        future = asyncio.get_event_loop().create_future()
+        # nobody may be waiting on this key, so don't let an unretrieved exception get logged
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._add(key, future)
+        return future
+
+    async def do(self, key, func, *args, **kwargs):
+        task = self._flights.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func(*args, **kwargs))
+            self._add(key, task)
+
+        return await asyncio.shield(task)
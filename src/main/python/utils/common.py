@@ -5,6 +5,7 @@ import json
 import typing
 import time
 import asyncio
+import heapq
 
 import discord
 import discord.utils
@@ -185,39 +186,135 @@ class User:
         amount: :class:`int`
             The amount of points to add to the user
         """
-        await self._system.db.execute("UPDATE accounts SET points = ? + points WHERE id = ?", int(amount), self.id)
+        self._system.points.add(self, amount) # written to the database in the next batch
 
 
-class LineBucket:
-    def __init__(self, trigger, shared=False):
-        self.shared = shared
-        self._trigger = trigger
-        if shared:
-            self.value = 0
-        else:
-            self.value = [0, 0]
+TWITCH = 0
+DISCORD = 1
+SHARED = 2 # lines counted across both platforms
+MIN_TIMER_DELAY = 1 # seconds. A timer with no delay and no minimum lines would otherwise fire in a loop that never sleeps
 
-    def inc(self, where: int, val=1):
-        if self.shared:
-            self.value += val
-            if self.value >= self._trigger:
-                return True
 
-            return False
+class _ChatTimerEntry:
+    __slots__ = ("owner", "platform", "counter", "last_sent", "line_mark", "active")
+
+    def __init__(self, owner, platform: int, counter: int):
+        self.owner = owner
+        self.platform = platform
+        self.counter = counter
+        self.last_sent = time.time()
+        self.line_mark = 0
+        self.active = True
+
+    def __lt__(self, other):
+        return id(self) < id(other)
+
 
+class ChatTimerEngine:
+    """
+    Runs every chat timer from one task.
+    A timer fires once both its delay has passed and at least ``minlines`` messages have been sent since it last fired.
+
+    Timers waiting on their delay sit in a heap ordered by the time they become ready, and the task sleeps until the first one is.
+    Timers whose delay has passed sit in a heap ordered by the line count they are waiting for,
+    so handling a message is a counter increment and a peek, no matter how many timers exist.
+    """
+    def __init__(self, system):
+        self.system = system
+        self.lines = [0, 0, 0]
+        self._entries = {}
+        self._waiting_time = [] # (ready_at, entry)
+        self._waiting_lines = ([], [], []) # per counter: (line target, entry)
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def add(self, owner) -> None:
+        """
+        Starts running a timer. The owner must have ``place``, ``delay``, ``minlines``, ``shared`` and ``channel``
+        attributes, and a ``next_content(platform)`` method
+        """
+        self.remove(owner)
+        entries = []
+        if owner.place in (0, 2):
+            entries.append(_ChatTimerEntry(owner, TWITCH, SHARED if owner.shared else TWITCH))
+
+        if owner.place in (1, 2) and owner.channel is not None:
+            entries.append(_ChatTimerEntry(owner, DISCORD, SHARED if owner.shared else DISCORD))
+
+        self._entries[owner] = entries
+        for entry in entries:
+            entry.line_mark = self.lines[entry.counter]
+            self._wait_for_time(entry)
+
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_event_loop().create_task(self._run())
+
+    def remove(self, owner) -> None:
+        for entry in self._entries.pop(owner, ()):
+            entry.active = False # dropped lazily, when it reaches the top of its heap
+
+    def on_message(self, platform: int) -> None:
+        self.lines[platform] += 1
+        self.lines[SHARED] += 1
+        self._check_lines(platform)
+        self._check_lines(SHARED)
+
+    def _wait_for_time(self, entry: _ChatTimerEntry) -> None:
+        ready_at = entry.last_sent + max(entry.owner.delay or 0, MIN_TIMER_DELAY)
+        heapq.heappush(self._waiting_time, (ready_at, entry))
+        if self._waiting_time[0][1] is entry:
+            self._wakeup.set()
+
+    def _wait_for_lines(self, entry: _ChatTimerEntry) -> None:
+        target = entry.line_mark + (entry.owner.minlines or 0)
+        if self.lines[entry.counter] >= target:
+            self._fire(entry)
         else:
-            self.value[where] += 1
-            if self.value[where] > self._trigger:
-                return True
+            heapq.heappush(self._waiting_lines[entry.counter], (target, entry))
+
+    def _check_lines(self, counter: int) -> None:
+        heap = self._waiting_lines[counter]
+        while heap and heap[0][0] <= self.lines[counter]:
+            _, entry = heapq.heappop(heap)
+            if entry.active:
+                self._fire(entry)
+
+    def _fire(self, entry: _ChatTimerEntry) -> None:
+        entry.last_sent = time.time()
+        entry.line_mark = self.lines[entry.counter]
+        self.system.loop.create_task(self._send(entry.owner, entry.platform))
+        self._wait_for_time(entry)
+
+    async def _send(self, owner, platform: int) -> None:
+        content = owner.next_content(platform)
+        if not content:
+            return
 
-    def triggered(self, where: int):
-        if self.shared:
-            return self.value >= self._trigger
+        try:
+            if platform == DISCORD:
+                chn = self.system.discord_bot.get_channel(owner.channel)
+            else:
+                chn = self.system.twitch_bot.get_channel(self.system.twitch_streamer._ws.nick)
+
+            await chn.send(content)
+        except:
+            pass
 
-        return self.value[where] >= self._trigger
+    async def _run(self) -> None:
+        while self._entries:
+            now = time.time()
+            while self._waiting_time and self._waiting_time[0][0] <= now:
+                _, entry = heapq.heappop(self._waiting_time)
+                if entry.active:
+                    self._wait_for_lines(entry)
+
+            self._wakeup.clear()
+            timeout = self._waiting_time[0][0] - now if self._waiting_time else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
 
-    def reset(self):
-        self.value = 0
 
 class TimerLoop:
     """
@@ -232,19 +329,13 @@ class TimerLoop:
         self.minlines = minlines
         self.channel = channel
         self.place = place
-        self._bucket = LineBucket(self.minlines)
-        self._task = None
+        self.shared = False
 
     def start_task(self):
-        self._task = asyncio.get_running_loop().create_task(self.send_loop())
+        self.system.chat_timers.add(self)
 
     def end_task(self):
-        if self._task is not None and not self._task.done():
-            self._task.cancel()
-
-    def __del__(self):
-        if self._task is not None and not self._task.done():
-            self._task.cancel()
+        self.system.chat_timers.remove(self)
 
     def add_timer(self, timer: "ChainTimer"):
         self.timers.append(timer)
@@ -259,49 +350,16 @@ class TimerLoop:
 
         self.timers.remove(timer)
 
-    async def send_loop(self):
-        last_discord_send = time.time()
-        last_twitch_send = time.time()
-        while True:
-            cur = time.time()
-
-            if self.place in [1, 2] and self.channel is not None \
-                    and cur - last_discord_send > self.delay \
-                    and self._bucket.triggered(1):
-                if len(self.timers) <= self.fire_index[1]:
-                    self.fire_index[1] = 0
-
-                chn = self.system.discord_bot.get_channel(self.channel)
-                try:
-                    await chn.send(self.timers[self.fire_index[1]].content)
-                except:
-                    pass
-
-            if self.place in [0, 2] and cur - last_twitch_send > self.delay and self._bucket.triggered(0):
-                chn = self.system.twitch_streamer._ws._nick
-                chn = self.system.twitch_bot.get_channel(chn)
-                if len(self.timers) <= self.fire_index[0]:
-                    self.fire_index[1] = 0
-
-                try:
-                    await chn.send(self.timers[self.fire_index[0]].content)
-                except:
-                    pass
-
-            await asyncio.sleep(0)
+    def next_content(self, platform: int):
+        if not self.timers:
+            return None
 
+        if len(self.timers) <= self.fire_index[platform] or self.fire_index[platform] < 0:
+            self.fire_index[platform] = 0
 
-    async def on_twitch_message(self, message):
-        if self.place is 1:
-            return
-
-        self._bucket.inc(0)
-
-    async def on_discord_message(self, message):
-        if self.place is 0:
-            return
-
-        self._bucket.inc(1)
+        content = self.timers[self.fire_index[platform]].content
+        self.fire_index[platform] += 1
+        return content
 
 class ChainTimer:
     def __init__(self, row, loop):
@@ -320,57 +378,15 @@ class SoloTimer:
         self.shared = bool(row[4])
         self.content = row[5]
         self.channel = row[6]
-        self._bucket = LineBucket(self.minlines)
-        self._task = None
-
-    async def _send_loop(self):
-        last_discord_send = time.time()
-        last_twitch_send = time.time()
-        while True:
-            cur = time.time()
-            if self.place in [1, 2] and self.channel is not None and cur - last_discord_send > self.delay and self._bucket.triggered(1):
-                chn = self.system.discord_bot.get_channel(self.channel)
-                try:
-                    await chn.send(self.content)
-                except:
-                    pass
-
-            if self.place in [0, 2] and cur - last_twitch_send > self.delay and self._bucket.triggered(0):
-                chn = self.system.twitch_streamer._ws._nick
-                chn = self.system.twitch_bot.get_channel(chn)
-                try:
-                    await chn.send(self.content)
-                except:
-                    pass
-
-            await asyncio.sleep(1)
 
+    def next_content(self, platform: int):
+        return self.content
 
     def start_loop(self):
-        if self._task is not None and not self._task.done():
-            self._task.cancel()
-
-        self._task = asyncio.get_running_loop().create_task(self._send_loop())
+        self.system.chat_timers.add(self)
 
     def stop_loop(self):
-        if self._task is not None:
-            self._task.cancel()
-
-    def __del__(self):
-        if self._task is not None and not self._task.done():
-            self._task.cancel()
-
-    async def on_twitch_message(self, message):
-        if self.place is 1:
-            return
-
-        self._bucket.inc(0)
-
-    async def on_discord_message(self, message):
-        if self.place is 0:
-            return
-
-        self._bucket.inc(1)
+        self.system.chat_timers.remove(self)
 
 
 class BucketType(Enum):
@@ -0,0 +1,197 @@
+"""
+Licensed under the Open Software License version 3.0
+"""
+import asyncio
+import contextlib
+import logging
+from typing import Dict
+
+logger = logging.getLogger("xlydn.currency")
+
+
+class PointsAccumulator:
+    """
+    Collects point changes in memory, and writes them to the database in one batch every ``interval`` seconds.
+    Cached users are updated straight away, and users loaded from the database have their unwritten changes
+    applied through :meth:`apply`, so balances shown to users are always current.
+    """
+    def __init__(self, system, interval: float = 10):
+        self.system = system
+        self.interval = interval
+        self._deltas: Dict[int, int] = {} # account id -> points not written yet
+        self._inflight: Dict[int, int] = {} # the batch currently being written
+        self._lock = asyncio.Lock()
+        self._task = None
+
+    def __len__(self):
+        return len(self._deltas)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_event_loop().create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+        await self.flush()
+
+    def add(self, user, amount: int) -> None:
+        amount = int(amount)
+        if not amount:
+            return
+
+        self._deltas[user.id] = self._deltas.get(user.id, 0) + amount
+        user.points += amount
+        self.system.leaderboard.update(user.id, user.points)
+
+    def pending(self, account_id: int) -> int:
+        """
+        The points the account has gained or lost that haven't been written yet
+        """
+        return self._deltas.get(account_id, 0) + self._inflight.get(account_id, 0)
+
+    def apply(self, user) -> None:
+        """
+        Adds any unwritten changes to a user that was just loaded from the database
+        """
+        user.points += self.pending(user.id)
+
+    @contextlib.asynccontextmanager
+    async def hold(self):
+        """
+        Keeps batches from being written while the block runs, so no write lands in the middle of it.
+        Changes are still collected, and written by the next flush after the block
+        """
+        async with self._lock:
+            yield
+
+    def move(self, old_id: int, new_id: int) -> None:
+        """
+        Moves unwritten changes from one account to another, for when accounts are merged
+        """
+        amount = self._deltas.pop(old_id, 0)
+        if amount:
+            self._deltas[new_id] = self._deltas.get(new_id, 0) + amount
+
+    async def flush(self) -> None:
+        """
+        Writes every pending change to the database
+        """
+        async with self._lock:
+            if not self._deltas:
+                return
+
+            self._inflight, self._deltas = self._deltas, {}
+            try:
+                await self.system.db.executemany("UPDATE accounts SET points = points + ? WHERE id = ?",
+                                                 [(amount, id) for id, amount in self._inflight.items() if amount])
+            except:
+                # put them back, to be tried again on the next flush
+                for id, amount in self._inflight.items():
+                    self._deltas[id] = self._deltas.get(id, 0) + amount
+
+                raise
+            finally:
+                self._inflight = {}
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Failed to write points")
+
+
+class WatchTimeTracker:
+    """
+    Credits watch time to twitch chatters while the stream is live.
+    Every ``interval`` seconds the chatter list is fetched, and everyone who was also there on the previous snapshot
+    is credited the time between the two, plus ``stream_activity_payout`` points.
+    The ``hours`` column holds whole hours, so the seconds watched are carried over in memory between ticks,
+    and only whole hours are written. Time carried by someone who leaves chat is dropped along with them.
+    The new accounts, the hours and the points are written in one transaction,
+    so a tick costs the same few queries no matter how many people are watching.
+    """
+    def __init__(self, system, interval: float = 300):
+        self.system = system
+        self.interval = interval
+        self._previous = None # (time, chatter names) from the last tick
+        self._seconds: Dict[str, float] = {} # chatter name -> seconds watched that don't add up to an hour yet
+        self._task = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_event_loop().create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def snapshot(self):
+        """
+        Returns the lowercased names of everyone in chat, or None if the stream isn't live
+        """
+        streamer = self.system.twitch_streamer
+        if not streamer._ws.nick or not await streamer.get_stream(streamer._ws.nick):
+            return None
+
+        chatters = await streamer.fetch_chatters()
+        if chatters is None:
+            return None
+
+        names = {name.lower() for group in chatters.values() for name in group}
+        names.discard(self.system.twitch_bot._ws.nick)
+        return names
+
+    async def tick(self, now: float) -> int:
+        """
+        Takes a snapshot and credits everyone who stayed since the previous one. Returns the number of users credited
+        """
+        names = await self.snapshot()
+        previous, self._previous = self._previous, (now, names) if names is not None else None
+        stayed = names & previous[1] if names is not None and previous is not None else set()
+        if not stayed:
+            self._seconds = {}
+            return 0
+
+        elapsed = now - previous[0]
+        seconds = {name: self._seconds.get(name, 0) + elapsed for name in stayed}
+        payout = self.system.config.getint("currency", "stream_activity_payout", fallback=0)
+
+        async def credit(conn, users):
+            rows = [(int(seconds[name] // 3600), payout, user.id) for name, user in users.items()
+                    if payout or seconds[name] >= 3600]
+            if rows:
+                # relative to the stored values, so points still waiting in the accumulator aren't lost
+                await conn.executemany("UPDATE accounts SET hours = hours + ?, points = points + ? WHERE id = ?", rows)
+
+        users = await self.system.get_users_bulk(twitch_names=stayed, write=credit)
+
+        # only once the hours are committed, so a failed tick doesn't lose the carried time
+        for name, user in users.items():
+            hours = int(seconds[name] // 3600)
+            user.hours += hours
+            seconds[name] -= hours * 3600
+            if payout:
+                user.points += payout
+                self.system.leaderboard.update(user.id, user.points)
+
+        self._seconds = seconds
+        return len(users)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_event_loop()
+        while True:
+            try:
+                await self.tick(loop.time())
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Failed to credit watch time")
+                self._previous = None
+
+            await asyncio.sleep(self.interval)
@@ -3,22 +3,58 @@ Licensed under the Open Software License version 3.0
 """
 import aiosqlite3
 import asyncio
+import contextlib
+import logging
 import pathlib
+from concurrent.futures import ThreadPoolExecutor
 from interface.main2 import Window
+from .migrations import MIGRATIONS
+
+logger = logging.getLogger("xlydn.db")
 
 class Database:
     def __init__(self, system):
         self.system = system
-        self.connection = None
+        self.connection = None # the writer connection. In pooled mode this is the only connection allowed to write
+        self.readers = None
+        self.executor = None
         self.db_path = pathlib.Path(Window.get_data_location(), "services", "data.db")
         self.lock = asyncio.Lock()
+        self.pool_size = system.config.getint("database", "pool_size", fallback=4)
+        self.busy_timeout = system.config.getfloat("database", "busy_timeout", fallback=5)
+
+        # group commit: writes made within the window share one transaction, and one fsync
+        self.group_commit = system.config.getboolean("database", "group_commit", fallback=False)
+        self.commit_window = system.config.getint("database", "group_commit_window", fallback=50) / 1000
+        self.commit_size = system.config.getint("database", "group_commit_size", fallback=500)
+        self._pending = 0
+        self._flush_handle = None
+        self._flush_task = None
+        self._flush_error = None # a background commit that lost its writes, raised by the next write or flush
 
     async def close(self):
+        async with self.lock:
+            await self._flush()
+
+        if self.readers is not None:
+            while not self.readers.empty():
+                await self.readers.get_nowait().close()
+
+            self.readers = None
+
         if self.connection is not None:
             await self.connection.close()
 
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
     async def setup(self):
-        self.connection = await aiosqlite3.connect(self.db_path)
+        if self.pool_size > 0:
+            # each connection gets its own worker thread, otherwise the pool would queue up behind the default executor
+            self.executor = ThreadPoolExecutor(max_workers=self.pool_size + 1, thread_name_prefix="xlydn-db")
+
+        self.connection = await aiosqlite3.connect(self.db_path, executor=self.executor, timeout=self.busy_timeout)
 
         with open(self.system.interface.app.get_resource("schema.sql"), encoding="utf8") as f:
             schema = f.read()
@@ -30,6 +66,89 @@ class Database:
             import traceback
             traceback.print_exc()
 
+        await self.migrate()
+
+        if self.pool_size > 0:
+            await self._setup_pool()
+
+    async def migrate(self):
+        """
+        Brings an existing database up to date by applying every migration it hasn't seen yet.
+        Each migration runs in its own transaction, along with the version bump.
+        """
+        version = (await (await self.connection.execute("PRAGMA user_version;")).fetchone())[0]
+        for number, script in enumerate(MIGRATIONS[version:], start=version + 1):
+            logger.info(f"Applying database migration {number}")
+            try:
+                await self.connection.executescript(f"BEGIN;\n{script}\nPRAGMA user_version = {number};\nCOMMIT;")
+            except Exception:
+                await self.connection.rollback()
+                raise
+
+    async def _setup_pool(self):
+        # WAL lets the readers work off the last commit while the writer is busy
+        await self.connection.execute("PRAGMA journal_mode = WAL;")
+        await self.connection.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout * 1000)};")
+
+        self.readers = asyncio.Queue()
+        for _ in range(self.pool_size):
+            conn = await aiosqlite3.connect(self.db_path, executor=self.executor, timeout=self.busy_timeout)
+            await conn.execute("PRAGMA query_only = ON;")
+            await conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout * 1000)};")
+            self.readers.put_nowait(conn)
+
+    @contextlib.asynccontextmanager
+    async def _reader(self):
+        """
+        Acquires a connection to read from.
+        When pooling is disabled, or there are uncommitted writes,
+        this falls back to the writer connection under the global lock.
+        """
+        if self.connection is None:
+            async with self.lock:
+                if self.connection is None:
+                    await self.setup()
+
+        if self.readers is None or self._pending:
+            # writes waiting on a group commit are only visible to the writer connection
+            async with self.lock:
+                yield self.connection
+
+            return
+
+        conn = await self.readers.get()
+        try:
+            yield conn
+        finally:
+            self.readers.put_nowait(conn)
+
+    @contextlib.asynccontextmanager
+    async def transaction(self):
+        """
+        Runs several statements as one atomic write, yielding the writer connection to run them on.
+        Everything is rolled back if the block raises. The database lock is held for the whole block,
+        so the other methods of this class must not be used inside it.
+        """
+        async with self.lock:
+            self._raise_flush_error()
+            if self.connection is None:
+                await self.setup()
+
+            # a savepoint rather than BEGIN, so this nests inside a pending group commit
+            await self.connection.execute("SAVEPOINT xlydn_transaction;")
+            try:
+                yield self.connection
+            except BaseException:
+                await self.connection.execute("ROLLBACK TO xlydn_transaction;")
+                await self.connection.execute("RELEASE xlydn_transaction;")
+                raise
+            else:
+                await self.connection.execute("RELEASE xlydn_transaction;")
+                if self.group_commit:
+                    await self._write_behind(1)
+                else:
+                    await self.connection.commit()
+
     async def cursor(self):
         if self.connection is None:
             await self.setup()
@@ -37,12 +156,16 @@ class Database:
 
     async def execute(self, stmt: str, *values):
         async with self.lock:
+            self._raise_flush_error()
             if self.connection is None:
                 await self.setup()
 
             try:
                 ret = await self.connection.execute(stmt, tuple(values))
-                await self.connection.commit()
+                if self.group_commit:
+                    await self._write_behind(1)
+                else:
+                    await self.connection.commit()
                 return ret
             except aiosqlite3.OperationalError:
                 raise
@@ -69,12 +192,9 @@ class Database:
         :param default: the default to return if no value was found, or if an error occurred
         :return: the first value in the fetched row
         """
-        async with self.lock:
-            if self.connection is None:
-                await self.setup()
-
+        async with self._reader() as conn:
             try:
-                return (await (await self.connection.execute(stmt, tuple(values))).fetchone())[0] or default
+                return (await (await conn.execute(stmt, tuple(values))).fetchone())[0] or default
             except Exception:
                 return default
 
@@ -84,25 +204,45 @@ class Database:
         :param values: the values to be sanitized
         :return: the fetched row
         """
-        async with self.lock:
-            if self.connection is None:
-                await self.setup()
-
+        async with self._reader() as conn:
             try:
-                return await (await self.connection.execute(stmt, tuple(values))).fetchone()
+                return await (await conn.execute(stmt, tuple(values))).fetchone()
             except Exception:
                 return None
 
     async def fetch(self, stmt: str, *values):
-        async with self.lock:
-            if self.connection is None:
-                await self.setup()
-
+        async with self._reader() as conn:
             try:
-                return await (await self.connection.execute(stmt, tuple(values))).fetchall()
+                return await (await conn.execute(stmt, tuple(values))).fetchall()
             except Exception:
                 return None
 
+    async def iterate(self, stmt: str, *values, start=0, size: int = 500):
+        """
+        Streams the rows of a query in chunks of ``size``, taking a connection only while each chunk is fetched,
+        so the database stays usable while the rows are worked through, even from inside the loop.
+        The chunks are paged by key: the statement's last two parameters are the last key seen and the chunk size,
+        and the key is the first column of each row. For example
+        ``SELECT id, points FROM accounts WHERE id > ? ORDER BY id LIMIT ?``
+        Rows written between two chunks may or may not be seen.
+        :param stmt: the SQL statement
+        :param values: the values to be sanitized
+        :param start: the key to start after
+        :param size: how many rows to fetch at once
+        """
+        key = start
+        while True:
+            async with self._reader() as conn:
+                rows = await (await conn.execute(stmt, (*values, key, size))).fetchall()
+
+            for row in rows:
+                yield row
+
+            if len(rows) < size:
+                break
+
+            key = rows[-1][0]
+
     async def commit(self):
         if self.connection is None:
             await self.setup()
@@ -110,13 +250,107 @@ class Database:
             await self.connection.commit()
         except:
             pass
+        else:
+            self._pending = 0
+
+    async def _write_behind(self, count: int):
+        """
+        Defers the commit of a write until the group commit window closes, or the group is full.
+        The lock must be held when calling this.
+        """
+        self._pending += count
+        if self._pending >= self.commit_size:
+            await self._commit_pending()
+
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_event_loop().call_later(self.commit_window, self._start_flush)
+
+    def _start_flush(self) -> None:
+        self._flush_handle = None
+        self._flush_task = asyncio.get_event_loop().create_task(self._background_flush())
+        self._flush_task.add_done_callback(self._flush_done)
+
+    def _flush_done(self, task: asyncio.Task) -> None:
+        if task.cancelled() or task.exception() is None:
+            return
+
+        if self._pending:
+            logger.warning("Failed to commit a group of writes, trying again", exc_info=task.exception())
+        else:
+            # the writes are gone, so whoever writes or flushes next has to hear about it
+            logger.error("Failed to commit a group of writes, they have been rolled back", exc_info=task.exception())
+            self._flush_error = task.exception()
+
+    def _raise_flush_error(self) -> None:
+        # the lock must be held when calling this
+        error, self._flush_error = self._flush_error, None
+        if error is not None:
+            raise error
+
+    async def _commit_pending(self):
+        # the lock must be held when calling this
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        try:
+            await self.connection.commit()
+        except Exception:
+            if not self.connection._conn.in_transaction:
+                self._pending = 0 # sqlite rolled the group back, so there is nothing left to commit
+            elif self._flush_handle is None:
+                # still open, such as when the database was busy, so try again once the window closes
+                self._flush_handle = asyncio.get_event_loop().call_later(self.commit_window, self._start_flush)
+
+            raise
+
+        self._pending = 0
+
+    async def flush(self):
+        """
+        Commits any writes that are waiting on a group commit.
+        Once this returns, every write issued before it has been committed to disk.
+        Raises if a commit made in the background has lost its writes since the last write or flush.
+        """
+        async with self.lock:
+            self._raise_flush_error()
+            await self._flush()
+
+    async def _flush(self):
+        # the lock must be held when calling this
+        if self.connection is not None and self._pending:
+            await self._commit_pending()
+
+        elif self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+    async def _background_flush(self):
+        async with self.lock:
+            await self._flush()
 
     async def executemany(self, stmt: str, values: list):
         async with self.lock:
+            self._raise_flush_error()
             if self.connection is None:
                 await self.setup()
             if self.connection._conn is None:
                 await self.connection.connect()
+
+            if self.group_commit:
+                # a savepoint keeps the batch atomic without rolling back the rest of the group
+                await self.connection.execute("SAVEPOINT executemany;")
+                try:
+                    await self.connection.executemany(stmt, values)
+                except Exception:
+                    await self.connection.execute("ROLLBACK TO executemany;")
+                    await self.connection.execute("RELEASE executemany;")
+                    raise
+                else:
+                    await self.connection.execute("RELEASE executemany;")
+                    await self._write_behind(len(values))
+                return
+
             try:
                 await self.connection.executemany(stmt, values)
             except aiosqlite3.OperationalError:
@@ -131,6 +365,8 @@ class Database:
                 await self.setup()
             if self.connection._conn is None:
                 await self.connection.connect()
+            if self._pending:
+                await self._commit_pending() # executescript commits on its own, so close the group out first
             try:
                 await self.connection.executescript(stmt)
             except aiosqlite3.OperationalError:
@@ -143,4 +379,4 @@ class Database:
         return self.connection.__enter__()
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        return self.connection.__exit__(exc_type, exc_val, exc_tb)
\ No newline at end of file
+        return self.connection.__exit__(exc_type, exc_val, exc_tb)
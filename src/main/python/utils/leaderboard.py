@@ -0,0 +1,278 @@
+"""
+Licensed under the Open Software License version 3.0
+"""
+import asyncio
+import logging
+import random
+from typing import List, Optional, Tuple
+
+MAX_LEVEL = 32
+MAX_EARLY = 10000 # changes held back while building, past this the build is thrown away and started over
+MAX_RETRY_DELAY = 300
+
+logger = logging.getLogger("xlydn.leaderboard")
+
+
+class _Node:
+    __slots__ = ("key", "next", "width")
+
+    def __init__(self, key, level: int):
+        self.key = key
+        self.next = [None] * level
+        self.width = [1] * level # how many level 0 steps each link skips
+
+
+class SkipList:
+    """
+    A sorted list of unique keys that can also be indexed by position.
+    Inserting, removing, finding a key's position and finding the key at a position are all O(log n).
+    """
+    def __init__(self):
+        self._head = _Node(None, MAX_LEVEL)
+        self._level = 1
+        self._size = 0
+        self._tail = [self._head] * MAX_LEVEL # last node on each level, for append. Dropped once anything else changes the list
+        self._tail_index = [0] * MAX_LEVEL # position of each of those, counting the head as 0
+
+    def __len__(self):
+        return self._size
+
+    @staticmethod
+    def _random_level() -> int:
+        level = 1
+        while level < MAX_LEVEL and random.random() < 0.5:
+            level += 1
+
+        return level
+
+    def _find(self, key) -> Tuple[List[_Node], List[int]]:
+        # the last node before the key on each level, and its position
+        update = [self._head] * MAX_LEVEL
+        position = [0] * MAX_LEVEL
+        node, pos = self._head, 0
+        for i in range(self._level - 1, -1, -1):
+            while node.next[i] is not None and node.next[i].key < key:
+                pos += node.width[i]
+                node = node.next[i]
+
+            update[i] = node
+            position[i] = pos
+
+        return update, position
+
+    def append(self, key) -> None:
+        """
+        Adds a key that sorts after every key already in the list, in O(1) on average.
+        Used to build the list from already sorted input
+        """
+        if self._tail is None:
+            return self.insert(key) # the list has been changed since it was built, so the tail isn't known
+
+        level = self._random_level()
+        node = _Node(key, level)
+        index = self._size + 1
+        for i in range(level):
+            self._tail[i].next[i] = node
+            self._tail[i].width[i] = index - self._tail_index[i]
+            self._tail[i] = node
+            self._tail_index[i] = index
+
+        self._level = max(self._level, level)
+        self._size += 1
+
+    def insert(self, key) -> None:
+        update, position = self._find(key)
+        level = self._random_level()
+        if level > self._level:
+            for i in range(self._level, level):
+                update[i] = self._head
+                position[i] = 0
+
+            self._level = level
+
+        node = _Node(key, level)
+        pos = position[0] + 1 # where the new node ends up, counting the head as 0
+        for i in range(self._level):
+            prev = update[i]
+            if i < level:
+                node.next[i] = prev.next[i]
+                node.width[i] = prev.width[i] - (pos - position[i]) + 1
+                prev.next[i] = node
+                prev.width[i] = pos - position[i]
+            else:
+                prev.width[i] += 1
+
+        self._size += 1
+        self._tail = None
+
+    def remove(self, key) -> bool:
+        update, _ = self._find(key)
+        node = update[0].next[0]
+        if node is None or node.key != key:
+            return False
+
+        for i in range(self._level):
+            prev = update[i]
+            if prev.next[i] is node:
+                prev.width[i] += node.width[i] - 1
+                prev.next[i] = node.next[i]
+            else:
+                prev.width[i] -= 1
+
+        while self._level > 1 and self._head.next[self._level - 1] is None:
+            self._level -= 1
+
+        self._size -= 1
+        self._tail = None
+        return True
+
+    def index(self, key) -> Optional[int]:
+        """
+        The 0 based position of the key, or None if it isn't in the list
+        """
+        update, position = self._find(key)
+        node = update[0].next[0]
+        if node is None or node.key != key:
+            return None
+
+        return position[0]
+
+    def slice(self, start: int, count: int) -> list:
+        """
+        Returns up to ``count`` keys, starting at position ``start``
+        """
+        if start < 0 or start >= self._size or count <= 0:
+            return []
+
+        node, pos = self._head, -1
+        for i in range(self._level - 1, -1, -1):
+            while node.next[i] is not None and pos + node.width[i] <= start:
+                pos += node.width[i]
+                node = node.next[i]
+
+        keys = []
+        while node is not None and len(keys) < count:
+            keys.append(node.key)
+            node = node.next[0]
+
+        return keys
+
+
+class Leaderboard:
+    """
+    Every account's points, kept in rank order in memory.
+    It is built from the database once, then kept current by the code that changes points.
+    Changes made while it is being built are held back, and applied once the build is done.
+    If too many pile up, they are dropped and the build starts over, as the database has them by then.
+    """
+    def __init__(self, system):
+        self.system = system
+        self.ready = False
+        self._points = {} # account id -> points
+        self._ranks = SkipList() # (-points, account id), so the richest account comes first
+        self._early = {} # changes made before the build finished, account id -> points, None for removed
+        self._overflowed = False
+        self._task = None
+
+    def __len__(self):
+        return len(self._points)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_event_loop().create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self) -> None:
+        delay = 1
+        while not self.ready:
+            try:
+                await self.rebuild()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception(f"Failed to build the leaderboard, trying again in {delay} seconds")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, MAX_RETRY_DELAY)
+
+    async def rebuild(self) -> bool:
+        """
+        Loads every account's points. Returns False if changes overflowed while loading, and it has to be done again
+        """
+        self._overflowed = False
+        points = {}
+        async for id, amount in self.system.db.iterate("SELECT id, points FROM accounts WHERE id > ? ORDER BY id LIMIT ?"):
+            points[id] = amount or 0
+
+        if self._overflowed:
+            logger.info("Too many points changed while building the leaderboard, starting over")
+            return False
+
+        pending = self.system.points
+        ranks = SkipList()
+        for id in points:
+            points[id] += pending.pending(id)
+
+        for id, amount in sorted(points.items(), key=lambda item: (-item[1], item[0])):
+            ranks.append((-amount, id))
+
+        self._points, self._ranks = points, ranks
+        self.ready = True
+        early, self._early = self._early, {}
+        for id, amount in early.items():
+            if amount is None:
+                self.remove(id)
+            else:
+                self.update(id, amount)
+
+        return True
+
+    def _hold(self, id: int, points: Optional[int]) -> None:
+        if self._overflowed:
+            return
+
+        self._early[id] = points
+        if len(self._early) > MAX_EARLY:
+            self._early = {}
+            self._overflowed = True
+
+    def update(self, id: int, points: int) -> None:
+        if not self.ready:
+            return self._hold(id, points)
+
+        old = self._points.get(id)
+        if old == points:
+            return
+
+        if old is not None:
+            self._ranks.remove((-old, id))
+
+        self._points[id] = points
+        self._ranks.insert((-points, id))
+
+    def remove(self, id: int) -> None:
+        if not self.ready:
+            return self._hold(id, None)
+
+        old = self._points.pop(id, None)
+        if old is not None:
+            self._ranks.remove((-old, id))
+
+    def rank(self, id: int) -> Optional[int]:
+        """
+        The 1 based rank of the account, or None if it isn't on the board
+        """
+        points = self._points.get(id)
+        if points is None:
+            return None
+
+        return self._ranks.index((-points, id)) + 1
+
+    def top(self, count: int = 10, offset: int = 0) -> List[Tuple[int, int]]:
+        """
+        Returns ``(account id, points)`` for up to ``count`` accounts, starting at the given rank offset
+        """
+        return [(id, -points) for points, id in self._ranks.slice(offset, count)]
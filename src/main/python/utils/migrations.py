@@ -0,0 +1,32 @@
+"""
+Licensed under the Open Software License version 3.0
+"""
+
+# Each entry is a SQL script, applied in order on top of schema.sql by Database.migrate.
+# The number of the last applied migration is stored in the user_version pragma of data.db,
+# so once a migration has been released it must never be edited or reordered. Add a new one instead.
+MIGRATIONS = [
+    # 1: index the columns that users are looked up by
+    """
+    CREATE INDEX IF NOT EXISTS accounts_discord_id_idx ON accounts (discord_id);
+    CREATE INDEX IF NOT EXISTS accounts_twitch_userid_idx ON accounts (twitch_userid);
+    CREATE INDEX IF NOT EXISTS accounts_twitch_username_idx ON accounts (twitch_username);
+    """,
+
+    # 2: twitch names are always looked up in lowercase, but linking used to store them as given
+    """
+    UPDATE accounts SET twitch_username = lower(twitch_username) WHERE twitch_username IS NOT NULL;
+    """,
+
+    # 3: give the query planner statistics for the new indexes
+    """
+    ANALYZE;
+    """,
+
+    # 4: copypastas added by editors, on top of the ones shipped in addons/common/copypasta.py
+    """
+    CREATE TABLE IF NOT EXISTS automod_pastas (
+        content text primary key
+    );
+    """,
+]
@@ -0,0 +1,94 @@
+"""
+Licensed under the Open Software License version 3.0
+"""
+import asyncio
+import heapq
+import time
+from typing import List, Optional
+
+
+class TimerScheduler:
+    """
+    Keeps delayed events in a min-heap ordered by the time they fire at.
+    :meth:`wait` sleeps until the earliest timer is due, and wakes up early when an earlier timer is added.
+
+    Cancelled timers are dropped from the index straight away, and skipped when they reach the top of the heap.
+    """
+    def __init__(self):
+        self._heap = [] # (fire_at, id)
+        self._timers = {}
+        self._by_event = {}
+        self._wakeup = asyncio.Event()
+
+    def __len__(self):
+        return len(self._timers)
+
+    def __contains__(self, id):
+        return id in self._timers
+
+    def add(self, id: int, fire_at: float, event: str, data: dict) -> None:
+        if id in self._timers:
+            return
+
+        self._timers[id] = {"id": id, "fire": fire_at, "event": event, "data": data}
+        self._by_event.setdefault(event, set()).add(id)
+        heapq.heappush(self._heap, (fire_at, id))
+        if self._heap[0][1] == id:
+            self._wakeup.set()
+
+    def cancel(self, id: int) -> Optional[dict]:
+        timer = self._timers.pop(id, None)
+        if timer is None:
+            return None
+
+        ids = self._by_event[timer['event']]
+        ids.discard(id)
+        if not ids:
+            del self._by_event[timer['event']]
+
+        if len(self._heap) > 64 and len(self._heap) > 2 * len(self._timers):
+            # mostly cancelled entries, rebuild so the heap doesn't keep growing
+            self._heap = [entry for entry in self._heap if entry[1] in self._timers]
+            heapq.heapify(self._heap)
+
+        return timer
+
+    def find(self, event: str, **data) -> List[dict]:
+        """
+        Finds the pending timers for an event whose data contains the given values
+        """
+        found = []
+        for id in self._by_event.get(event, ()):
+            timer = self._timers[id]
+            if all(timer['data'].get(k) == v for k, v in data.items()):
+                found.append(timer)
+
+        return found
+
+    def _pop_due(self, now: float) -> List[dict]:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            _, id = heapq.heappop(self._heap)
+            if id in self._timers:
+                due.append(self.cancel(id))
+
+        return due
+
+    async def wait(self) -> List[dict]:
+        """
+        Waits until at least one timer is due, then removes and returns every due timer
+        """
+        while True:
+            while self._heap and self._heap[0][1] not in self._timers:
+                heapq.heappop(self._heap)
+
+            now = time.time()
+            if self._heap and self._heap[0][0] <= now:
+                return self._pop_due(now)
+
+            self._wakeup.clear()
+            timeout = self._heap[0][0] - now if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,71 @@
+import asyncio
+import time
+from unittest import TestCase, skipIf
+
+try:
+    from addons.twitch.automod import CommandQueue
+except ImportError: # twitchio or discord.py isn't installed
+    CommandQueue = None
+
+
+class Channel:
+    def __init__(self, name="channel"):
+        self.name = name
+        self.sent = []
+
+    async def send(self, content):
+        self.sent.append((time.monotonic(), content))
+
+
+@skipIf(CommandQueue is None, "twitchio is not installed")
+class CommandQueueTest(TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.queue = CommandQueue(self.loop, rate=3, per=0.3)
+        self.channel = Channel()
+
+    def tearDown(self):
+        self.queue.stop()
+        if self.queue._task is not None:
+            self.loop.run_until_complete(asyncio.gather(self.queue._task, return_exceptions=True))
+
+        asyncio.set_event_loop(None)
+        self.loop.close()
+
+    def drain(self):
+        self.loop.run_until_complete(self.queue._task)
+        return [content for _, content in self.channel.sent]
+
+    def test_token_bucket(self):
+        start = time.monotonic()
+        for id in range(5):
+            self.queue.delete(self.channel, str(id))
+
+        self.assertEqual(self.drain(), [f"/delete {id}" for id in range(5)])
+        times = [sent - start for sent, _ in self.channel.sent]
+        self.assertLess(times[2], 0.05) # the burst goes straight out
+        self.assertGreaterEqual(times[3], 0.09) # then one every per / rate seconds
+        self.assertGreaterEqual(times[4] - times[3], 0.09)
+
+    def test_dedupe(self):
+        self.queue.timeout(self.channel, "user", 60, "spam")
+        self.queue.timeout(self.channel, "user", 60, "spam")
+        self.queue.timeout(Channel("other"), "user", 60, "spam")
+        self.queue.ban(self.channel, "user")
+        self.assertEqual(len(self.queue), 3)
+        self.assertEqual(self.drain(), ["/timeout user 60 spam", "/ban user"])
+
+        # once it's been sent, the same command can be queued again
+        self.queue.ban(self.channel, "user")
+        self.assertEqual(self.drain(), ["/timeout user 60 spam", "/ban user", "/ban user"])
+
+    def test_send_errors_are_ignored(self):
+        async def fail(content):
+            raise ConnectionError
+
+        broken = Channel("broken")
+        broken.send = fail
+        self.queue.delete(broken, "1")
+        self.queue.delete(self.channel, "2")
+        self.assertEqual(self.drain(), ["/delete 2"])
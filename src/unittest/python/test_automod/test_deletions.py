@@ -0,0 +1,50 @@
+import asyncio
+from unittest import TestCase, skipIf
+
+try:
+    from addons.discord.automod import DeletionQueue
+except ImportError: # discord.py isn't installed
+    DeletionQueue = None
+
+
+class Channel:
+    def __init__(self, id=1):
+        self.id = id
+        self.deleted = []
+
+    async def delete_messages(self, messages):
+        self.deleted.append([message.id for message in messages])
+
+
+@skipIf(DeletionQueue is None, "discord.py is not installed")
+class DeletionQueueTest(TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.queue = DeletionQueue(self.loop, delay=0, interval=0)
+        self.channel = Channel()
+
+    def tearDown(self):
+        self.queue.stop()
+        self.loop.close()
+
+    def drain(self):
+        self.loop.run_until_complete(asyncio.sleep(0.05))
+
+    def test_batches_and_dedupes(self):
+        self.queue.add(self.channel, *range(150))
+        self.queue.add(self.channel, 5, 149, None)
+        self.drain()
+        self.assertEqual(self.channel.deleted, [list(range(100)), list(range(100, 150))])
+        self.assertEqual(self.queue.calls, 2)
+
+        self.queue.add(self.channel, 5) # already deleted
+        self.drain()
+        self.assertEqual(self.queue.calls, 2)
+
+    def test_nothing_to_delete_leaves_nothing_behind(self):
+        self.queue.add(self.channel, 1)
+        self.drain()
+        self.queue.add(self.channel, None, 1)
+        self.assertEqual((self.queue._pending, self.queue._tasks.get(self.channel.id).done()), ({}, True))
+        self.queue.add(Channel(2))
+        self.assertNotIn(2, self.queue._pending)
@@ -0,0 +1,31 @@
+from unittest import TestCase
+
+from utils import automod
+
+
+class DomainIndexTest(TestCase):
+    def setUp(self):
+        self.index = automod.DomainIndex(["Example.com", "bad.net."])
+
+    def test_match(self):
+        self.assertEqual(self.index.match("example.com"), "example.com")
+        self.assertEqual(self.index.match("evil.EXAMPLE.com"), "example.com")
+        self.assertIsNone(self.index.match("notexample.com"))
+        self.assertIsNone(self.index.match("example.com.au"))
+
+    def test_search(self):
+        self.assertEqual(self.index.search("free stuff at https://www.bad.net/claim now"), "bad.net")
+        self.assertEqual(self.index.search("go to shop.example.com"), "example.com")
+        self.assertIsNone(self.index.search("nothing to see at good.org, or at example dot com"))
+
+    def test_changes(self):
+        version = self.index.version
+        self.index.add("other.org")
+        self.index.remove("bad.net")
+        self.assertGreater(self.index.version, version)
+        self.assertEqual(self.index.search("other.org"), "other.org")
+        self.assertIsNone(self.index.search("bad.net"))
+
+    def test_extract_hosts(self):
+        self.assertEqual(list(automod.extract_hosts("a http://Sub.Host.io/path and b.co, not a.b-")),
+                         ["sub.host.io", "b.co"])
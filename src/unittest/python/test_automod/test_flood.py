@@ -0,0 +1,41 @@
+from unittest import TestCase
+
+from utils import automod
+
+LINE = "everybody spam this line in chat"
+
+
+class FloodDetectorTest(TestCase):
+    def setUp(self):
+        self.detector = automod.FloodDetector(3, 10)
+
+    def test_flags_every_sender_at_the_threshold(self):
+        self.assertEqual(self.detector.update("chan", "a", LINE, now=0), [])
+        self.assertEqual(self.detector.update("chan", "b", LINE.upper() + "!!", now=1), []) # still the same fingerprint
+        self.assertEqual(sorted(self.detector.update("chan", "c", "  Everybody spam, this line in chat", now=2)), ["a", "b", "c"])
+        self.assertEqual(self.detector.update("chan", "d", LINE, now=3), ["d"]) # later senders are caught one at a time
+
+    def test_one_user_repeating_is_not_a_flood(self):
+        for t in range(5):
+            self.assertEqual(self.detector.update("chan", "a", LINE, now=t), [])
+
+    def test_window_expires(self):
+        self.detector.update("chan", "a", LINE, now=0)
+        self.detector.update("chan", "b", LINE, now=1)
+        self.assertEqual(self.detector.update("chan", "c", LINE, now=12), []) # a and b have left the window
+
+    def test_channels_are_separate(self):
+        self.detector.update("one", "a", LINE, now=0)
+        self.detector.update("two", "b", LINE, now=0)
+        self.assertEqual(self.detector.update("three", "c", LINE, now=0), [])
+
+    def test_short_lines_are_ignored(self):
+        for user in "abcd":
+            self.assertEqual(self.detector.update("chan", user, "gg", now=0), [])
+
+    def test_window_size(self):
+        detector = automod.FloodDetector(3, 10, size=3)
+        detector.update("chan", "a", LINE, now=0)
+        detector.update("chan", "b", LINE, now=0)
+        detector.update("chan", "x", "something else entirely", now=0)
+        self.assertEqual(detector.update("chan", "c", LINE, now=0), []) # a was pushed out by the size bound
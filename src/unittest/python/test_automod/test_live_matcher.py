@@ -0,0 +1,75 @@
+import asyncio
+from unittest import TestCase, mock
+
+from utils import automod
+
+
+class LiveMatcherTest(TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.matcher = automod.LiveMatcher([automod.Term("bad"), automod.Term("worse")])
+
+    def tearDown(self):
+        if self.matcher._rebuild_handle is not None:
+            self.matcher._rebuild_handle.cancel()
+
+        asyncio.set_event_loop(None)
+        self.loop.close()
+
+    def found(self, text):
+        term = self.matcher.search(text)
+        return term and term.text
+
+    def test_add_and_remove(self):
+        version = self.matcher.version
+        self.matcher.add(automod.Term("Awful"))
+        self.assertIn("awful", self.matcher)
+        self.assertEqual(self.found("that was awful"), "Awful")
+        self.matcher.remove("bad")
+        self.assertNotIn("bad", self.matcher)
+        self.assertIsNone(self.found("that was bad"))
+        self.assertEqual(self.found("even worse"), "worse")
+        self.assertEqual(sorted(term.text for term in self.matcher.terms), ["Awful", "worse"])
+        self.assertEqual(self.matcher.version, version + 2)
+
+    def test_replacing_a_term(self):
+        self.matcher.add(automod.Term("bad", twitch=False))
+        self.assertEqual(len(self.matcher), 2)
+        self.assertEqual(len(list(self.matcher.iter_matches("bad"))), 1) # the old one is hidden
+        self.assertFalse(self.matcher.search("bad").twitch)
+        self.matcher.remove("BAD")
+        self.assertIsNone(self.found("bad"))
+
+    def test_debounced_rebuild(self):
+        with mock.patch.object(automod.LiveMatcher, "REBUILD_DELAY", 0.05), \
+                mock.patch.object(self.matcher, "rebuild", wraps=self.matcher.rebuild) as rebuild:
+            self.matcher.add(automod.Term("awful"))
+            self.matcher.remove("bad")
+            self.matcher.add(automod.Term("dreadful"))
+            self.loop.run_until_complete(asyncio.sleep(0.02))
+            self.assertEqual(rebuild.call_count, 0)
+            self.loop.run_until_complete(asyncio.sleep(0.1))
+            self.loop.run_until_complete(self.matcher._rebuild_task)
+
+        self.assertEqual(rebuild.call_count, 1)
+        self.assertEqual((self.matcher._added, self.matcher._removed), ({}, set()))
+        self.assertEqual(sorted(self.matcher.base._terms), ["awful", "dreadful", "worse"])
+        self.assertEqual(self.found("bad, awful"), "awful")
+
+    def test_changes_during_rebuild_are_kept(self):
+        self.matcher.add(automod.Term("awful"))
+        self.matcher._rebuild_handle.cancel()
+
+        async def run():
+            task = asyncio.ensure_future(self.matcher.rebuild())
+            await asyncio.sleep(0) # the snapshot is taken, the build is in the executor
+            self.matcher.add(automod.Term("dreadful"))
+            self.matcher.remove("worse")
+            await task
+
+        self.loop.run_until_complete(run())
+        self.assertEqual(sorted(self.matcher.base._terms), ["awful", "bad", "worse"])
+        self.assertEqual(sorted(term.text for term in self.matcher.terms), ["awful", "bad", "dreadful"])
+        self.assertEqual(self.found("dreadful"), "dreadful")
+        self.assertIsNone(self.found("worse"))
@@ -0,0 +1,56 @@
+import random
+import re
+from unittest import TestCase
+
+from utils import automod
+
+
+def regex_for(words):
+    # what the automod used before the matcher, see System.build_automod
+    return re.compile(r"(?i)\b(?:{})\b".format("|".join(map(re.escape, words))))
+
+
+class MatcherTest(TestCase):
+    def test_finds_words(self):
+        matcher = automod.Matcher([automod.Term("bad"), automod.Term("worse")])
+        self.assertEqual(matcher.search("this is BAD").text, "bad")
+        self.assertEqual(matcher.search("worse and bad").text, "worse")
+        self.assertIsNone(matcher.search("badge and worsen"))
+
+    def test_pasta_matches_anywhere(self):
+        matcher = automod.Matcher([automod.Term("pasta", automod.PASTA)])
+        self.assertIsNotNone(matcher.search("copypastas"))
+
+    def test_non_word_edges(self):
+        # \b needs a word character on the other side of a non word edge, the same as the old regex
+        words = ["c++", "!", "@home"]
+        matcher = automod.Matcher([automod.Term(word) for word in words])
+        regex = regex_for(words)
+        cases = {
+            "i like c++": False,
+            "c++11": True,
+            "hi!": False,
+            "hi!there": True,
+            "x @home": False,
+            "x@home": True
+        }
+        for text, expected in cases.items():
+            self.assertEqual(matcher.search(text) is not None, expected, text)
+            self.assertEqual(bool(regex.search(text)), expected, text)
+
+    def test_check(self):
+        matcher = automod.Matcher([automod.Term("bad", twitch=False), automod.Term("worse", discord=False)])
+        self.assertEqual(matcher.search("bad worse", lambda term: term.twitch).text, "worse")
+        self.assertIsNone(matcher.search("bad", lambda term: term.twitch))
+
+    def test_regex_parity(self):
+        rng = random.Random(0)
+        alphabet = "ab_1 +!-."
+        for _ in range(300):
+            words = list({"".join(rng.choices(alphabet, k=rng.randint(1, 4))) for _ in range(rng.randint(1, 8))})
+            regex = regex_for(words)
+            matcher = automod.Matcher([automod.Term(word) for word in words])
+            for _ in range(20):
+                text = "".join(rng.choices(alphabet + "AB", k=rng.randint(0, 16)))
+                self.assertEqual(bool(regex.search(text)), matcher.search(text) is not None, (words, text))
+
@@ -0,0 +1,45 @@
+from unittest import TestCase
+
+from utils import automod
+
+PASTA = ("What the heck did you just say about me, you little streamer? I'll have you know I graduated top of my class "
+         "in the speedrun academy, and I've been involved in numerous secret raids on rival channels")
+OTHER = "Does anybody know what time the stream starts tomorrow, and whether the giveaway is still happening?"
+THRESHOLD = 0.6 # the default automod_copypasta_similarity
+
+
+class PastaIndexTest(TestCase):
+    def setUp(self):
+        self.index = automod.PastaIndex(recent=2)
+        self.index.add(PASTA)
+
+    def test_exact_copy(self):
+        self.assertEqual(self.index.similarity(PASTA), 1.0)
+        self.assertEqual(self.index.similarity("  " + PASTA.upper().replace(" ", "   ")), 1.0) # case and whitespace don't count
+
+    def test_edited_copy(self):
+        edited = PASTA.replace("streamer", "mod").replace("speedrun", "chess")
+        self.assertTrue(self.index.is_similar(edited, THRESHOLD))
+        self.assertLess(self.index.similarity(edited), 1.0)
+
+    def test_unrelated(self):
+        self.assertFalse(self.index.is_similar(OTHER, THRESHOLD))
+
+    def test_short_messages_never_match(self):
+        self.assertEqual(self.index.similarity(PASTA[:automod.PastaIndex.MIN_LENGTH - 1]), 0.0)
+        self.assertIsNone(self.index.add("too short"))
+
+    def test_remove(self):
+        self.assertTrue(self.index.remove(PASTA))
+        self.assertFalse(self.index.remove(PASTA))
+        self.assertEqual(self.index.similarity(PASTA), 0.0)
+        self.assertEqual(len(self.index), 0)
+
+    def test_recent_is_bounded(self):
+        first = OTHER + " first"
+        self.index.remember(first)
+        self.index.remember(OTHER + " second")
+        self.index.remember(OTHER + " third") # pushes the first one out
+        self.assertEqual(len(self.index), 3) # the pasta, plus the two most recent
+        self.assertTrue(self.index.is_similar(PASTA, THRESHOLD)) # pastas are never pushed out
+        self.assertNotIn(self.index.normalize(first), self.index._keys)
@@ -0,0 +1,45 @@
+import asyncio
+from unittest import TestCase
+
+from utils import automod
+
+
+class PipelineTest(TestCase):
+    def test_stops_at_the_first_hit(self):
+        calls = []
+
+        def check(name, hit):
+            async def run(message):
+                calls.append(name)
+                return hit
+            return run
+
+        pipeline = automod.Pipeline([("a", check("a", False)), ("b", check("b", True)), ("c", check("c", True))])
+        self.assertEqual(asyncio.run(pipeline.run("message")), "b")
+        self.assertEqual(calls, ["a", "b"])
+        self.assertEqual((pipeline.stats["b"].calls, pipeline.stats["b"].hits), (1, 1))
+        self.assertEqual(pipeline.stats["c"].calls, 0)
+
+    def test_recorders_always_run(self):
+        recorded = []
+        seen = []
+
+        async def flag(message):
+            return True
+
+        async def check(message, value):
+            seen.append(value)
+            return False
+
+        def record(message):
+            recorded.append(message)
+            return message.upper()
+
+        pipeline = automod.Pipeline([("first", flag), ("tracked", check, record)])
+        self.assertEqual(asyncio.run(pipeline.run("message")), "first")
+        self.assertEqual(recorded, ["message"]) # counted, even though an earlier check flagged the message
+        self.assertEqual(seen, [])
+
+        pipeline = automod.Pipeline([("tracked", check, record)])
+        self.assertIsNone(asyncio.run(pipeline.run("other")))
+        self.assertEqual(seen, ["OTHER"])
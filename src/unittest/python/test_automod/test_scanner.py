@@ -0,0 +1,143 @@
+import asyncio
+import threading
+import types
+from unittest import TestCase
+
+from utils import automod
+
+PASTA = "this is a long enough copypasta to be indexed by the pasta index, with a few more words on the end"
+
+
+class SlowMatcher:
+    """
+    A matcher that blocks until it is released, like a scan that has run away
+    """
+    version = 0
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.calls = 0
+
+    def iter_matches(self, text):
+        self.calls += 1
+        self.release.wait(5)
+        return iter(())
+
+
+class ScannerTest(TestCase):
+    def setUp(self):
+        self.system = types.SimpleNamespace(
+            automod_matcher=automod.LiveMatcher([automod.Term("bad")]),
+            automod_pastas=automod.PastaIndex(),
+            automod_domains=automod.DomainIndex(["example.com"])
+        )
+        self.scanner = automod.Scanner(self.system, budget=5)
+
+    def tearDown(self):
+        self.scanner.close()
+
+    def test_scan(self):
+        async def run():
+            result = await self.scanner.scan("bad stuff on www.example.com")
+            self.assertEqual(result.discord_word.text, "bad")
+            self.assertEqual(result.ad, "example.com")
+
+            result = await self.scanner.scan("join discord.gg/abcdef")
+            self.assertEqual(result.ad, "discord.gg/abcdef")
+
+        asyncio.run(run())
+
+    def test_cache_follows_the_pasta_index(self):
+        async def run():
+            self.assertEqual((await self.scanner.scan(PASTA)).similarity, 0.0)
+            self.assertEqual((await self.scanner.scan(PASTA)).similarity, 0.0)
+            self.assertEqual(self.scanner.cache_hits, 1)
+
+            self.system.automod_pastas.add(PASTA)
+            self.assertEqual((await self.scanner.scan(PASTA)).similarity, 1.0)
+
+            self.system.automod_pastas.remove(PASTA)
+            self.assertEqual((await self.scanner.scan(PASTA)).similarity, 0.0)
+
+        asyncio.run(run())
+
+    def test_pasta_changes_keep_words_and_ads(self):
+        async def run():
+            text = "bad stuff on www.example.com, " + PASTA
+            self.assertEqual((await self.scanner.scan(text)).similarity, 0.0)
+            matcher = self.system.automod_matcher
+            calls = []
+            matcher.iter_matches = lambda text: calls.append(text) or automod.LiveMatcher.iter_matches(matcher, text)
+
+            self.system.automod_pastas.remember(PASTA)
+            result = await self.scanner.scan(text)
+            self.assertGreater(result.similarity, 0.5)
+            self.assertEqual(result.discord_word.text, "bad")
+            self.assertEqual(result.ad, "example.com")
+            self.assertEqual(calls, []) # only the similarity was found again
+
+        asyncio.run(run())
+
+    def test_concurrent_scans_share_one(self):
+        async def run():
+            matcher = self.system.automod_matcher = SlowMatcher()
+            scans = [asyncio.ensure_future(self.scanner.scan("same text")) for _ in range(3)]
+            await asyncio.sleep(0.05)
+            matcher.release.set()
+            results = await asyncio.gather(*scans)
+            self.assertEqual(matcher.calls, 1)
+            self.assertIs(results[0], results[1])
+            self.assertEqual(self.scanner.scans, 1)
+
+        asyncio.run(run())
+
+    def test_timeouts_fail_open_once(self):
+        async def run():
+            matcher = self.system.automod_matcher = SlowMatcher()
+            self.scanner.budget = 0.05
+            self.assertIsNone(await self.scanner.scan("slow text"))
+            self.assertIsNone(await self.scanner.scan("slow text")) # remembered, not scanned again
+            self.assertEqual((matcher.calls, self.scanner.timeouts, self.scanner.scans), (1, 1, 1))
+            self.assertGreater(self.scanner.matching, 0)
+            matcher.release.set()
+
+        asyncio.run(run())
+
+    def test_queue_timeouts_are_not_remembered(self):
+        async def run():
+            matcher = self.system.automod_matcher = SlowMatcher()
+            self.scanner.budget = 0.05
+            # both workers are stuck, so the third text never gets one
+            await asyncio.gather(self.scanner.scan("one"), self.scanner.scan("two"), self.scanner.scan("three"))
+            self.assertEqual((self.scanner.timeouts, self.scanner.queue_timeouts), (2, 1))
+            matcher.release.set()
+            await asyncio.sleep(0.05)
+            self.scanner.budget = 5
+            self.assertIsNotNone(await self.scanner.scan("three"))
+            self.assertIsNone(await self.scanner.scan("one"))
+
+        asyncio.run(run())
+
+    def test_message_scan_runs_once(self):
+        async def run():
+            scan = self.scanner.prepare("bad")
+            first = await scan.result()
+            self.assertIs(await scan.result(), first)
+            self.assertEqual((self.scanner.scans, self.scanner.cache_hits), (1, 0))
+
+        asyncio.run(run())
+
+    def test_changes_during_scans(self):
+        # scans run on other threads, and must never fail because the loop changed the indexes under them
+        async def run():
+            pastas = [PASTA + " " + str(i) for i in range(200)]
+            for i, pasta in enumerate(pastas):
+                scan = asyncio.ensure_future(self.scanner.scan(pasta + " scan"))
+                self.system.automod_pastas.remember(pasta)
+                self.system.automod_domains.add(f"site{i}.com")
+                self.system.automod_matcher.add(automod.Term(f"word{i}"))
+                await scan
+
+            self.assertEqual(self.scanner.errors, 0)
+
+        asyncio.run(run())
@@ -0,0 +1,48 @@
+from unittest import TestCase
+
+from utils import automod
+
+
+class SpamTrackerTest(TestCase):
+    def setUp(self):
+        self.tracker = automod.SpamTracker([(3, 5), (5, 20)])
+
+    def send(self, key, times):
+        return [self.tracker.update(key, item=i, now=t) for i, t in enumerate(times)]
+
+    def test_short_window(self):
+        results = self.send("a", [0, 1, 2])
+        self.assertEqual(results[:2], [None, None])
+        self.assertEqual(results[2], (3, 5, [0, 1, 2]))
+
+    def test_long_window(self):
+        results = self.send("a", [0, 6, 12, 18, 19])
+        self.assertEqual(results[:4], [None] * 4)
+        self.assertEqual(results[4], (5, 20, [0, 1, 2, 3, 4]))
+
+    def test_slow_messages_pass(self):
+        self.assertEqual(self.send("a", [0, 6, 12, 30, 36, 42, 60]), [None] * 7)
+
+    def test_keys_are_separate(self):
+        self.tracker.update("a", now=0)
+        self.tracker.update("b", now=0)
+        self.assertIsNone(self.tracker.update("a", now=1))
+        self.assertIsNone(self.tracker.update("b", now=1))
+
+    def test_counting_restarts_after_a_hit(self):
+        self.send("a", [0, 1, 2])
+        self.assertIsNone(self.tracker.update("a", now=3))
+        self.assertIsNone(self.tracker.update("a", now=4))
+        self.assertIsNotNone(self.tracker.update("a", now=4.5))
+
+    def test_reset(self):
+        self.send("a", [0, 1])
+        self.tracker.reset("a")
+        self.assertIsNone(self.tracker.update("a", now=2))
+
+    def test_capacity(self):
+        tracker = automod.SpamTracker([(3, 5)], capacity=2)
+        for key in "abc":
+            tracker.update(key, now=0)
+
+        self.assertEqual(len(tracker), 2)
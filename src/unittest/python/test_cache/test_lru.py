@@ -0,0 +1,56 @@
+from unittest import TestCase, mock
+
+from utils.cache import LRUCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class LRUCacheTest(TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        patcher = mock.patch("utils.cache.time.monotonic", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_capacity_evicts_least_recently_used(self):
+        cache = LRUCache(capacity=2)
+        cache["a"] = 1
+        cache["b"] = 2
+        cache.get("a")
+        cache["c"] = 3
+        self.assertEqual(list(cache), ["a", "c"])
+        self.assertEqual(cache.stats, {"size": 2, "capacity": 2, "hits": 1, "misses": 0, "evictions": 1})
+
+    def test_ttl(self):
+        cache = LRUCache(ttl=10)
+        cache["a"] = 1
+        cache["b"] = 2
+        self.clock.now = 5
+        self.assertEqual(cache.get("a"), 1) # using it keeps it alive
+        self.clock.now = 12
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual((cache.hits, cache.misses, cache.evictions), (2, 1, 1))
+        self.assertNotIn("b", cache)
+
+    def test_writes_expire_old_entries(self):
+        cache = LRUCache(ttl=10)
+        cache["a"] = 1
+        self.clock.now = 11
+        cache["b"] = 2
+        self.assertEqual(list(cache), ["b"])
+        self.assertEqual(cache.evictions, 1)
+
+    def test_missing(self):
+        cache = LRUCache()
+        with self.assertRaises(KeyError):
+            cache["a"]
+
+        self.assertEqual(cache.pop("a", 5), 5)
+        self.assertEqual(cache.misses, 1)
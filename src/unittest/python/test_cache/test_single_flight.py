@@ -0,0 +1,64 @@
+import asyncio
+from unittest import TestCase
+
+from utils.cache import SingleFlight
+
+
+class SingleFlightTest(TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.flights = SingleFlight()
+        self.calls = 0
+
+    def tearDown(self):
+        asyncio.set_event_loop(None)
+        self.loop.close()
+
+    async def work(self, value):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return value
+
+    def test_concurrent_calls_share_one(self):
+        async def run():
+            results = await asyncio.gather(*(self.flights.do("key", self.work, i) for i in range(5)))
+            self.assertEqual(results, [0] * 5)
+            self.assertEqual(self.calls, 1)
+            self.assertNotIn("key", self.flights)
+            self.assertEqual(await self.flights.do("key", self.work, 7), 7) # a new call once the last one is done
+
+        self.loop.run_until_complete(run())
+
+    def test_cancelling_one_caller(self):
+        async def run():
+            first = asyncio.ensure_future(self.flights.do("key", self.work, 1))
+            second = asyncio.ensure_future(self.flights.do("key", self.work, 2))
+            await asyncio.sleep(0)
+            first.cancel()
+            self.assertEqual(await second, 1)
+
+        self.loop.run_until_complete(run())
+
+    def test_errors_reach_every_caller(self):
+        async def fail():
+            await asyncio.sleep(0)
+            raise ValueError
+
+        async def run():
+            results = await asyncio.gather(self.flights.do("key", fail), self.flights.do("key", fail), return_exceptions=True)
+            self.assertTrue(all(isinstance(result, ValueError) for result in results))
+
+        self.loop.run_until_complete(run())
+
+    def test_lead(self):
+        async def run():
+            future = self.flights.lead("key")
+            self.assertIsNone(self.flights.lead("key"))
+            waiter = asyncio.ensure_future(self.flights.do("key", self.work, 5))
+            await asyncio.sleep(0)
+            future.set_result(3)
+            self.assertEqual(await waiter, 3)
+            self.assertEqual(self.calls, 0)
+
+        self.loop.run_until_complete(run())
@@ -0,0 +1,53 @@
+import types
+from unittest import TestCase
+
+from utils.cache import UserCache
+
+
+def user(id, discord_id=None, twitch_id=None, twitch_name=None):
+    return types.SimpleNamespace(id=id, discord_id=discord_id, twitch_id=twitch_id, twitch_name=twitch_name)
+
+
+class UserCacheTest(TestCase):
+    def setUp(self):
+        self.cache = UserCache(capacity=2)
+
+    def test_every_identity(self):
+        u = user(1, 10, 20, "Name")
+        self.cache.add(u)
+        self.assertIs(self.cache.get(1), u)
+        self.assertIs(self.cache.get_discord(10), u)
+        self.assertIs(self.cache.get_twitch_id(20), u)
+        self.assertIs(self.cache.get_twitch_name("NAME"), u)
+        self.assertIsNone(self.cache.get_discord(20))
+
+    def test_link_and_rename(self):
+        u = user(1, twitch_id=20, twitch_name="old")
+        self.cache.add(u)
+        u.discord_id = 10
+        u.twitch_name = "new"
+        self.cache.reindex(u)
+        self.assertIs(self.cache.get_discord(10), u)
+        self.assertIs(self.cache.get_twitch_name("new"), u)
+        self.assertIsNone(self.cache.get_twitch_name("old"))
+
+    def test_merged_account_is_removed(self):
+        twitch, discord = user(1, twitch_id=20, twitch_name="name"), user(2, discord_id=10)
+        self.cache.add(twitch)
+        self.cache.add(discord)
+        self.cache.remove(1)
+        discord.twitch_id, discord.twitch_name = 20, "name"
+        self.cache.reindex(discord)
+        self.assertIs(self.cache.get_twitch_id(20), discord)
+        self.assertIs(self.cache.get_twitch_name("name"), discord)
+        self.assertIsNone(self.cache.get(1))
+
+    def test_eviction_drops_every_index(self):
+        self.cache.add(user(1, 10, 20, "a"))
+        self.cache.add(user(2, 11))
+        self.cache.add(user(3, 12))
+        self.assertEqual(self.cache.evictions, 1)
+        self.assertIsNone(self.cache.get_discord(10))
+        self.assertIsNone(self.cache.get_twitch_id(20))
+        self.assertIsNone(self.cache.get_twitch_name("a"))
+        self.assertEqual((self.cache._discord.keys(), self.cache._twitch_id, self.cache._twitch_name), ({11, 12}, {}, {}))
@@ -0,0 +1,77 @@
+import types
+from unittest import TestCase, skipIf
+
+try:
+    from addons.discord import currency
+except ImportError: # discord.py isn't installed
+    currency = None
+
+
+def message(user_id):
+    return types.SimpleNamespace(author=types.SimpleNamespace(id=user_id))
+
+
+@skipIf(currency is None, "discord.py is not installed")
+class BucketTest(TestCase):
+    def test_triggers_once_over_the_rate(self):
+        bucket = currency.Bucket(3, 60)
+        self.assertEqual([bucket.update(t) for t in range(4)], [False, False, False, True])
+        self.assertTrue(bucket.is_locked)
+        self.assertFalse(bucket.update(4)) # locked until the window has passed
+        self.assertEqual(len(bucket.keys), 4) # never more than rate + 1 times are kept
+
+    def test_unlocks_after_the_window(self):
+        bucket = currency.Bucket(3, 60)
+        for t in range(4):
+            bucket.update(t)
+
+        self.assertEqual([bucket.update(t) for t in range(100, 104)], [False, False, False, True])
+
+    def test_slow_messages_never_trigger(self):
+        bucket = currency.Bucket(3, 60)
+        self.assertFalse(any(bucket.update(t * 30) for t in range(20)))
+
+    def test_expires(self):
+        bucket = currency.Bucket(3, 60)
+        bucket.update(10)
+        self.assertEqual(bucket.expires, 70)
+
+
+@skipIf(currency is None, "discord.py is not installed")
+class ActivityMappingTest(TestCase):
+    def setUp(self):
+        self.mapping = currency.ActivityMapping(5, 60)
+
+    def test_idle_users_are_reclaimed(self):
+        self.mapping.update_limit(message(1), now=0)
+        self.mapping.update_limit(message(2), now=200) # user 1 expired at 60, and its tick has passed
+        self.assertNotIn(1, self.mapping._lower_cache)
+        self.assertNotIn(1, self.mapping._bonus_cache)
+        self.assertIn(2, self.mapping._lower_cache)
+
+    def test_active_users_are_kept(self):
+        self.mapping.update_limit(message(1), now=0)
+        self.mapping.update_limit(message(1), now=100) # moves user 1 to a later tick
+        self.mapping.update_limit(message(2), now=150)
+        self.assertIn(1, self.mapping._lower_cache)
+
+        self.mapping.update_limit(message(2), now=300)
+        self.assertNotIn(1, self.mapping._lower_cache)
+
+    def test_reclaim_is_sliced(self):
+        for user in range(100):
+            self.mapping.update_limit(message(user), now=0)
+
+        self.mapping.update_limit(message(-1), now=1000)
+        self.assertGreater(len(self.mapping._lower_cache), 100 - currency.ActivityMapping.RECLAIM_SLICE)
+
+        for t in range(1001, 1020):
+            self.mapping.update_limit(message(-1), now=t)
+
+        self.assertEqual(list(self.mapping._lower_cache), [-1])
+
+    def test_payouts(self):
+        results = [self.mapping.update_limit(message(1), now=t) for t in range(16)]
+        self.assertEqual(results[5], (True, False))
+        self.assertEqual(results[15], (False, True))
+        self.assertEqual(sum(low for low, _ in results), 1)
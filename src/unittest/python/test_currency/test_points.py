@@ -0,0 +1,113 @@
+import asyncio
+import types
+from unittest import TestCase
+
+from utils import currency
+
+
+class Database:
+    def __init__(self):
+        self.points = {}
+        self.fail = False
+
+    async def executemany(self, stmt, values):
+        await asyncio.sleep(0)
+        if self.fail:
+            raise RuntimeError("database is locked")
+
+        for amount, id in values:
+            self.points[id] = self.points.get(id, 0) + amount
+
+
+class Leaderboard:
+    def __init__(self):
+        self.points = {}
+
+    def update(self, id, points):
+        self.points[id] = points
+
+
+def user(id, points=0):
+    return types.SimpleNamespace(id=id, points=points)
+
+
+class PointsAccumulatorTest(TestCase):
+    def setUp(self):
+        # the accumulator's lock belongs to the loop that is current when it is made
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.system = types.SimpleNamespace(db=Database(), leaderboard=Leaderboard())
+        self.points = currency.PointsAccumulator(self.system)
+
+    def tearDown(self):
+        asyncio.set_event_loop(None)
+        self.loop.close()
+
+    def test_changes_are_batched(self):
+        async def run():
+            a, b = user(1, 10), user(2)
+            self.points.add(a, 5)
+            self.points.add(a, -2)
+            self.points.add(b, 4)
+            self.points.add(b, 0)
+            self.assertEqual((a.points, b.points), (13, 4))
+            self.assertEqual(self.system.leaderboard.points, {1: 13, 2: 4})
+            self.assertEqual(self.points.pending(1), 3)
+            self.assertEqual(self.system.db.points, {})
+
+            await self.points.flush()
+            self.assertEqual(self.system.db.points, {1: 3, 2: 4})
+            self.assertEqual(self.points.pending(1), 0)
+            self.assertEqual(len(self.points), 0)
+
+        self.loop.run_until_complete(run())
+
+    def test_loaded_users_see_unwritten_points(self):
+        self.points.add(user(1), 7)
+        loaded = user(1, 100) # as read from the database, before the batch is written
+        self.points.apply(loaded)
+        self.assertEqual(loaded.points, 107)
+
+    def test_failed_flush_keeps_changes(self):
+        async def run():
+            self.points.add(user(1), 5)
+            self.system.db.fail = True
+            with self.assertRaises(RuntimeError):
+                await self.points.flush()
+
+            self.assertEqual(self.points.pending(1), 5)
+            self.system.db.fail = False
+            await self.points.flush()
+            self.assertEqual(self.system.db.points, {1: 5})
+
+        self.loop.run_until_complete(run())
+
+    def test_changes_during_a_flush(self):
+        async def run():
+            u = user(1)
+            self.points.add(u, 5)
+            flush = asyncio.ensure_future(self.points.flush())
+            await asyncio.sleep(0)
+            self.points.add(u, 3) # lands while the first batch is being written
+            self.assertEqual(self.points.pending(1), 8)
+            await flush
+            self.assertEqual(self.points.pending(1), 3)
+            await self.points.flush()
+            self.assertEqual(self.system.db.points, {1: 8})
+
+        self.loop.run_until_complete(run())
+
+    def test_hold_and_move(self):
+        async def run():
+            self.points.add(user(1), 5)
+            self.points.add(user(2), 1)
+            async with self.points.hold():
+                flush = asyncio.ensure_future(self.points.flush())
+                await asyncio.sleep(0.01)
+                self.assertEqual(self.system.db.points, {}) # nothing is written while held
+                self.points.move(1, 2)
+
+            await flush
+            self.assertEqual(self.system.db.points, {2: 6})
+
+        self.loop.run_until_complete(run())
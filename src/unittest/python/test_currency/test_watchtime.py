@@ -0,0 +1,83 @@
+import asyncio
+import types
+from unittest import TestCase
+
+from utils import currency
+
+
+class Connection:
+    def __init__(self):
+        self.hours = {}
+        self.points = {}
+
+    async def executemany(self, stmt, values):
+        for hours, points, id in values:
+            self.hours[id] = self.hours.get(id, 0) + hours
+            self.points[id] = self.points.get(id, 0) + points
+
+
+class System:
+    def __init__(self, payout=3):
+        self.conn = Connection()
+        self.users = {}
+        self.ranked = {}
+        self.config = types.SimpleNamespace(getint=lambda section, key, fallback=None: payout)
+        self.leaderboard = types.SimpleNamespace(update=self.ranked.__setitem__)
+
+    async def get_users_bulk(self, twitch_names=(), write=None):
+        users = {}
+        for name in twitch_names:
+            if name not in self.users:
+                self.users[name] = types.SimpleNamespace(id=len(self.users) + 1, hours=0, points=0)
+            users[name] = self.users[name]
+
+        await write(self.conn, users)
+        return users
+
+
+class Tracker(currency.WatchTimeTracker):
+    def __init__(self, system):
+        super().__init__(system)
+        self.names = set()
+
+    async def snapshot(self):
+        return self.names
+
+
+class WatchTimeTrackerTest(TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.system = System()
+        self.tracker = Tracker(self.system)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def tick(self, now, *names):
+        self.tracker.names = set(names)
+        return self.loop.run_until_complete(self.tracker.tick(now))
+
+    def test_only_those_who_stayed_are_credited(self):
+        self.assertEqual(self.tick(0, "a", "b"), 0) # nothing to compare against yet
+        self.assertEqual(self.tick(300, "a", "c"), 1)
+        user = self.system.users["a"]
+        self.assertEqual(self.system.conn.points, {user.id: 3}) # in the same transaction as the hours
+        self.assertEqual(self.system.conn.hours, {user.id: 0})
+        self.assertEqual((user.points, self.system.ranked), (3, {user.id: 3}))
+
+    def test_whole_hours_are_written(self):
+        self.tick(0, "a")
+        for now in range(1200, 4800, 1200):
+            self.tick(now, "a")
+
+        user = self.system.users["a"]
+        self.assertEqual(self.system.conn.hours, {user.id: 1})
+        self.assertEqual(user.hours, 1)
+        self.assertEqual(self.tracker._seconds, {"a": 0})
+
+    def test_leaving_drops_carried_time(self):
+        self.tick(0, "a")
+        self.tick(3000, "a")
+        self.tick(3300, "b")
+        self.assertEqual(self.tracker._seconds, {})
+        self.assertEqual(self.system.conn.hours, {self.system.users["a"].id: 0})
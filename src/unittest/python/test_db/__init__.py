@@ -0,0 +1,57 @@
+import asyncio
+import configparser
+import pathlib
+import sqlite3
+import tempfile
+import types
+import unittest
+
+try:
+    from utils import db
+except ImportError: # aiosqlite3 and the interface need their full environment
+    db = None
+
+SCHEMA = pathlib.Path(__file__).parents[3] / "main" / "resources" / "base" / "schema.sql"
+
+
+@unittest.skipIf(db is None, "the database dependencies are not installed")
+class DatabaseTestCase(unittest.TestCase):
+    """
+    Runs each test against a fresh data.db in a temporary directory
+    """
+    options = {}
+
+    def setUp(self):
+        # the database lock belongs to the loop that is current when it is made
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.dir.name, "data.db")
+        self.db = self.open()
+
+    def tearDown(self):
+        self.run_async(self.db.close())
+        asyncio.set_event_loop(None)
+        self.loop.close()
+        self.dir.cleanup()
+
+    def open(self, **options) -> "db.Database":
+        config = configparser.ConfigParser()
+        config.read_dict({"database": {**self.options, **options}})
+        app = types.SimpleNamespace(get_resource=lambda name: str(SCHEMA))
+        database = db.Database(types.SimpleNamespace(config=config, interface=types.SimpleNamespace(app=app)))
+        database.db_path = self.path
+        return database
+
+    def run_async(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    def committed(self, stmt: str, *values) -> list:
+        """
+        Reads from a separate connection, which only sees what has been committed
+        """
+        conn = sqlite3.connect(str(self.path))
+        try:
+            return conn.execute(stmt, values).fetchall()
+        finally:
+            conn.close()
@@ -0,0 +1,105 @@
+import asyncio
+import sqlite3
+
+from . import DatabaseTestCase
+
+INSERT = "INSERT INTO accounts VALUES (?,?,?,?,?,?,?,?)"
+
+
+def account(id, points=0):
+    return None, f"user{id}", None, id, points, 0, 0, ""
+
+
+class GroupCommitTest(DatabaseTestCase):
+    options = {"group_commit": "true", "group_commit_window": "10000", "group_commit_size": "3"}
+
+    def test_reads_see_pending_writes(self):
+        async def run():
+            await self.db.execute(INSERT, *account(1, 5))
+            self.assertEqual(self.db._pending, 1)
+            self.assertEqual(self.committed("SELECT id FROM accounts"), []) # not committed yet
+            self.assertEqual(await self.db.fetchval("SELECT points FROM accounts WHERE id = ?", 1), 5)
+
+            await self.db.flush()
+            self.assertEqual(self.db._pending, 0)
+            self.assertEqual(self.committed("SELECT id FROM accounts"), [(1,)])
+
+        self.run_async(run())
+
+    def test_full_group_commits(self):
+        async def run():
+            await self.db.executemany(INSERT, [account(1), account(2)])
+            await self.db.execute(INSERT, *account(3))
+            self.assertEqual(self.db._pending, 0)
+            self.assertEqual(len(self.committed("SELECT id FROM accounts")), 3)
+
+        self.run_async(run())
+
+    def test_window_commits(self):
+        async def run():
+            self.db.commit_window = 0.01
+            await self.db.execute(INSERT, *account(1))
+            await asyncio.sleep(0.2)
+            self.assertEqual(self.committed("SELECT id FROM accounts"), [(1,)])
+
+        self.run_async(run())
+
+    def test_transactions_nest_in_the_group(self):
+        async def run():
+            await self.db.execute(INSERT, *account(1))
+            with self.assertRaises(RuntimeError):
+                async with self.db.transaction() as conn:
+                    await conn.execute(INSERT, account(2))
+                    raise RuntimeError
+
+            async with self.db.transaction() as conn:
+                await conn.execute(INSERT, account(3))
+
+            await self.db.flush()
+            self.assertEqual(self.committed("SELECT id FROM accounts ORDER BY id"), [(1,), (3,)])
+
+        self.run_async(run())
+
+    def test_lost_group_is_raised(self):
+        async def run():
+            self.db.commit_window = 0.01
+            await self.db.execute(INSERT, *account(1))
+            connection = self.db.connection
+            commit = connection.commit
+
+            async def fail():
+                await connection.rollback() # like a full disk, sqlite gives up on the transaction
+                raise sqlite3.OperationalError("database or disk is full")
+
+            connection.commit = fail
+            with self.assertLogs("xlydn.db", "ERROR"):
+                await asyncio.sleep(0.2)
+
+            connection.commit = commit
+            with self.assertRaises(sqlite3.OperationalError):
+                await self.db.execute(INSERT, *account(2))
+
+            await self.db.flush() # only raised once
+            self.assertEqual(self.committed("SELECT id FROM accounts"), [])
+
+        self.run_async(run())
+
+    def test_busy_commit_is_tried_again(self):
+        async def run():
+            self.db.commit_window = 0.01
+            await self.db.execute(INSERT, *account(1))
+            connection = self.db.connection
+            commit = connection.commit
+
+            async def busy():
+                connection.commit = commit
+                raise sqlite3.OperationalError("database is locked")
+
+            connection.commit = busy
+            with self.assertLogs("xlydn.db", "WARNING"):
+                await asyncio.sleep(0.2)
+
+            self.assertEqual(self.committed("SELECT id FROM accounts"), [(1,)])
+            await self.db.flush()
+
+        self.run_async(run())
@@ -0,0 +1,41 @@
+import sqlite3
+
+from utils.migrations import MIGRATIONS
+from . import SCHEMA, DatabaseTestCase
+
+
+class MigrationTest(DatabaseTestCase):
+    def version(self) -> int:
+        return self.committed("PRAGMA user_version")[0][0]
+
+    def test_new_database(self):
+        self.run_async(self.db.setup())
+        self.assertEqual(self.version(), len(MIGRATIONS))
+        indexes = {name for name, in self.committed("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        self.assertIn("accounts_twitch_username_idx", indexes)
+        self.assertTrue(self.committed("SELECT name FROM sqlite_master WHERE name = 'automod_pastas'"))
+
+    def test_existing_database_is_upgraded(self):
+        # a data.db from before migrations existed
+        conn = sqlite3.connect(str(self.path))
+        conn.executescript(SCHEMA.read_text(encoding="utf8"))
+        conn.execute("INSERT INTO accounts VALUES (?,?,?,?,?,?,?,?)", (None, "MixedCase", None, 1, 5, 0, 0, ""))
+        conn.commit()
+        conn.close()
+
+        self.run_async(self.db.setup())
+        self.assertEqual(self.version(), len(MIGRATIONS))
+        self.assertEqual(self.committed("SELECT twitch_username FROM accounts"), [("mixedcase",)])
+
+    def test_applied_migrations_are_skipped(self):
+        self.run_async(self.db.setup())
+        self.run_async(self.db.close())
+        conn = sqlite3.connect(str(self.path))
+        conn.execute("INSERT INTO accounts VALUES (?,?,?,?,?,?,?,?)", (None, "MixedCase", None, 1, 5, 0, 0, ""))
+        conn.commit()
+        conn.close()
+
+        self.db = self.open() # a restart
+        self.run_async(self.db.setup())
+        self.assertEqual(self.version(), len(MIGRATIONS))
+        self.assertEqual(self.committed("SELECT twitch_username FROM accounts"), [("MixedCase",)]) # 2 didn't run again
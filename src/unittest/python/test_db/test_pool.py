@@ -0,0 +1,74 @@
+import asyncio
+
+from . import DatabaseTestCase
+
+INSERT = "INSERT INTO accounts VALUES (?,?,?,?,?,?,?,?)"
+
+
+class ReaderPoolTest(DatabaseTestCase):
+    options = {"pool_size": "2"}
+
+    def test_reads_use_the_pool(self):
+        async def run():
+            await self.db.execute(INSERT, None, "a", None, 1, 5, 0, 0, "")
+            async with self.db._reader() as conn:
+                self.assertIsNot(conn, self.db.connection)
+                self.assertEqual((await (await conn.execute("SELECT points FROM accounts")).fetchone())[0], 5)
+
+            self.assertEqual(self.db.readers.qsize(), 2)
+
+        self.run_async(run())
+
+    def test_readers_cannot_write(self):
+        async def run():
+            await self.db.setup()
+            async with self.db._reader() as conn:
+                with self.assertRaises(Exception):
+                    await conn.execute(INSERT, (None, "a", None, 1, 5, 0, 0, ""))
+
+        self.run_async(run())
+
+    def test_concurrent_reads(self):
+        async def run():
+            await self.db.executemany(INSERT, [(None, f"u{i}", None, i, i, 0, 0, "") for i in range(50)])
+            seen = set()
+
+            async def read(i):
+                async with self.db._reader() as conn:
+                    seen.add(id(conn))
+                    await asyncio.sleep(0.01) # hold it, so the other reads need another connection
+                    return (await (await conn.execute("SELECT points FROM accounts WHERE id = ?", (i,))).fetchone())[0]
+
+            self.assertEqual(await asyncio.gather(*(read(i) for i in range(10))), list(range(10)))
+            self.assertEqual(len(seen), 2)
+            self.assertEqual(self.db.readers.qsize(), 2) # every connection went back
+
+        self.run_async(run())
+
+    def test_iterate_releases_the_connection(self):
+        async def run():
+            await self.db.executemany(INSERT, [(None, f"u{i}", None, i, i, 0, 0, "") for i in range(1, 8)])
+            ids = []
+            async for id, points in self.db.iterate("SELECT id, points FROM accounts WHERE id > ? ORDER BY id LIMIT ?", size=3):
+                ids.append(id)
+                self.assertEqual(self.db.readers.qsize(), 2) # nothing is held between chunks
+                await self.db.execute("UPDATE accounts SET points = points + 1 WHERE id = ?", id)
+
+            self.assertEqual(ids, list(range(1, 8)))
+
+        self.run_async(run())
+
+
+class NoPoolTest(DatabaseTestCase):
+    options = {"pool_size": "0"}
+
+    def test_reads_use_the_writer(self):
+        async def run():
+            await self.db.execute(INSERT, None, "a", None, 1, 5, 0, 0, "")
+            self.assertIsNone(self.db.readers)
+            async with self.db._reader() as conn:
+                self.assertIs(conn, self.db.connection)
+
+            self.assertEqual(await self.db.fetchval("SELECT points FROM accounts"), 5)
+
+        self.run_async(run())
@@ -0,0 +1,87 @@
+import asyncio
+import configparser
+import sqlite3
+import tempfile
+import types
+from unittest import TestCase, skipIf
+
+from . import DatabaseTestCase
+
+try:
+    from addons.discord.mod import StrikeLedger, StrikesValues
+except ImportError: # discord.py isn't installed
+    StrikeLedger = StrikesValues = None
+
+
+@skipIf(StrikeLedger is None, "discord.py is not installed")
+class StrikeLedgerTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.ledger = StrikeLedger(self.db)
+
+    def test_add(self):
+        self.assertEqual(self.run_async(self.ledger.add(1, 9, 2, "spam"))[:2], (0, 2))
+        prev, after, case = self.run_async(self.ledger.add(1, 9, 1, None))
+        self.assertEqual((prev, after), (2, 3))
+        self.assertEqual(self.committed("SELECT amount FROM strikes WHERE user_id = 1"), [(3,)])
+        self.assertEqual(self.committed("SELECT rowid, reason FROM mod_cases WHERE user_id = 1"), [(case - 1, "spam"), (case, None)])
+
+    def test_loads_existing_counts(self):
+        self.run_async(self.ledger.add(1, 9, 4, None))
+        ledger = StrikeLedger(self.db)
+        self.assertEqual(self.run_async(ledger.add(1, 9, 1, None))[:2], (4, 5))
+
+    def test_concurrent_adds(self):
+        async def run():
+            return await asyncio.gather(*(self.ledger.add(1, 9, 1, None) for _ in range(5)))
+
+        results = self.run_async(run())
+        self.assertEqual(sorted((prev, after) for prev, after, _ in results), [(n, n + 1) for n in range(5)])
+        self.assertEqual(len({case for _, _, case in results}), 5)
+        self.assertEqual(self.committed("SELECT amount FROM strikes WHERE user_id = 1"), [(5,)])
+
+    def test_failure_rolls_back(self):
+        self.run_async(self.ledger.add(1, 9, 1, None))
+        conn = sqlite3.connect(str(self.path))
+        conn.execute("CREATE TRIGGER no_cases BEFORE INSERT ON mod_cases BEGIN SELECT RAISE(ABORT, 'no cases'); END")
+        conn.commit()
+        conn.close()
+
+        with self.assertRaises(sqlite3.Error):
+            self.run_async(self.ledger.add(1, 9, 2, None))
+
+        self.assertEqual(self.ledger._counts[1], 1)
+        self.assertEqual(self.committed("SELECT amount FROM strikes WHERE user_id = 1"), [(1,)])
+        self.assertEqual(self.committed("SELECT count(*) FROM mod_cases"), [(1,)])
+
+
+@skipIf(StrikesValues is None, "discord.py is not installed")
+class StrikesValuesTest(TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        interface = types.SimpleNamespace(get_data_location=lambda: self.dir.name)
+        self.values = StrikesValues(types.SimpleNamespace(config=configparser.ConfigParser(), interface=interface))
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def levels(self, **levels):
+        self.values._value["levels"] = {name[1:]: action for name, action in levels.items()}
+        self.values.compile()
+
+    def test_no_levels(self):
+        self.assertIsNone(self.values.punishment(3))
+        self.assertEqual(self.values.standing(3), 0)
+
+    def test_punishment(self):
+        self.levels(_3=1, _10=2, _6=3)
+        self.assertIsNone(self.values.punishment(1))
+        self.assertEqual(self.values.punishment(3), self.values.punish_tempmute)
+        self.assertIsNone(self.values.punishment(5)) # between levels
+        self.assertEqual(self.values.punishment(6), self.values.punish_softban)
+        self.assertEqual(self.values.punishment(10), self.values.punish_kick)
+        self.assertEqual(self.values.punishment(11), self.values.punish_ban) # past the highest level
+
+    def test_standing(self):
+        self.levels(_3=1, _10=2, _6=3)
+        self.assertEqual([self.values.standing(n) for n in (0, 2, 3, 5, 6, 9, 10, 50)], [0, 0, 1, 1, 3, 3, 2, 2])
@@ -0,0 +1,81 @@
+import asyncio
+from unittest import skipIf
+
+from . import DatabaseTestCase
+
+try:
+    from utils import bot, cache, currency, leaderboard
+except ImportError: # discord.py and twitchio aren't installed
+    bot = None
+
+
+@skipIf(bot is None, "the bot dependencies are not installed")
+class UserLookupTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        # only the parts of the system that user lookups need
+        system = self.system = bot.System.__new__(bot.System)
+        system.db = self.db
+        system.user_cache = cache.UserCache()
+        system.flights = cache.SingleFlight()
+        system.create_lock = asyncio.Lock()
+        system.points = currency.PointsAccumulator(system)
+        system.leaderboard = leaderboard.Leaderboard(system)
+
+    def rows(self):
+        return self.committed("SELECT twitch_userid, twitch_username, discord_id FROM accounts ORDER BY twitch_username")
+
+    def test_concurrent_lookups_create_one_account(self):
+        async def run():
+            results = await asyncio.gather(
+                *(self.system.get_user_twitch_name("Newbie", id=42) for _ in range(3)),
+                self.system.get_users_bulk(twitch_names=["newbie", "other"])
+            )
+            self.assertEqual(len({user.id for user in results[:3]} | {results[3]["newbie"].id}), 1)
+
+        self.run_async(run())
+        self.assertEqual([name for _, name, _ in self.rows()], ["newbie", "other"])
+
+    def test_bulk_sees_accounts_created_by_another_identity(self):
+        async def run():
+            async with self.system.create_lock:
+                bulk = asyncio.ensure_future(self.system.get_users_bulk(twitch_names=["newbie"]))
+                await asyncio.sleep(0.1) # looked up, found nothing, and is now waiting to create it
+                # meanwhile a lookup by twitch id creates the same person
+                created = await self.system.create_user(twitch_id=42, twitch_username="newbie")
+                self.system.user_cache.remove(created.id) # as if it had been evicted since
+
+            self.assertEqual((await bulk)["newbie"].id, created.id)
+
+        self.run_async(run())
+        self.assertEqual(self.rows(), [(42, "newbie", None)])
+
+    def test_bulk_resolves_cached_and_stored_users(self):
+        async def run():
+            stored = await self.system.create_user(discord_id=7)
+            self.system.user_cache.remove(stored.id)
+            cached = await self.system.get_user_twitch_name("cached")
+            users = await self.system.get_users_bulk(twitch_names=["CACHED", "new"], discord_ids=[7])
+            self.assertIs(users["cached"], cached)
+            self.assertEqual(users[7].id, stored.id)
+            self.assertEqual(users["new"].twitch_name, "new")
+
+            again = await self.system.get_users_bulk(twitch_names=["new"], create=False)
+            self.assertIs(again["new"], users["new"])
+
+        self.run_async(run())
+        self.assertEqual(len(self.rows()), 3)
+
+    def test_write_shares_the_transaction(self):
+        async def run():
+            async def write(conn, users):
+                await conn.execute("UPDATE accounts SET hours = 1 WHERE id = ?", (users["new"].id,))
+                raise RuntimeError
+
+            with self.assertRaises(RuntimeError):
+                await self.system.get_users_bulk(twitch_names=["new"], write=write)
+
+            self.assertIsNone(self.system.user_cache.get_twitch_name("new"))
+
+        self.run_async(run())
+        self.assertEqual(self.rows(), []) # the new account was rolled back with the write
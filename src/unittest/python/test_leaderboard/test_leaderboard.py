@@ -0,0 +1,101 @@
+import asyncio
+import types
+from unittest import TestCase
+
+from utils import leaderboard
+
+
+class Database:
+    def __init__(self, points):
+        self.points = dict(points)
+        self.fail = 0
+        self.during = None # called between chunks, like other tasks writing while the build runs
+
+    async def iterate(self, stmt, *values, start=0, size=2):
+        if self.fail:
+            self.fail -= 1
+            raise RuntimeError("database is locked")
+
+        key = start
+        while True:
+            rows = sorted((id, points) for id, points in self.points.items() if id > key)[:size]
+            for row in rows:
+                yield row
+
+            if self.during is not None:
+                self.during()
+
+            if len(rows) < size:
+                break
+
+            key = rows[-1][0]
+
+
+class Points:
+    def __init__(self, pending=None):
+        self._pending = pending or {}
+
+    def pending(self, id):
+        return self._pending.get(id, 0)
+
+
+class LeaderboardTest(TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.db = Database({1: 10, 2: 30, 3: 20, 4: 30, 5: 0})
+        self.board = leaderboard.Leaderboard(types.SimpleNamespace(db=self.db, points=Points({5: 25})))
+
+    def tearDown(self):
+        self.loop.close()
+
+    def build(self):
+        return self.loop.run_until_complete(self.board.rebuild())
+
+    def test_ranks(self):
+        self.assertTrue(self.build())
+        self.assertEqual(self.board.top(), [(2, 30), (4, 30), (5, 25), (3, 20), (1, 10)])
+        self.assertEqual(self.board.top(2, 1), [(4, 30), (5, 25)])
+        self.assertEqual(self.board.rank(5), 3)
+        self.assertIsNone(self.board.rank(6))
+
+    def test_changes(self):
+        self.build()
+        self.board.update(1, 100)
+        self.board.remove(2)
+        self.board.update(6, 0)
+        self.assertEqual(self.board.top(), [(1, 100), (4, 30), (5, 25), (3, 20), (6, 0)])
+        self.assertEqual(self.board.rank(1), 1)
+
+    def test_changes_while_building(self):
+        def during():
+            self.board.update(1, 50)
+            self.board.remove(4)
+            self.db.during = None
+
+        self.board.update(3, 5) # before the build even started
+        self.db.during = during
+        self.build()
+        self.assertEqual(self.board.top(), [(1, 50), (2, 30), (5, 25), (3, 5)])
+
+    def test_overflow_starts_over(self):
+        def during():
+            for id in range(leaderboard.MAX_EARLY + 1):
+                self.board.update(id + 100, 0)
+
+            self.db.during = None
+
+        self.db.during = during
+        self.assertFalse(self.build())
+        self.assertFalse(self.board.ready)
+        self.assertEqual(self.board._early, {})
+        self.assertTrue(self.build())
+        self.assertEqual(len(self.board), 5)
+
+    def test_failed_build_is_retried(self):
+        self.db.fail = 1
+        with self.assertLogs("xlydn.leaderboard", "ERROR"):
+            task = self.loop.create_task(self.board._run())
+            self.loop.run_until_complete(asyncio.wait_for(task, 5))
+
+        self.assertTrue(self.board.ready)
+        self.assertEqual(self.board.rank(2), 1)
@@ -0,0 +1,52 @@
+import random
+from unittest import TestCase
+
+from utils.leaderboard import SkipList
+
+
+class SkipListTest(TestCase):
+    def assertMatches(self, skiplist, expected):
+        self.assertEqual(len(skiplist), len(expected))
+        self.assertEqual(skiplist.slice(0, len(expected) + 1), expected)
+        for i, key in enumerate(expected):
+            self.assertEqual(skiplist.index(key), i)
+
+    def test_random_operations(self):
+        rng = random.Random(0)
+        skiplist, expected = SkipList(), []
+        for _ in range(2000):
+            key = rng.randint(0, 300)
+            if key in expected:
+                self.assertTrue(skiplist.remove(key))
+                expected.remove(key)
+            else:
+                skiplist.insert(key)
+                expected.append(key)
+                expected.sort()
+
+        self.assertMatches(skiplist, expected)
+        self.assertFalse(skiplist.remove(-1))
+        self.assertIsNone(skiplist.index(-1))
+
+    def test_append_then_change(self):
+        skiplist = SkipList()
+        for key in range(0, 200, 2):
+            skiplist.append(key)
+
+        self.assertMatches(skiplist, list(range(0, 200, 2)))
+        skiplist.insert(51)
+        skiplist.remove(0)
+        skiplist.append(500) # falls back to insert once the list has changed
+        skiplist.append(-5)
+        self.assertMatches(skiplist, sorted([-5, 51, 500] + list(range(2, 200, 2))))
+
+    def test_slice(self):
+        skiplist = SkipList()
+        for key in range(10):
+            skiplist.append(key)
+
+        self.assertEqual(skiplist.slice(3, 4), [3, 4, 5, 6])
+        self.assertEqual(skiplist.slice(8, 5), [8, 9])
+        self.assertEqual(skiplist.slice(10, 1), [])
+        self.assertEqual(skiplist.slice(-1, 1), [])
+        self.assertEqual(skiplist.slice(0, 0), [])
@@ -0,0 +1,99 @@
+import asyncio
+import types
+from unittest import TestCase, mock, skipIf
+
+try:
+    from utils import common
+except ImportError: # discord.py isn't installed
+    common = None
+
+
+class Channel:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, content):
+        self.sent.append(content)
+
+
+class Timer:
+    def __init__(self, delay, minlines, place=0, shared=False):
+        self.delay = delay
+        self.minlines = minlines
+        self.place = place
+        self.shared = shared
+        self.channel = 1
+
+    def next_content(self, platform):
+        return "discord" if platform == common.DISCORD else "twitch"
+
+
+@skipIf(common is None, "discord.py is not installed")
+class ChatTimerEngineTest(TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.twitch, self.discord = Channel(), Channel()
+        system = types.SimpleNamespace(
+            loop=self.loop,
+            discord_bot=types.SimpleNamespace(get_channel=lambda id: self.discord),
+            twitch_bot=types.SimpleNamespace(get_channel=lambda name: self.twitch),
+            twitch_streamer=types.SimpleNamespace(_ws=types.SimpleNamespace(nick="streamer"))
+        )
+        self.engine = common.ChatTimerEngine(system)
+        patcher = mock.patch("utils.common.MIN_TIMER_DELAY", 0.01)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        if self.engine._task is not None:
+            self.engine._task.cancel()
+            self.loop.run_until_complete(asyncio.gather(self.engine._task, return_exceptions=True))
+
+        asyncio.set_event_loop(None)
+        self.loop.close()
+
+    def sleep(self, seconds):
+        self.loop.run_until_complete(asyncio.sleep(seconds))
+
+    def test_waits_for_lines(self):
+        self.engine.add(Timer(delay=0.02, minlines=3))
+        self.sleep(0.1)
+        self.assertEqual(self.twitch.sent, []) # the delay has passed, but not enough lines
+        for _ in range(2):
+            self.engine.on_message(common.TWITCH)
+
+        self.engine.on_message(common.DISCORD) # counted on another platform
+        self.sleep(0.01)
+        self.assertEqual(self.twitch.sent, [])
+        self.engine.on_message(common.TWITCH)
+        self.sleep(0.01)
+        self.assertEqual(self.twitch.sent, ["twitch"])
+
+    def test_waits_for_the_delay(self):
+        self.engine.add(Timer(delay=0.1, minlines=1))
+        for _ in range(5):
+            self.engine.on_message(common.TWITCH)
+
+        self.sleep(0.05)
+        self.assertEqual(self.twitch.sent, [])
+        self.sleep(0.1)
+        self.assertEqual(self.twitch.sent, ["twitch"]) # once, the lines were all used up by it
+        self.sleep(0.15)
+        self.assertEqual(len(self.twitch.sent), 1)
+
+    def test_shared_lines(self):
+        self.engine.add(Timer(delay=0.01, minlines=2, place=2, shared=True))
+        self.sleep(0.05)
+        self.engine.on_message(common.TWITCH)
+        self.engine.on_message(common.DISCORD)
+        self.sleep(0.01)
+        self.assertEqual((self.twitch.sent, self.discord.sent), (["twitch"], ["discord"]))
+
+    def test_remove(self):
+        timer = Timer(delay=0.02, minlines=0)
+        self.engine.add(timer)
+        self.engine.remove(timer)
+        self.sleep(0.1)
+        self.assertEqual(self.twitch.sent, [])
+        self.assertTrue(self.engine._task.done()) # nothing left to run
@@ -0,0 +1,63 @@
+import asyncio
+import time
+from unittest import TestCase
+
+from utils.scheduler import TimerScheduler
+
+
+class TimerSchedulerTest(TestCase):
+    def setUp(self):
+        # the wakeup event belongs to the loop that is current when it is made
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.scheduler = TimerScheduler()
+
+    def tearDown(self):
+        asyncio.set_event_loop(None)
+        self.loop.close()
+
+    def wait(self, timeout=1):
+        return self.loop.run_until_complete(asyncio.wait_for(self.scheduler.wait(), timeout))
+
+    def test_due_timers_in_order(self):
+        now = time.time()
+        self.scheduler.add(2, now - 1, "unmute", {"userid": 2})
+        self.scheduler.add(1, now - 2, "unban", {"userid": 1})
+        self.scheduler.add(3, now + 60, "unmute", {"userid": 3})
+        self.assertEqual([timer["id"] for timer in self.wait()], [1, 2])
+        self.assertEqual(len(self.scheduler), 1)
+        self.assertIn(3, self.scheduler)
+
+    def test_wakes_early(self):
+        self.scheduler.add(1, time.time() + 60, "unmute", {})
+
+        async def run():
+            waiter = asyncio.ensure_future(self.scheduler.wait())
+            await asyncio.sleep(0.01)
+            self.scheduler.add(2, time.time() + 0.05, "unmute", {}) # earlier than the one being slept on
+            return await asyncio.wait_for(waiter, 1)
+
+        start = time.monotonic()
+        self.assertEqual([timer["id"] for timer in self.loop.run_until_complete(run())], [2])
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test_cancel(self):
+        now = time.time()
+        self.scheduler.add(1, now - 1, "unmute", {"userid": 5})
+        self.scheduler.add(2, now - 1, "unban", {"userid": 5})
+        self.assertEqual([timer["id"] for timer in self.scheduler.find("unmute", userid=5)], [1])
+        self.assertEqual(self.scheduler.cancel(1)["event"], "unmute")
+        self.assertIsNone(self.scheduler.cancel(1))
+        self.assertEqual(self.scheduler.find("unmute", userid=5), [])
+        self.assertEqual([timer["id"] for timer in self.wait()], [2])
+
+    def test_cancelled_entries_are_compacted(self):
+        now = time.time()
+        for id in range(200):
+            self.scheduler.add(id, now + 60 + id, "unmute", {})
+
+        for id in range(150):
+            self.scheduler.cancel(id)
+
+        self.assertLessEqual(len(self.scheduler._heap), 2 * len(self.scheduler))
+        self.assertEqual(len(self.scheduler), 50)